@@ -0,0 +1,137 @@
+import copy
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+from .serializer import default_serializer
+
+# The text field of each artifact type that is diffed
+TEXT_FIELDS = {"code": "code", "document": "content"}
+
+# Replace the lines [start, end) of the base version with the text
+Op = Tuple[int, int, str]
+
+
+class ArtifactDeltaEncoder:
+    """
+    Send revisions of an artifact as line-level diffs against the previous version.
+
+    The first version of an artifact is sent as a regular `artifact` part (a snapshot), with the
+    artifact id and version added to the artifact. Later versions are sent as `artifact_delta` parts:
+
+        {"type": "artifact_delta", "data": {"id": ..., "base": 0, "version": 1, "field": "code",
+         "ops": [[start, end, text], ...], "artifact": <the artifact without the text field>}}
+
+    A delta that isn't smaller than the snapshot is sent as a snapshot instead.
+    An artifact is identified by the id of its part, or by its file name or title.
+    The encoder keeps the last version of each artifact, so use one encoder per stream.
+
+    Args:
+        max_artifacts: Number of artifacts whose last version is kept, the least recently used are dropped.
+    """
+
+    def __init__(self, max_artifacts: int = 32):
+        self.max_artifacts = max_artifacts
+        self.snapshots = 0
+        self.deltas = 0
+        self._versions: "OrderedDict[str, Tuple[int, List[str]]]" = OrderedDict()
+
+    def encode(self, part: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn an artifact part into a snapshot or delta part, other parts are returned unchanged"""
+        artifact = part.get("data")
+        if part.get("type") != "artifact" or not isinstance(artifact, dict):
+            return part
+        field = TEXT_FIELDS.get(artifact.get("type"))
+        content = artifact.get("data")
+        if field is None or not isinstance(content, dict) or not isinstance(content.get(field), str):
+            return part
+        artifact_id = self._artifact_id(part, artifact)
+        if artifact_id is None:
+            return part
+
+        lines = content[field].splitlines(keepends=True)
+        previous = self._versions.get(artifact_id)
+        version = previous[0] + 1 if previous is not None else 0
+        self._versions[artifact_id] = (version, lines)
+        self._versions.move_to_end(artifact_id)
+        while len(self._versions) > self.max_artifacts:
+            self._versions.popitem(last=False)
+
+        if previous is not None:
+            ops = diff_lines(previous[1], lines)
+            # Only send the delta if it's smaller than the snapshot
+            if len(default_serializer.dumps(ops)) < len(default_serializer.dumps(content[field])):
+                self.deltas += 1
+                rest = {**artifact, "data": {k: v for k, v in content.items() if k != field}}
+                return {
+                    "type": "artifact_delta",
+                    "data": {
+                        "id": artifact_id,
+                        "base": previous[0],
+                        "version": version,
+                        "field": field,
+                        "ops": ops,
+                        "artifact": rest,
+                    },
+                }
+        self.snapshots += 1
+        return {**part, "data": {**artifact, "id": artifact_id, "version": version}}
+
+    @staticmethod
+    def _artifact_id(part: Dict[str, Any], artifact: Dict[str, Any]) -> Optional[str]:
+        if part.get("id"):
+            return str(part["id"])
+        content = artifact["data"]
+        name = content.get("file_name") or content.get("title")
+        return f"{artifact['type']}:{name}" if name else None
+
+
+def diff_lines(base: List[str], lines: List[str]) -> List[Op]:
+    """The line operations that turn `base` into `lines`"""
+    # Skip the common prefix and suffix, edits of code are often local
+    prefix = 0
+    limit = min(len(base), len(lines))
+    while prefix < limit and base[prefix] == lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and base[-1 - suffix] == lines[-1 - suffix]:
+        suffix += 1
+    matcher = SequenceMatcher(None, base[prefix : len(base) - suffix], lines[prefix : len(lines) - suffix])
+    return [
+        (prefix + i1, prefix + i2, "".join(lines[prefix + j1 : prefix + j2]))
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+class ArtifactDeltaDecoder:
+    """Rebuild the artifacts from snapshot and delta parts, the client side of `ArtifactDeltaEncoder`"""
+
+    def __init__(self):
+        self._versions: Dict[str, Tuple[int, List[str]]] = {}
+
+    def decode(self, part: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the complete artifact of a snapshot or delta part"""
+        if part["type"] == "artifact":
+            artifact = part["data"]
+            if "version" in artifact:
+                field = TEXT_FIELDS[artifact["type"]]
+                lines = artifact["data"][field].splitlines(keepends=True)
+                self._versions[artifact["id"]] = (artifact["version"], lines)
+            return artifact
+
+        delta = part["data"]
+        base_version, lines = self._versions[delta["id"]]
+        if base_version != delta["base"]:
+            raise ValueError(
+                f"Delta of artifact {delta['id']} is based on version {delta['base']}, have {base_version}"
+            )
+        lines = list(lines)
+        # Apply from the end, so the line numbers of the earlier operations stay valid
+        for start, end, text in reversed(delta["ops"]):
+            lines[start:end] = text.splitlines(keepends=True)
+        self._versions[delta["id"]] = (delta["version"], lines)
+        artifact = copy.deepcopy(delta["artifact"])
+        artifact["data"][delta["field"]] = "".join(lines)
+        artifact["id"], artifact["version"] = delta["id"], delta["version"]
+        return artifact
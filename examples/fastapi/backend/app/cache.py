@@ -0,0 +1,92 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+
+from .encoder import encode_data, escape
+from .tokens import iter_tokens
+
+CachedValue = Union[bytes, Tuple[bytes, ...]]
+
+
+class PartCache:
+    """
+    LRU cache of pre-serialized parts, keyed by the content of the part.
+    Text parts are stored as their escaped tokens (the message id of the frames is
+    generated per stream), data parts as the complete `data-*` frame.
+    Data parts are hashed once per object, so don't mutate a part after streaming it.
+
+    Args:
+        max_bytes: Maximum total size of the cached frames, least recently used entries are evicted first.
+        ttl: Time to live of an entry in seconds, 0 disables expiry.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, CachedValue]]" = OrderedDict()
+        # Content hashes of data parts by identity, so constant parts are only hashed once
+        self._fingerprints: Dict[int, Tuple[Dict[str, Any], str]] = {}
+
+    def text(self, content: str) -> Tuple[bytes, ...]:
+        """The escaped tokens of a text part"""
+        # A str caches its hash, so the text itself is a cheap content key
+        return self._get(("text", content), lambda: tuple(escape(t) for t in iter_tokens(content)))
+
+    def data(self, data: Dict[str, Any]) -> bytes:
+        """The encoded frame of a data part"""
+        return self._get(("data", self._fingerprint(data)), lambda: encode_data(data))
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.size,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._fingerprints.clear()
+        self.size = 0
+
+    def _get(self, key: Hashable, encode: Callable[[], CachedValue]) -> CachedValue:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, _, value = entry
+            if not self.ttl or expires_at > now:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            self._remove(key)
+
+        self.misses += 1
+        value = encode()
+        size = len(value) if isinstance(value, bytes) else sum(map(len, value))
+        if size <= self.max_bytes:
+            self._entries[key] = (now + self.ttl, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return value
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def _fingerprint(self, data: Dict[str, Any]) -> str:
+        # Keep a reference to the part, so its id can't be reused while it's in here
+        known = self._fingerprints.get(id(data))
+        if known is not None and known[0] is data:
+            return known[1]
+        fingerprint = hashlib.blake2b(repr(data).encode(), digest_size=16).hexdigest()
+        if len(self._fingerprints) >= 1024:
+            self._fingerprints.clear()
+        self._fingerprints[id(data)] = (data, fingerprint)
+        return fingerprint
@@ -1,24 +1,43 @@
-from fastapi import APIRouter, Request
+import os
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
+from .cache import PartCache
+from .compression import CompressionPolicy, estimate_size
+from .flush import FlushPolicy
+from .metrics import StreamMetrics
+from .request import RequestLimits, parse_last_message, read_body
+from .resume import InMemoryReplayStore, ReplayStoreFull, parse_event_id
 from .vercel import SSEStreamResponse, get_text
 
 router = APIRouter(prefix="/chat")
 
-
-@router.post("/")
-async def chat(request: Request) -> StreamingResponse:
-    data = await request.json()
-    messages = data.get("messages", [])
-    last_message = messages[-1] if messages else {}
-    content = get_text(last_message)
+# Pacing and coalescing of the stream, configurable with SSE_* environment variables
+flush_policy = FlushPolicy.from_env()
+# Pre-serialized frames of the constant parts
+part_cache = PartCache()
+# Limits of the chat requests, configurable with CHAT_* environment variables
+request_limits = RequestLimits.from_env()
+# Opt-in gzip/brotli compression of the streams, configurable with SSE_COMPRESSION* environment variables
+compression_policy = CompressionPolicy.from_env()
+# Keep the recent frames of each stream, so clients can resume with the Last-Event-ID header
+replay_store = (
+    InMemoryReplayStore() if os.getenv("SSE_RESUMABLE", "false").lower() == "true" else None
+)
+# Send revisions of an artifact as line diffs, for clients that apply `artifact_delta` parts
+artifact_deltas = os.getenv("SSE_ARTIFACT_DELTAS", "false").lower() == "true"
+# Timings of the streams, exposed on /metrics if SSE_METRICS=true
+stream_metrics = StreamMetrics() if os.getenv("SSE_METRICS", "false").lower() == "true" else None
+
+
+# Advanced sample parts matching the Next.js advanced route
+# The parts are constant, so they are built once and their frames are served from the part cache
+SAMPLE_PARTS = [
+    "Welcome to the demo of @llamaindex/chat-ui. Let me show you the different types of components that can be triggered from the server.",
     
-    query_text = f'User query: "{content}".\n'
-    
-    # Advanced sample parts matching the Next.js advanced route
-    sample_parts = [
-        "Welcome to the demo of @llamaindex/chat-ui. Let me show you the different types of components that can be triggered from the server.",
-        
-        """
+    """
 ### Text Part
 Text part is used to display text in the chat. It is in markdown format.
 You can use markdown syntax to format the text. Some examples:
@@ -36,7 +55,7 @@ const c = a + b
 console.log(c)
 ```""",
 
-        """
+    """
 ### Parts
 
 Beside text, you can also display parts in the chat. Parts can be displayed before or after the text.
@@ -59,44 +78,31 @@ You can also create your own custom parts.
 - **wiki** -> display a wiki card
 """,
 
-        "**file**: Here is the demo of a file part",
-        {
-            "type": "file",
-            "data": {
-                "filename": "upload.pdf",
-                "mediaType": "application/pdf",
-                "url": "https://pdfobject.com/pdf/sample.pdf"
-            }
-        },
-
-        "**event**: Here is the demo of event parts. The second event part will override the first one because they have the same id",
-        {
-            "id": "demo_sample_event_id",
-            "type": "event",
-            "data": {
-                "title": "Calling tool `get_weather` with input `San Francisco, CA`",
-                "status": "pending"
-            }
-        },
-        {
-            "id": "demo_sample_event_id",  # Same id to override previous part
-            "type": "event",
-            "data": {
-                "title": "Got response from tool `get_weather` with input `San Francisco, CA`",
-                "status": "success",
-                "data": {
-                    "location": "San Francisco, CA",
-                    "temperature": 22,
-                    "condition": "sunny",
-                    "humidity": 65,
-                    "windSpeed": 12
-                }
-            }
-        },
-
-        "**weather**: Here is the demo of a weather part. It is a custom part",
-        {
-            "type": "weather",
+    "**file**: Here is the demo of a file part",
+    {
+        "type": "file",
+        "data": {
+            "filename": "upload.pdf",
+            "mediaType": "application/pdf",
+            "url": "https://pdfobject.com/pdf/sample.pdf"
+        }
+    },
+
+    "**event**: Here is the demo of event parts. The second event part will override the first one because they have the same id",
+    {
+        "id": "demo_sample_event_id",
+        "type": "event",
+        "data": {
+            "title": "Calling tool `get_weather` with input `San Francisco, CA`",
+            "status": "pending"
+        }
+    },
+    {
+        "id": "demo_sample_event_id",  # Same id to override previous part
+        "type": "event",
+        "data": {
+            "title": "Got response from tool `get_weather` with input `San Francisco, CA`",
+            "status": "success",
             "data": {
                 "location": "San Francisco, CA",
                 "temperature": 22,
@@ -104,53 +110,135 @@ You can also create your own custom parts.
                 "humidity": 65,
                 "windSpeed": 12
             }
-        },
-
-        "**wiki**: Here is the demo of a wiki part",
-        {
-            "type": "wiki",
-            "data": {
-                "title": "LlamaIndex",
-                "summary": "LlamaIndex is a framework for building AI applications.",
-                "url": "https://www.llamaindex.ai",
-                "category": "AI",
-                "lastUpdated": "2025-06-02"
-            }
-        },
-
-        "**artifact**: Here is the demo of a artifact part",
-        {
-            "type": "artifact",
-            "data": {
-                "type": "code",
-                "data": {
-                    "file_name": "code.py",
-                    "code": 'print("Hello, world!")',
-                    "language": "python"
-                }
-            }
-        },
+        }
+    },
+
+    "**weather**: Here is the demo of a weather part. It is a custom part",
+    {
+        "type": "weather",
+        "data": {
+            "location": "San Francisco, CA",
+            "temperature": 22,
+            "condition": "sunny",
+            "humidity": 65,
+            "windSpeed": 12
+        }
+    },
+
+    "**wiki**: Here is the demo of a wiki part",
+    {
+        "type": "wiki",
+        "data": {
+            "title": "LlamaIndex",
+            "summary": "LlamaIndex is a framework for building AI applications.",
+            "url": "https://www.llamaindex.ai",
+            "category": "AI",
+            "lastUpdated": "2025-06-02"
+        }
+    },
 
-        "**sources**: Here is the demo of a sources part",
-        {
-            "type": "sources",
+    "**artifact**: Here is the demo of a artifact part",
+    {
+        "type": "artifact",
+        "data": {
+            "type": "code",
             "data": {
-                "nodes": [
-                    {"id": "1", "url": "/sample.pdf"},
-                    {"id": "2", "url": "/sample.pdf"}
-                ]
+                "file_name": "code.py",
+                "code": 'print("Hello, world!")',
+                "language": "python"
             }
-        },
-
-        "**suggested_questions**: Here is the demo of a suggested_questions part",
-        {
-            "type": "suggested_questions",
-            "data": [
-                "I think you should go to the beach",
-                "I think you should go to the mountains",
-                "I think you should go to the city"
+        }
+    },
+
+    "**sources**: Here is the demo of a sources part",
+    {
+        "type": "sources",
+        "data": {
+            "nodes": [
+                {"id": "1", "url": "/sample.pdf"},
+                {"id": "2", "url": "/sample.pdf"}
             ]
         }
-    ]
+    },
+
+    "**suggested_questions**: Here is the demo of a suggested_questions part",
+    {
+        "type": "suggested_questions",
+        "data": [
+            "I think you should go to the beach",
+            "I think you should go to the mountains",
+            "I think you should go to the city"
+        ]
+    }
+]
+SAMPLE_PARTS_SIZE = estimate_size(SAMPLE_PARTS)
+
+
+@router.post("/")
+async def chat(request: Request) -> StreamingResponse:
+    # A client reconnecting to a resumable stream gets the rest of it, without re-running the pipeline
+    resumed = await resume_stream(request)
+    if resumed is not None:
+        return resumed
+
+    # Only the last message is used, so don't decode the whole chat history
+    body = await read_body(request, request_limits.max_body_bytes)
+    last_message = parse_last_message(body, request_limits.max_messages, request_limits.scan_threshold_bytes)
+    content = get_text(last_message, max_chars=request_limits.max_text_chars)
+    
+    query_text = f'User query: "{content}".\n'
 
-    return SSEStreamResponse(parts=sample_parts, query=query_text)
+    stream_id = None
+    if replay_store is not None:
+        stream_id = str(uuid.uuid4())
+        try:
+            await replay_store.create(stream_id)
+        except ReplayStoreFull:
+            raise HTTPException(status_code=503, detail="Too many live streams", headers={"Retry-After": "1"})
+
+    return SSEStreamResponse(
+        parts=SAMPLE_PARTS,
+        query=query_text,
+        flush_policy=flush_policy,
+        part_cache=part_cache,
+        replay_store=replay_store,
+        stream_id=stream_id,
+        compressor=compression_policy.negotiate(
+            request.headers.get("accept-encoding"), SAMPLE_PARTS_SIZE
+        ),
+        artifact_deltas=artifact_deltas,
+        metrics=stream_metrics,
+    )
+
+
+@router.get("/{stream_id}/stream")
+async def resume(stream_id: str, request: Request) -> Response:
+    """Resume a stream after the `Last-Event-ID` header, or replay it from the start"""
+    last_event = parse_event_id(request.headers.get("last-event-id"))
+    after = last_event[1] if last_event is not None and last_event[0] == stream_id else -1
+    resumed = await resume_stream(request, stream_id, after)
+    # No content: the stream is unknown or not buffered anymore
+    return resumed if resumed is not None else Response(status_code=204)
+
+
+async def resume_stream(
+    request: Request, stream_id: Optional[str] = None, after: int = -1
+) -> Optional[SSEStreamResponse]:
+    if replay_store is None:
+        return None
+    if stream_id is None:
+        last_event = parse_event_id(request.headers.get("last-event-id"))
+        if last_event is None:
+            return None
+        stream_id, after = last_event
+    # Only resume if all frames after `after` are still buffered
+    if await replay_store.read(stream_id, after, timeout=0) is None:
+        return None
+    return SSEStreamResponse(
+        parts=[],
+        replay_store=replay_store,
+        stream_id=stream_id,
+        resume_after=after,
+        compressor=compression_policy.negotiate(request.headers.get("accept-encoding")),
+        metrics=stream_metrics,
+    )
@@ -0,0 +1,104 @@
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class StreamCompressor:
+    """
+    Compress a stream frame by frame. Every frame is flushed, so the client can decode
+    it right away and streaming latency is unaffected.
+    """
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=level)
+        else:
+            # wbits=31: gzip container
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, frame: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(frame) + self._brotli.flush()
+        return self._zlib.compress(frame) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+@dataclass(frozen=True)
+class CompressionPolicy:
+    """
+    Opt-in compression of the SSE streams.
+
+    Args:
+        enabled: Compress streams for clients that accept gzip or brotli.
+        min_bytes: Streams with less content than this aren't worth the CPU and are sent uncompressed.
+        gzip_level: Compression level of gzip (1-9).
+        brotli_quality: Quality of brotli (0-11), only used if the `brotli` package is installed.
+        preferred: Encoding used if the client accepts both. With a flush after every frame,
+            gzip compresses the sample stream better and with less CPU than brotli.
+    """
+
+    enabled: bool = False
+    min_bytes: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 4
+    preferred: str = "gzip"
+
+    @classmethod
+    def from_env(cls) -> "CompressionPolicy":
+        """
+        Create a policy from the environment variables:
+        SSE_COMPRESSION (true/false), SSE_COMPRESSION_MIN_BYTES and SSE_COMPRESSION_PREFERRED (gzip/br).
+        """
+        default = cls()
+        return cls(
+            enabled=os.getenv("SSE_COMPRESSION", "false").lower() == "true",
+            min_bytes=int(os.getenv("SSE_COMPRESSION_MIN_BYTES", default.min_bytes)),
+            preferred=os.getenv("SSE_COMPRESSION_PREFERRED", default.preferred),
+        )
+
+    def negotiate(
+        self, accept_encoding: Optional[str], size_hint: Optional[int] = None
+    ) -> Optional[StreamCompressor]:
+        """
+        Create a compressor for the best encoding the client accepts, or None to send the stream uncompressed.
+        `size_hint` is the (estimated) size of the content, None if it's unknown, e.g. for an LLM stream.
+        """
+        if not self.enabled or not accept_encoding:
+            return None
+        if size_hint is not None and size_hint < self.min_bytes:
+            return None
+        accepted = _accepted_encodings(accept_encoding)
+        if brotli is None and "br" in accepted:
+            accepted.remove("br")
+        candidates = [encoding for encoding in ("gzip", "br") if encoding in accepted]
+        if not candidates:
+            return None
+        encoding = self.preferred if self.preferred in candidates else candidates[0]
+        level = self.brotli_quality if encoding == "br" else self.gzip_level
+        return StreamCompressor(encoding, level)
+
+
+def estimate_size(parts: Iterable[Any]) -> int:
+    """A lower bound of the size of the frames of the parts"""
+    return sum(len(part) if isinstance(part, str) else len(repr(part)) for part in parts)
+
+
+def _accepted_encodings(accept_encoding: str) -> List[str]:
+    encodings = []
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.append(name.strip().lower())
+    return encodings
@@ -0,0 +1,66 @@
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from typing import Any, Dict
+
+from .serializer import Serializer, default_serializer
+
+DATA_PREFIX = b"data: "
+FRAME_END = b"}\n\n"
+
+
+def quote(text: str) -> bytes:
+    """JSON-encode a string, same output as `json.dumps(text)`"""
+    return encode_basestring_ascii(text).encode("ascii")
+
+
+def escape(text: str) -> bytes:
+    """JSON-escape a string without the surrounding quotes"""
+    return quote(text)[1:-1]
+
+
+class TextFrameEncoder:
+    """
+    Encode the text-start, text-delta and text-end frames of one text message.
+    The constant parts of each frame are encoded once per message id,
+    so a delta only costs escaping its own payload.
+    """
+
+    __slots__ = ("message_id", "_start", "_delta_prefix", "_end")
+
+    def __init__(self, message_id: str):
+        self.message_id = message_id
+        head = DATA_PREFIX + b'{"id": ' + quote(message_id) + b', "type": '
+        self._start = head + b'"text-start"' + FRAME_END
+        self._delta_prefix = head + b'"text-delta", "delta": "'
+        self._end = head + b'"text-end"' + FRAME_END
+
+    def start(self) -> bytes:
+        return self._start
+
+    def delta(self, text: str) -> bytes:
+        return self._delta_prefix + escape(text) + b'"' + FRAME_END
+
+    def delta_escaped(self, escaped: bytes) -> bytes:
+        """Encode a delta whose payload was already escaped with `escape`"""
+        return self._delta_prefix + escaped + b'"' + FRAME_END
+
+    def end(self) -> bytes:
+        return self._end
+
+
+@lru_cache(maxsize=256)
+def _data_prefix(part_type: str) -> bytes:
+    return DATA_PREFIX + b'{"type": ' + quote(f"data-{part_type}") + b', "data": '
+
+
+def encode_data(data: Dict[str, Any], serializer: Serializer = default_serializer) -> bytes:
+    """
+    Encode a data part as a `data-*` frame.
+    With a compatible serializer (the default), the output is identical to `json.dumps`
+    of the chunk dict `{"type": "data-<type>", "data": ..., "id": ...}`.
+    """
+    frame = _data_prefix(data["type"]) + serializer.dumps_part(data["type"], data.get("data", {}))
+    # Only include id if it exists
+    if data.get("id"):
+        frame += b', "id": ' + serializer.dumps(data["id"])
+    return frame + FRAME_END
@@ -0,0 +1,170 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
+
+
+@dataclass(frozen=True)
+class FlushPolicy:
+    """
+    Controls the pacing of the SSE stream and how text deltas are batched into frames.
+
+    Args:
+        token_delay: Delay between tokens, simulating the generation speed of an LLM.
+        part_delay: Delay after sending a data part.
+        max_bytes: Byte budget of a coalesced text-delta frame, 0 disables coalescing.
+        max_delay: Time window in seconds a delta may wait in the buffer before it's flushed.
+            It's longer than the default token delay, so a frame batches consecutive tokens.
+        adaptive: Grow the byte budget for slow consumers and shrink it back for fast ones.
+        max_bytes_limit: Upper bound of the byte budget when adapting.
+        part_window: Time window in seconds a data part with an id is held back, so later updates
+            of the same part replace it instead of being sent as well. 0 disables it.
+    """
+
+    token_delay: float = 0.03  # 30ms delay between tokens
+    part_delay: float = 1.0  # 1s delay between parts
+    max_bytes: int = 0
+    max_delay: float = 0.05
+    adaptive: bool = True
+    max_bytes_limit: int = 64 * 1024
+    part_window: float = 0.0
+
+    @property
+    def coalesce(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def coalesce_parts(self) -> bool:
+        return self.part_window > 0
+
+    @classmethod
+    def from_env(cls) -> "FlushPolicy":
+        """
+        Create a policy from the environment variables:
+        SSE_TOKEN_DELAY and SSE_PART_DELAY (in seconds), SSE_COALESCE_BYTES,
+        SSE_COALESCE_WINDOW_MS, SSE_COALESCE_ADAPTIVE and SSE_PART_COALESCE_WINDOW_MS.
+        """
+        default = cls()
+        return cls(
+            token_delay=float(os.getenv("SSE_TOKEN_DELAY", default.token_delay)),
+            part_delay=float(os.getenv("SSE_PART_DELAY", default.part_delay)),
+            max_bytes=int(os.getenv("SSE_COALESCE_BYTES", default.max_bytes)),
+            max_delay=float(
+                os.getenv("SSE_COALESCE_WINDOW_MS", default.max_delay * 1000)
+            )
+            / 1000,
+            adaptive=os.getenv("SSE_COALESCE_ADAPTIVE", "true").lower() == "true",
+            part_window=float(os.getenv("SSE_PART_COALESCE_WINDOW_MS", 0)) / 1000,
+        )
+
+
+class DeltaCoalescer:
+    """
+    Buffer escaped text deltas of a stream until the byte budget or the time window
+    of the flush policy is reached.
+    Escaped JSON string fragments can be concatenated, so a flush is a plain join.
+    """
+
+    def __init__(self, policy: FlushPolicy):
+        self.policy = policy
+        self.budget = policy.max_bytes
+        self._buffer: List[bytes] = []
+        self._size = 0
+        self._since: Optional[float] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes"""
+        return self._size
+
+    def add(self, escaped: bytes) -> None:
+        if self._since is None:
+            self._since = time.perf_counter()
+        self._buffer.append(escaped)
+        self._size += len(escaped)
+
+    def due(self, next_wait: float = 0.0) -> bool:
+        """Whether the buffer must be flushed before waiting `next_wait` seconds for the next delta"""
+        if self._since is None:
+            return False
+        if self._size >= self.budget:
+            return True
+        waited = time.perf_counter() - self._since + next_wait
+        return waited >= self.policy.max_delay
+
+    def flush(self) -> bytes:
+        payload = b"".join(self._buffer)
+        self._buffer.clear()
+        self._size = 0
+        self._since = None
+        return payload
+
+    def drained(self, seconds: float) -> None:
+        """
+        Record how long the consumer took to take the last frame.
+        Slow consumers get fewer, larger frames; fast consumers go back to low latency.
+        """
+        if not self.policy.adaptive:
+            return
+        if seconds > self.policy.max_delay:
+            self.budget = min(self.budget * 2, self.policy.max_bytes_limit)
+        elif seconds < self.policy.max_delay / 4:
+            self.budget = max(self.budget // 2, self.policy.max_bytes)
+
+
+class PartCoalescer:
+    """
+    Last-write-wins coalescing of data parts with an id.
+    The client only keeps the last version of a part with the same type and id, so a part is held back
+    for the time window of the flush policy and later updates of it replace it in place.
+    Held parts keep the position of their first version and are flushed before any other part.
+    """
+
+    # Flush early if this many different parts are held back
+    max_pending = 64
+
+    def __init__(self, policy: FlushPolicy):
+        self.policy = policy
+        self.superseded = 0
+        self._pending: "OrderedDict[Tuple[Any, Hashable], Dict[str, Any]]" = OrderedDict()
+        self._since: Optional[float] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of held back parts"""
+        return len(self._pending)
+
+    def add(self, part: Union[str, Dict[str, Any]]) -> List[Union[str, Dict[str, Any]]]:
+        """Add a part, returns the parts to send now"""
+        key = self._key(part)
+        if key is None:
+            return self.flush() + [part]
+        if key in self._pending:
+            self._pending[key] = part
+            self.superseded += 1
+            return []
+        if self._since is None:
+            self._since = time.perf_counter()
+        self._pending[key] = part
+        return self.flush() if len(self._pending) >= self.max_pending else []
+
+    def timeout(self) -> Optional[float]:
+        """Seconds until the held back parts must be flushed, None if there are none"""
+        if self._since is None:
+            return None
+        return max(self.policy.part_window - (time.perf_counter() - self._since), 0.0)
+
+    def flush(self) -> List[Union[str, Dict[str, Any]]]:
+        parts = list(self._pending.values())
+        self._pending.clear()
+        self._since = None
+        return parts
+
+    @staticmethod
+    def _key(part: Union[str, Dict[str, Any]]) -> Optional[Tuple[Any, Hashable]]:
+        if isinstance(part, dict):
+            part_id = part.get("id")
+            if part_id and isinstance(part_id, Hashable):
+                return part.get("type"), part_id
+        return None
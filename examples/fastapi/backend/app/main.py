@@ -1,7 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from app.chat import router as chat_router
+from app.chat import stream_metrics
 
 app = FastAPI()
 
@@ -15,3 +17,11 @@ app.add_middleware(
 
 
 app.include_router(chat_router, prefix="/api")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Timings of the SSE streams of this worker in the Prometheus text format"""
+    if stream_metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled, set SSE_METRICS=true")
+    return PlainTextResponse(stream_metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,127 @@
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+# Buckets of the latencies (in seconds) and of the stream sizes (in bytes)
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """A Prometheus histogram"""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum:.9g}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Counter:
+    """A Prometheus counter"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+
+@dataclass
+class StreamTimings:
+    """
+    Where the time of one stream went, recorded by `SSEStreamResponse` if metrics are enabled.
+    Producing a frame is encoding it (including waiting for an async source of parts) plus the pacing
+    sleeps; `scheduling` is how much longer the sleeps took than requested, i.e. the time waiting
+    for the event loop. The gaps between frames are observed as they're sent.
+    """
+
+    started: float = field(default_factory=time.perf_counter)
+    first_frame: Optional[float] = None
+    last_frame: Optional[float] = None
+    produce: float = 0.0
+    sleep: float = 0.0
+    scheduling: float = 0.0
+    send: float = 0.0
+
+    @property
+    def encode(self) -> float:
+        return max(self.produce - self.sleep, 0.0)
+
+    def frame_sent(self, now: float) -> Optional[float]:
+        """Record that a frame was sent, returns the gap since the previous frame"""
+        gap = None if self.last_frame is None else now - self.last_frame
+        if self.first_frame is None:
+            self.first_frame = now
+        self.last_frame = now
+        return gap
+
+
+class StreamMetrics:
+    """
+    Histograms of the SSE streams of this process, rendered in the Prometheus text format.
+    Streams only measure their timings if they get a `StreamMetrics`, so disabled metrics cost nothing.
+    """
+
+    def __init__(self):
+        self.streams = Counter("sse_streams_total", "Finished SSE streams.")
+        self.disconnects = Counter("sse_disconnects_total", "SSE streams cancelled by a client disconnect.")
+        self.frames = Counter("sse_frames_total", "Frames sent on SSE streams.")
+        self.encode = Histogram("sse_stream_encode_seconds", "Time spent encoding the frames of a stream.", TIME_BUCKETS)
+        self.sleep = Histogram("sse_stream_sleep_seconds", "Time a stream slept for pacing.", TIME_BUCKETS)
+        self.scheduling = Histogram(
+            "sse_stream_scheduling_seconds", "Time a stream waited for the event loop beyond its sleeps.", TIME_BUCKETS
+        )
+        self.send = Histogram("sse_stream_send_seconds", "Time spent writing the frames of a stream to the socket.", TIME_BUCKETS)
+        self.first_frame = Histogram(
+            "sse_time_to_first_frame_seconds", "Time from the start of a stream to its first sent frame.", TIME_BUCKETS
+        )
+        self.gaps = Histogram("sse_inter_frame_gap_seconds", "Time between two frames of a stream.", TIME_BUCKETS)
+        self.bytes = Histogram("sse_stream_bytes", "Bytes sent on a stream.", BYTE_BUCKETS)
+
+    def record(self, timings: StreamTimings, frames: int, sent_bytes: int, disconnected: bool) -> None:
+        self.streams.inc()
+        self.frames.inc(frames)
+        if disconnected:
+            self.disconnects.inc()
+        self.encode.observe(timings.encode)
+        self.sleep.observe(timings.sleep)
+        self.scheduling.observe(timings.scheduling)
+        self.send.observe(timings.send)
+        if timings.first_frame is not None:
+            self.first_frame.observe(timings.first_frame - timings.started)
+        self.bytes.observe(sent_bytes)
+
+    def render(self) -> str:
+        metrics = (
+            self.streams, self.disconnects, self.frames, self.encode, self.sleep,
+            self.scheduling, self.send, self.first_frame, self.gaps, self.bytes,
+        )
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
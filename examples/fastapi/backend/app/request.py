@@ -0,0 +1,148 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+from fastapi import HTTPException, Request
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+@dataclass(frozen=True)
+class RequestLimits:
+    """
+    Limits of a chat request.
+
+    Args:
+        max_body_bytes: Maximum size of the request body.
+        max_messages: Maximum number of messages in the chat history.
+        max_text_chars: Maximum length of the text extracted from the last message.
+        scan_threshold_bytes: Bodies larger than this are scanned for the last message instead of
+            being decoded at once, see `parse_last_message`.
+    """
+
+    max_body_bytes: int = 8 * 1024 * 1024
+    max_messages: int = 1000
+    max_text_chars: int = 32 * 1024
+    scan_threshold_bytes: int = 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> "RequestLimits":
+        """
+        Create the limits from the environment variables:
+        CHAT_MAX_BODY_BYTES, CHAT_MAX_MESSAGES, CHAT_MAX_TEXT_CHARS and CHAT_SCAN_THRESHOLD_BYTES.
+        """
+        default = cls()
+        return cls(
+            max_body_bytes=int(os.getenv("CHAT_MAX_BODY_BYTES", default.max_body_bytes)),
+            max_messages=int(os.getenv("CHAT_MAX_MESSAGES", default.max_messages)),
+            max_text_chars=int(os.getenv("CHAT_MAX_TEXT_CHARS", default.max_text_chars)),
+            scan_threshold_bytes=int(os.getenv("CHAT_SCAN_THRESHOLD_BYTES", default.scan_threshold_bytes)),
+        )
+
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """Read the request body chunk by chunk, rejecting it as soon as it's larger than `max_bytes`"""
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail="Request body too large")
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail="Request body too large")
+    return bytes(body)
+
+
+def parse_last_message(body: bytes, max_messages: int, scan_threshold: int = 1024 * 1024) -> Dict[str, Any]:
+    """
+    Get the last message of the `messages` array of a chat request body.
+    Bodies up to `scan_threshold` bytes are decoded with `json.loads`, which is the fastest for them.
+    Larger bodies are decoded one value at a time and every message is dropped as soon as the next one
+    is decoded, so the object tree of the whole chat history is never built. Both reject invalid JSON.
+    Returns an empty dict if there are no messages.
+    """
+    try:
+        doc = body.decode()
+        if len(body) > scan_threshold:
+            return _scan_last_message(doc, max_messages)
+        return _load_last_message(doc, max_messages)
+    except (ValueError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid JSON in request body")
+
+
+def _check_count(count: int, max_messages: int) -> None:
+    if count > max_messages:
+        raise HTTPException(status_code=413, detail="Chat history too long")
+
+
+def _load_last_message(doc: str, max_messages: int) -> Dict[str, Any]:
+    data = json.loads(doc)
+    if not isinstance(data, dict):
+        raise ValueError("The request body isn't a JSON object")
+    messages = data.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return {}
+    _check_count(len(messages), max_messages)
+    return messages[-1] if isinstance(messages[-1], dict) else {}
+
+
+def _scan_last_message(doc: str, max_messages: int) -> Dict[str, Any]:
+    """Walk the top-level object as strictly as `json.loads`, but only keep the last message"""
+
+    def skip(pos: int) -> int:
+        return _WHITESPACE.match(doc, pos).end()
+
+    def each(pos: int, close: str, step: Callable[[int], int]) -> int:
+        # Decode the items of the object or array opened before `pos` with `step`, which returns
+        # the position after the item. Returns the position after `close`.
+        pos = skip(pos)
+        if doc[pos] == close:
+            return pos + 1
+        while True:
+            pos = skip(step(pos))
+            if doc[pos] == close:
+                return pos + 1
+            if doc[pos] != ",":
+                raise ValueError(f"Expected ',' or {close!r} at position {pos}")
+            pos = skip(pos + 1)
+
+    last_message: Any = {}
+
+    def member(pos: int) -> int:
+        nonlocal last_message
+        key, pos = _decoder.raw_decode(doc, pos)
+        if not isinstance(key, str):
+            raise ValueError(f"Expected a key at position {pos}")
+        pos = skip(pos)
+        if doc[pos] != ":":
+            raise ValueError(f"Expected ':' at position {pos}")
+        pos = skip(pos + 1)
+        if key != "messages":
+            # Decode and drop other values
+            return _decoder.raw_decode(doc, pos)[1]
+        # Like json.loads, the last "messages" member wins and a value that isn't an array has no messages
+        last_message = {}
+        if doc[pos] != "[":
+            return _decoder.raw_decode(doc, pos)[1]
+        count = 0
+
+        def message(pos: int) -> int:
+            nonlocal last_message, count
+            count += 1
+            _check_count(count, max_messages)
+            last_message, pos = _decoder.raw_decode(doc, pos)
+            return pos
+
+        return each(pos + 1, "]", message)
+
+    pos = skip(0)
+    if doc[pos] != "{":
+        raise ValueError("The request body isn't a JSON object")
+    pos = each(pos + 1, "}", member)
+    if skip(pos) != len(doc):
+        raise ValueError(f"Extra data at position {pos}")
+    return last_message if isinstance(last_message, dict) else {}
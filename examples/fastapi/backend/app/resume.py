@@ -0,0 +1,183 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Deque, List, Optional, Tuple
+
+Frame = Tuple[int, bytes]
+
+
+class ReplayStoreFull(Exception):
+    """The store can't keep another stream, all its streams are still live"""
+
+
+@dataclass
+class ReplayChunk:
+    """Frames read from a stream, and whether the stream has finished"""
+
+    frames: List[Frame]
+    finished: bool
+
+
+class ReplayStore(ABC):
+    """
+    Backend that keeps the recent frames of each stream, so a client that reconnects
+    with `Last-Event-ID` can resume the stream instead of re-running the pipeline.
+    Frames are numbered per stream, starting at 0.
+    """
+
+    @abstractmethod
+    async def create(self, stream_id: str) -> None:
+        """Create a stream before its first frame. Raises `ReplayStoreFull` if the store can't keep it"""
+
+    @abstractmethod
+    async def append(self, stream_id: str, frame: bytes) -> int:
+        """Add a frame to a stream, creating the stream if needed. Returns the sequence number of the frame"""
+
+    @abstractmethod
+    async def finish(self, stream_id: str) -> None:
+        """Mark a stream as complete"""
+
+    @abstractmethod
+    async def read(self, stream_id: str, after: int, timeout: float) -> Optional[ReplayChunk]:
+        """
+        Read the frames after sequence number `after`, waiting up to `timeout` seconds for new frames.
+        Returns None if the stream is unknown or the frames after `after` aren't buffered anymore.
+        """
+
+    @abstractmethod
+    async def idle_for(self, stream_id: str) -> float:
+        """Seconds since a client last read from the stream"""
+
+
+@dataclass
+class _Stream:
+    frames: Deque[Frame]
+    next_seq: int = 0
+    finished_at: Optional[float] = None
+    last_read: float = field(default_factory=time.monotonic)
+    updated: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class InMemoryReplayStore(ReplayStore):
+    """
+    Keep the frames of each stream in a ring buffer in memory.
+    Resuming only works on the same worker process, use a shared backend for multiple workers.
+
+    Args:
+        max_frames: Number of recent frames kept per stream.
+        max_streams: Number of streams kept. When it's reached, the least recently created finished stream
+            is dropped. Streams that are still producing are never dropped, a new stream is refused
+            with `ReplayStoreFull` instead.
+        ttl: Seconds a finished stream stays available for reconnects.
+    """
+
+    def __init__(self, max_frames: int = 2048, max_streams: int = 1024, ttl: float = 300.0):
+        self.max_frames = max_frames
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self._streams: "OrderedDict[str, _Stream]" = OrderedDict()
+
+    async def create(self, stream_id: str) -> None:
+        if stream_id not in self._streams:
+            self._create(stream_id)
+
+    async def append(self, stream_id: str, frame: bytes) -> int:
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            stream = self._create(stream_id)
+        seq = stream.next_seq
+        stream.frames.append((seq, frame))
+        stream.next_seq += 1
+        self._notify(stream)
+        return seq
+
+    async def finish(self, stream_id: str) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            stream.finished_at = time.monotonic()
+            self._notify(stream)
+
+    async def read(self, stream_id: str, after: int, timeout: float) -> Optional[ReplayChunk]:
+        stream = self._get(stream_id)
+        if stream is None:
+            return None
+        stream.last_read = time.monotonic()
+        oldest = stream.frames[0][0] if stream.frames else stream.next_seq
+        if after + 1 < oldest:
+            return None
+        if after + 1 >= stream.next_seq and stream.finished_at is None:
+            updated = stream.updated
+            try:
+                await asyncio.wait_for(updated.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            oldest = stream.frames[0][0] if stream.frames else stream.next_seq
+            if after + 1 < oldest:
+                return None
+        frames = list(islice(stream.frames, max(after + 1 - oldest, 0), None))
+        return ReplayChunk(frames=frames, finished=stream.finished_at is not None)
+
+    async def idle_for(self, stream_id: str) -> float:
+        stream = self._streams.get(stream_id)
+        return time.monotonic() - stream.last_read if stream is not None else float("inf")
+
+    def _create(self, stream_id: str) -> _Stream:
+        if len(self._streams) >= self.max_streams:
+            self._evict()
+        stream = _Stream(frames=deque(maxlen=self.max_frames))
+        self._streams[stream_id] = stream
+        return stream
+
+    def _evict(self) -> None:
+        """Drop the expired streams, or else the least recently created finished stream"""
+        now = time.monotonic()
+        expired = [
+            stream_id
+            for stream_id, stream in self._streams.items()
+            if stream.finished_at is not None and now - stream.finished_at > self.ttl
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+        if len(self._streams) < self.max_streams:
+            return
+        # A live stream is never dropped, its next frame would restart at sequence number 0
+        finished = next(
+            (stream_id for stream_id, stream in self._streams.items() if stream.finished_at is not None), None
+        )
+        if finished is None:
+            raise ReplayStoreFull(f"All {len(self._streams)} streams are live")
+        del self._streams[finished]
+
+    def _get(self, stream_id: str) -> Optional[_Stream]:
+        stream = self._streams.get(stream_id)
+        if (
+            stream is not None
+            and stream.finished_at is not None
+            and time.monotonic() - stream.finished_at > self.ttl
+        ):
+            del self._streams[stream_id]
+            return None
+        return stream
+
+    @staticmethod
+    def _notify(stream: _Stream) -> None:
+        # Wake up all readers waiting for this update, later readers wait for the next one
+        stream.updated.set()
+        stream.updated = asyncio.Event()
+
+
+def format_event_id(stream_id: str, seq: int) -> str:
+    return f"{stream_id}:{seq}"
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Parse a `Last-Event-ID` header into the stream id and the sequence number of the last received frame"""
+    if not event_id:
+        return None
+    stream_id, _, seq = event_id.strip().rpartition(":")
+    if not stream_id or not seq.lstrip("-").isdigit():
+        return None
+    return stream_id, int(seq)
@@ -0,0 +1,156 @@
+import json
+import os
+from json.encoder import encode_basestring_ascii as quote
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Same output as `json.dumps` with the default arguments
+_stdlib_encoder = json.JSONEncoder(check_circular=False)
+# Compact output like orjson and msgspec, for the values they can't encode
+_compact_encoder = json.JSONEncoder(check_circular=False, ensure_ascii=False, separators=(",", ":"))
+
+
+def _flat_dict(data: Any) -> Optional[str]:
+    """Encode a dict of strings, ints, bools and None like `json.dumps`, None for any other shape"""
+    if type(data) is not dict:
+        return None
+    items = []
+    for key, value in data.items():
+        kind = type(value)
+        if kind is str:
+            encoded = quote(value)
+        elif kind is int:
+            encoded = int.__repr__(value)
+        elif value is None:
+            encoded = "null"
+        elif kind is bool:
+            encoded = "true" if value else "false"
+        else:
+            return None
+        if type(key) is not str:
+            return None
+        items.append(quote(key) + ": " + encoded)
+    return "{" + ", ".join(items) + "}"
+
+
+def _encode_suggested_questions(data: Any) -> Optional[str]:
+    if type(data) is not list or not all(type(question) is str for question in data):
+        return None
+    return "[" + ", ".join(map(quote, data)) + "]"
+
+
+def _encode_artifact(data: Any) -> Optional[str]:
+    # e.g. {"type": "code", "data": {"file_name": ..., "code": ..., "language": ...}}
+    if type(data) is not dict or list(data) != ["type", "data"] or type(data["type"]) is not str:
+        return None
+    inner = _flat_dict(data["data"])
+    if inner is None:
+        return None
+    return '{"type": ' + quote(data["type"]) + ', "data": ' + inner + "}"
+
+
+# Typed encoders of the known part types, they return None to fall back to the generic encoder.
+# Nested payloads (e.g. the data of `event` or the nodes of `sources`) are faster with the C encoder of the stdlib.
+TYPED_ENCODERS: Dict[str, Callable[[Any], Optional[str]]] = {
+    "file": _flat_dict,
+    "artifact": _encode_artifact,
+    "suggested_questions": _encode_suggested_questions,
+}
+
+
+class Serializer:
+    """
+    Serialize the payload of data parts to JSON bytes.
+
+    Args:
+        backend: `stdlib`, `orjson` or `msgspec`.
+            Only `stdlib` is byte-identical to `json.dumps`, the other backends write compact
+            JSON (no spaces after separators, non-ASCII characters as UTF-8) that decodes to the same value,
+            except NaN and infinity, which they write as null. Values they can't encode (e.g. integers
+            beyond 64 bits) are encoded with the stdlib.
+        typed: Use the typed encoders of the known part types (only for `stdlib`).
+    """
+
+    def __init__(self, backend: str = "stdlib", typed: bool = True):
+        self.backend = backend
+        self.typed = typed and backend == "stdlib"
+        self._dumps = self._create_dumps(backend)
+
+    @property
+    def compatible(self) -> bool:
+        """Whether the output is byte-identical to `json.dumps`"""
+        return self.backend == "stdlib"
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._dumps(obj)
+
+    def dumps_part(self, part_type: str, data: Any) -> bytes:
+        """Serialize the data of a part, with the typed encoder of its type if there is one"""
+        if self.typed:
+            encoder = TYPED_ENCODERS.get(part_type)
+            if encoder is not None:
+                encoded = encoder(data)
+                if encoded is not None:
+                    return encoded.encode("ascii")
+        return self._dumps(data)
+
+    @staticmethod
+    def _create_dumps(backend: str) -> Callable[[Any], bytes]:
+        if backend == "stdlib":
+            return lambda obj: _stdlib_encoder.encode(obj).encode("ascii")
+        if backend == "orjson":
+            if orjson is None:
+                raise ValueError("The orjson backend requires the `orjson` package")
+            # Keys that aren't strings are converted like the stdlib does
+            return _with_fallback(lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS))
+        if backend == "msgspec":
+            if msgspec is None:
+                raise ValueError("The msgspec backend requires the `msgspec` package")
+            return _with_fallback(msgspec.json.Encoder().encode)
+        raise ValueError(f"Unknown JSON backend: {backend}")
+
+
+def _with_fallback(dumps: Callable[[Any], bytes]) -> Callable[[Any], bytes]:
+    def dumps_or_fallback(obj: Any) -> bytes:
+        try:
+            return dumps(obj)
+        except (TypeError, OverflowError):
+            return _compact_encoder.encode(obj).encode()
+
+    return dumps_or_fallback
+
+
+def get_serializer(backend: str = "auto", compact: bool = False) -> Serializer:
+    """
+    Get a serializer. `auto` picks the fastest backend that's allowed:
+    with `compact=False` that's the byte-identical `stdlib` backend with typed encoders,
+    with `compact=True` it's orjson, msgspec or stdlib, depending on what's installed.
+    """
+    if backend != "auto":
+        return Serializer(backend)
+    if compact:
+        available: List[str] = [
+            name for name, module in (("orjson", orjson), ("msgspec", msgspec)) if module is not None
+        ]
+        return Serializer(available[0] if available else "stdlib")
+    return Serializer("stdlib")
+
+
+def serializer_from_env() -> Serializer:
+    """Create a serializer from the environment variables SSE_JSON_BACKEND and SSE_JSON_COMPACT"""
+    return get_serializer(
+        os.getenv("SSE_JSON_BACKEND", "auto"),
+        compact=os.getenv("SSE_JSON_COMPACT", "false").lower() == "true",
+    )
+
+
+default_serializer = serializer_from_env()
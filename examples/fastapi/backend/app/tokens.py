@@ -0,0 +1,16 @@
+import re
+from typing import Iterator
+
+# A token is a word with its trailing whitespace, leading whitespace stays with the first token
+_TOKEN = re.compile(r"\s*\S+\s*|\s+")
+
+
+def iter_tokens(content: str) -> Iterator[str]:
+    """
+    Lazily split text into tokens for streaming.
+    Whitespace and newlines are kept intact, so joining the tokens gives back `content`.
+    Tokens are found one at a time by offset, the cost of the first token doesn't
+    depend on the length of `content`.
+    """
+    for match in _TOKEN.finditer(content):
+        yield match.group()
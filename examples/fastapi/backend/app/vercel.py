@@ -1,12 +1,63 @@
 import asyncio
-import json
+import logging
+import sys
+import time
 import uuid
-from typing import Any, AsyncGenerator, Dict, Union
+from contextlib import aclosing, contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, AsyncIterable, Dict, Iterable, Iterator, Optional, Union
+
+import anyio
 from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .artifacts import ArtifactDeltaEncoder
+from .cache import PartCache
+from .compression import StreamCompressor
+from .encoder import TextFrameEncoder, encode_data, escape
+from .flush import DeltaCoalescer, FlushPolicy, PartCoalescer
+from .metrics import StreamMetrics, StreamTimings
+from .resume import ReplayStore, format_event_id
+from .tokens import iter_tokens
+
+if sys.version_info < (3, 11):
+    from exceptiongroup import BaseExceptionGroup
+
+logger = logging.getLogger("uvicorn")
+
+# Seconds a replayed stream waits for new frames before sending a keep-alive comment
+KEEP_ALIVE_INTERVAL = 15.0
+# Producers of resumable streams that keep running while no client is connected
+_producers: "set[asyncio.Task]" = set()
+
+Part = Union[str, Dict[str, Any]]
+
+
+@contextmanager
+def collapse_excgroups() -> Iterator[None]:
+    """Raise the error of a task group as is instead of in an exception group, like Starlette does"""
+    try:
+        yield
+    except BaseException as exc:
+        while isinstance(exc, BaseExceptionGroup) and len(exc.exceptions) == 1:
+            exc = exc.exceptions[0]
+        raise exc
+
+
+@dataclass
+class StreamStats:
+    """What was sent of a stream, and what wasn't because the client disconnected"""
 
-DATA_PREFIX = "data: "
-TOKEN_DELAY = 0.03  # 30ms delay between tokens
-PART_DELAY = 1.0  # 1s delay between parts
+    frames_sent: int = 0
+    bytes_sent: int = 0
+    parts_sent: int = 0
+    # Parts replaced by a later update with the same id before they were sent
+    parts_superseded: int = 0
+    # Bytes that were encoded but never reached the client
+    bytes_unsent: int = 0
+    # Parts that weren't streamed at all, None if the number of parts is unknown
+    parts_unsent: Optional[int] = None
+    disconnected: bool = False
 
 
 class SSEStreamResponse(StreamingResponse):
@@ -14,73 +65,368 @@ class SSEStreamResponse(StreamingResponse):
     New SSE format compatible with Vercel/AI SDK 5 useChat
     """
 
-    def __init__(self, parts: list[Union[str, Dict[str, Any]]], query: str = "", **kwargs):
-        stream = self._create_stream(query, parts)
+    def __init__(
+        self,
+        parts: Union[Iterable[Part], AsyncIterable[Part]],
+        query: str = "",
+        flush_policy: Optional[FlushPolicy] = None,
+        part_cache: Optional[PartCache] = None,
+        replay_store: Optional[ReplayStore] = None,
+        stream_id: Optional[str] = None,
+        resume_after: Optional[int] = None,
+        idle_timeout: float = 30.0,
+        compressor: Optional[StreamCompressor] = None,
+        artifact_deltas: bool = False,
+        metrics: Optional[StreamMetrics] = None,
+        **kwargs
+    ):
+        """
+        Args:
+            parts: The parts to stream, a list or an async iterable (e.g. the output of an LLM).
+            query: Text streamed before the parts.
+            flush_policy: Pacing and coalescing of the stream.
+            part_cache: Cache of the serialized parts.
+            replay_store: Make the stream resumable: frames get SSE ids and are kept in this store.
+            stream_id: Id of the resumable stream, a new one is generated if not set.
+            resume_after: Resume the stream `stream_id` after this sequence number instead of streaming `parts`.
+            idle_timeout: Seconds a resumable stream keeps producing while no client reads from it.
+            compressor: Compress the frames, negotiated with `CompressionPolicy.negotiate`.
+            artifact_deltas: Send revisions of an artifact as line diffs, see `ArtifactDeltaEncoder`.
+                Requires a client that applies `artifact_delta` parts.
+            metrics: Record the timings of the stream in these metrics.
+        """
+        self.flush_policy = flush_policy or FlushPolicy()
+        self.part_cache = part_cache
+        self.replay_store = replay_store
+        self.stream_id = stream_id
+        self.idle_timeout = idle_timeout
+        self.compressor = compressor
+        self.artifact_deltas = artifact_deltas
+        self.metrics = metrics
+        self.stats = StreamStats()
+        self._timings = StreamTimings() if metrics is not None else None
+        self._parts_total = len(parts) if hasattr(parts, "__len__") else None
+        self._in_flight = 0
+        self._complete = False
+        self._producer: Optional[AsyncGenerator[bytes, None]] = None
+        if replay_store is None:
+            stream = self._create_stream(query, parts)
+        else:
+            # The frames are produced into the store, the response reads them back from there,
+            # so the stream keeps going for a client that reconnects
+            self.stream_id = stream_id or str(uuid.uuid4())
+            if resume_after is None:
+                self._producer = self._create_stream(query, parts)
+            stream = self._replay(-1 if resume_after is None else resume_after)
+        headers = {"Connection": "keep-alive"}
+        if compressor is not None:
+            headers["Content-Encoding"] = compressor.encoding
+            headers["Vary"] = "Accept-Encoding"
         super().__init__(
             stream,
             media_type="text/event-stream",
-            headers={"Connection": "keep-alive"},
+            headers=headers,
             **kwargs
         )
 
-    async def _create_stream(self, query: str, parts: list[Union[str, Dict[str, Any]]]) -> AsyncGenerator[str, None]:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Stream the response while listening for the client to disconnect.
+        On disconnect the stream is cancelled right away, instead of running
+        (and sleeping or waiting for an upstream LLM) until the next failed send.
+        A resumable stream keeps producing into the replay store until it's idle.
+        """
+        if self._producer is not None:
+            task = asyncio.create_task(self._produce(self._producer))
+            _producers.add(task)
+            task.add_done_callback(_producers.discard)
+            self._producer = None
+        try:
+            # An error of the stream (e.g. of the upstream LLM) is raised as is, not in an exception group
+            with collapse_excgroups():
+                async with anyio.create_task_group() as task_group:
+
+                    async def stream() -> None:
+                        await self.stream_response(send)
+                        task_group.cancel_scope.cancel()
+
+                    task_group.start_soon(stream)
+                    await self._listen_for_disconnect(receive)
+                    task_group.cancel_scope.cancel()
+        finally:
+            # Close the generators, this also closes an async iterable of parts (e.g. an LLM stream)
+            await self.body_iterator.aclose()
+            # The producer of a resumable stream keeps going for a reconnecting client
+            if self.stats.disconnected and self.replay_store is None:
+                self._log_disconnect()
+
+        if self.metrics is not None:
+            self.metrics.record(
+                self._timings, self.stats.frames_sent, self.stats.bytes_sent, self.stats.disconnected
+            )
+
+        if self.background is not None and not self.stats.disconnected:
+            await self.background()
+
+    async def stream_response(self, send: Send) -> None:
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            compressor = self.compressor
+            timings = self._timings
+            async for chunk in self.body_iterator:
+                self._in_flight = len(chunk)
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                send_started = time.perf_counter() if timings is not None else 0.0
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if timings is not None:
+                    self._frame_sent(send_started)
+                self._in_flight = 0
+                self.stats.frames_sent += 1
+                self.stats.bytes_sent += len(chunk)
+            tail = compressor.finish() if compressor is not None else b""
+            await send({"type": "http.response.body", "body": tail, "more_body": False})
+            self._complete = True
+        except OSError:
+            # ASGI 2.4 servers raise on sending to a disconnected client
+            self.stats.disconnected = True
+
+    def _frame_sent(self, send_started: float) -> None:
+        now = time.perf_counter()
+        self._timings.send += now - send_started
+        gap = self._timings.frame_sent(now)
+        if gap is not None:
+            self.metrics.gaps.observe(gap)
+
+    async def _sleep(self, delay: float) -> None:
+        """Sleep for pacing, recording how long it took if metrics are enabled"""
+        timings = self._timings
+        if timings is None:
+            await asyncio.sleep(delay)
+            return
+        start = time.perf_counter()
+        await asyncio.sleep(delay)
+        elapsed = time.perf_counter() - start
+        timings.sleep += elapsed
+        timings.scheduling += max(elapsed - delay, 0.0)
+
+    async def _listen_for_disconnect(self, receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                # A disconnect after the complete response was sent (e.g. by the test client) didn't cancel anything
+                self.stats.disconnected = not self._complete
+                return
+
+    async def _produce(self, frames: AsyncGenerator[bytes, None]) -> None:
+        store, stream_id = self.replay_store, self.stream_id
+        try:
+            async with aclosing(frames):
+                async for frame in frames:
+                    await store.append(stream_id, frame)
+                    if await store.idle_for(stream_id) > self.idle_timeout:
+                        logger.debug(f"No client read stream {stream_id} for {self.idle_timeout}s")
+                        self.stats.disconnected = True
+                        self._log_disconnect()
+                        break
+        finally:
+            await store.finish(stream_id)
+
+    async def _replay(self, after: int) -> AsyncGenerator[bytes, None]:
+        """Read the frames of the stream after sequence number `after` from the replay store and add their SSE ids"""
+        store, stream_id = self.replay_store, self.stream_id
+        while True:
+            chunk = await store.read(stream_id, after, timeout=KEEP_ALIVE_INTERVAL)
+            if chunk is None:
+                # The frames after `after` aren't available anymore
+                return
+            for seq, frame in chunk.frames:
+                yield b"id: " + format_event_id(stream_id, seq).encode() + b"\n" + frame
+                after = seq
+            if not chunk.frames:
+                if chunk.finished:
+                    return
+                yield b": keep-alive\n\n"
+
+    def _log_disconnect(self) -> None:
+        self.stats.bytes_unsent += self._in_flight
+        if self._parts_total is not None:
+            self.stats.parts_unsent = (
+                self._parts_total - self.stats.parts_sent - self.stats.parts_superseded
+            )
+        logger.debug(
+            f"Client disconnected, cancelled the stream after {self.stats.bytes_sent} bytes. "
+            f"Unsent: {self.stats.bytes_unsent} bytes, {self.stats.parts_unsent} parts"
+        )
+
+    async def _create_stream(
+        self, query: str, parts: Union[Iterable[Part], AsyncIterable[Part]]
+    ) -> AsyncGenerator[bytes, None]:
         """Create SSE stream with new format"""
+        coalescer = DeltaCoalescer(self.flush_policy) if self.flush_policy.coalesce else None
 
-        async def write_text(content: str) -> AsyncGenerator[str, None]:
+        timings = self._timings
+        requested_at: Optional[float] = time.perf_counter() if timings is not None else None
+        try:
+            async with aclosing(self._write_parts(query, parts, coalescer)) as chunks:
+                async for chunk in chunks:
+                    if timings is None and coalescer is None:
+                        # Nothing to measure, don't read the clock
+                        yield chunk
+                        continue
+                    yielded_at = time.perf_counter()
+                    if timings is not None:
+                        timings.produce += yielded_at - requested_at
+                    requested_at = None
+                    yield chunk
+                    requested_at = time.perf_counter()
+                    if coalescer is not None:
+                        # The stream is resumed once the chunk was sent, so this is how fast the client drains
+                        coalescer.drained(requested_at - yielded_at)
+        finally:
+            if coalescer is not None:
+                self.stats.bytes_unsent += coalescer.pending
+            if timings is not None and requested_at is not None:
+                # The time after the last frame, e.g. the last pacing sleep
+                timings.produce += time.perf_counter() - requested_at
+
+    async def _write_parts(
+        self,
+        query: str,
+        parts: Union[Iterable[Part], AsyncIterable[Part]],
+        coalescer: Optional[DeltaCoalescer],
+    ) -> AsyncGenerator[bytes, None]:
+        policy = self.flush_policy
+
+        cache = self.part_cache
+
+        async def write_text(content: str, cacheable: bool = True) -> AsyncGenerator[bytes, None]:
             """Write text content with token-by-token streaming"""
             # Generate unique message id
-            message_id = str(uuid.uuid4())
+            encoder = TextFrameEncoder(str(uuid.uuid4()))
 
             # Start text chunk
-            start_chunk = {"id": message_id, "type": "text-start"}
-            yield f"{DATA_PREFIX}{json.dumps(start_chunk)}\n\n"
-
-            # Stream tokens
-            for token in content.split(' '):
-                if token:  # Skip empty tokens
-                    delta_chunk = {
-                        "id": message_id,
-                        "type": "text-delta",
-                        "delta": token + " "
-                    }
-                    yield f"{DATA_PREFIX}{json.dumps(delta_chunk)}\n\n"
-                    await asyncio.sleep(TOKEN_DELAY)
+            yield encoder.start()
+
+            # Stream tokens, escaped tokens of constant parts are replayed from the cache
+            if cache is not None and cacheable:
+                tokens = cache.text(content)
+            else:
+                tokens = (escape(token) for token in iter_tokens(content))
+            for token in tokens:
+                if coalescer is None:
+                    yield encoder.delta_escaped(token)
+                else:
+                    coalescer.add(token)
+                    if coalescer.due(next_wait=policy.token_delay):
+                        yield encoder.delta_escaped(coalescer.flush())
+                await self._sleep(policy.token_delay)
+
+            if coalescer is not None and coalescer.due(next_wait=float("inf")):
+                yield encoder.delta_escaped(coalescer.flush())
 
             # End text chunk
-            end_chunk = {"id": message_id, "type": "text-end"}
-            yield f"{DATA_PREFIX}{json.dumps(end_chunk)}\n\n"
+            yield encoder.end()
+
+        artifacts = ArtifactDeltaEncoder() if self.artifact_deltas else None
 
-        async def write_data(data: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        async def write_data(data: Dict[str, Any]) -> AsyncGenerator[bytes, None]:
             """Write data part"""
-            chunk = {
-                "type": f"data-{data['type']}",  # Add data- prefix
-                "data": data.get("data", {})
-            }
-            
-            # Only include id if it exists
-            if data.get("id"):
-                chunk["id"] = data["id"]
-                
-            yield f"{DATA_PREFIX}{json.dumps(chunk)}\n\n"
-            await asyncio.sleep(PART_DELAY)
-
-        # Stream the query first
+            if artifacts is not None and data.get("type") == "artifact":
+                # Snapshots and deltas depend on the previous versions in this stream, so they aren't cached
+                yield encode_data(artifacts.encode(data))
+            else:
+                yield encode_data(data) if cache is None else cache.data(data)
+            await self._sleep(policy.part_delay)
+
+        # Stream the query first, it's dynamic so it isn't cached
         if query:
-            async for chunk in write_text(query):
+            async for chunk in write_text(query, cacheable=False):
                 yield chunk
 
+        async def iter_parts() -> AsyncGenerator[Part, None]:
+            if isinstance(parts, AsyncIterable):
+                async for item in parts:
+                    yield item
+            else:
+                for item in parts:
+                    yield item
+
+        async def coalesce_parts(
+            items: AsyncGenerator[Part, None], coalescer: PartCoalescer
+        ) -> AsyncGenerator[Part, None]:
+            """Drop data parts that are superseded by an update with the same id within the time window"""
+            next_item: Optional[asyncio.Future] = None
+            try:
+                while True:
+                    timeout = coalescer.timeout()
+                    if timeout is not None:
+                        # Wait for the next part, but no longer than the held back parts may wait
+                        if next_item is None:
+                            next_item = asyncio.ensure_future(items.__anext__())
+                        await asyncio.wait({next_item}, timeout=timeout)
+                        if not next_item.done():
+                            for part in coalescer.flush():
+                                yield part
+                            continue
+                    try:
+                        item = await (next_item or items.__anext__())
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_item = None
+                    for part in coalescer.add(item):
+                        yield part
+                for part in coalescer.flush():
+                    yield part
+            finally:
+                self.stats.parts_superseded = coalescer.superseded
+                if next_item is not None:
+                    # The generator of the parts can only be closed once it's not running anymore
+                    next_item.cancel()
+                    try:
+                        await next_item
+                    except (asyncio.CancelledError, StopAsyncIteration):
+                        pass
+                await items.aclose()
+
+        def part_source() -> AsyncGenerator[Part, None]:
+            if not policy.coalesce_parts:
+                return iter_parts()
+            return coalesce_parts(iter_parts(), PartCoalescer(policy))
+
         # Stream all parts
-        for item in parts:
-            if isinstance(item, str):
-                async for chunk in write_text(item):
-                    yield chunk
-            elif isinstance(item, dict):
-                async for chunk in write_data(item):
-                    yield chunk
+        try:
+            async with aclosing(part_source()) as items:
+                async for item in items:
+                    if isinstance(item, str):
+                        async for chunk in write_text(item):
+                            yield chunk
+                    elif isinstance(item, dict):
+                        async for chunk in write_data(item):
+                            yield chunk
+                    self.stats.parts_sent += 1
+        finally:
+            # Stop the upstream producer of the parts (e.g. an LLM call) if it's still running
+            if hasattr(parts, "aclose"):
+                await parts.aclose()
+
 
-def get_text(message: Any) -> str:
-    return "\n\n".join(
-        part["text"]
-        for part in message["parts"]
-        if part.get("type") == "text" and "text" in part
-    )
\ No newline at end of file
+def get_text(message: Any, max_chars: Optional[int] = None) -> str:
+    """Join the text parts of a message, stopping once `max_chars` characters are collected"""
+    texts = []
+    size = 0
+    for part in message.get("parts", []):
+        if part.get("type") == "text" and "text" in part:
+            texts.append(part["text"])
+            size += len(part["text"]) + 2
+            if max_chars is not None and size >= max_chars:
+                break
+    text = "\n\n".join(texts)
+    return text if max_chars is None else text[:max_chars]
@@ -0,0 +1,2 @@
+# Benchmarks for the FastAPI backend, run them from the `backend` directory, e.g:
+# uv run python -m benchmarks.frames
@@ -0,0 +1,99 @@
+"""
+Benchmark of the artifact delta protocol in `app.artifacts` for iterative edits of a large code file:
+bytes on the wire, server encoding time and client parse time of full snapshots against
+line diffs. Checks that the client rebuilds every version exactly.
+
+Usage: uv run python -m benchmarks.artifacts [--lines 2000] [--revisions 20] [--edits 5]
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from app.artifacts import ArtifactDeltaDecoder, ArtifactDeltaEncoder
+from app.encoder import encode_data
+
+DATA_PREFIX = b"data: "
+
+
+def revisions(lines: int, count: int, edits: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Artifact parts of a code file that gets a few lines changed, inserted or deleted per revision"""
+    rng = random.Random(seed)
+    code = [f"def function_{i}(value):\n    return value * {i}  # line {i}\n" for i in range(lines // 2)]
+    parts = []
+    for version in range(count):
+        for _ in range(edits if version else 0):
+            i = rng.randrange(len(code))
+            action = rng.choice(("change", "insert", "delete"))
+            if action == "change":
+                code[i] = code[i].replace("value *", f"value + {version} *", 1)
+            elif action == "insert":
+                code.insert(i, f"# revision {version}\n")
+            elif len(code) > 1:
+                del code[i]
+        parts.append(
+            {
+                "type": "artifact",
+                "data": {
+                    "type": "code",
+                    "created_at": version,
+                    "data": {"file_name": "app.py", "code": "".join(code), "language": "python"},
+                },
+            }
+        )
+    return parts
+
+
+def parse(frame: bytes) -> Dict[str, Any]:
+    chunk = json.loads(frame[len(DATA_PREFIX) :])
+    return {"type": chunk["type"][len("data-") :], "data": chunk["data"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--revisions", type=int, default=20)
+    parser.add_argument("--edits", type=int, default=5, help="Changed lines per revision")
+    args = parser.parse_args()
+
+    parts = revisions(args.lines, args.revisions, args.edits)
+
+    start = time.perf_counter()
+    snapshot_frames = [encode_data(part) for part in parts]
+    snapshot_encode = time.perf_counter() - start
+
+    encoder = ArtifactDeltaEncoder()
+    start = time.perf_counter()
+    delta_frames = [encode_data(encoder.encode(part)) for part in parts]
+    delta_encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    snapshots = [parse(frame)["data"] for frame in snapshot_frames]
+    snapshot_parse = time.perf_counter() - start
+
+    decoder = ArtifactDeltaDecoder()
+    start = time.perf_counter()
+    rebuilt = [decoder.decode(parse(frame)) for frame in delta_frames]
+    delta_parse = time.perf_counter() - start
+
+    for expected, artifact in zip(snapshots, rebuilt):
+        assert artifact["data"] == expected["data"], "rebuilt artifact differs"
+        assert artifact["created_at"] == expected["created_at"]
+
+    snapshot_bytes = sum(map(len, snapshot_frames))
+    delta_bytes = sum(map(len, delta_frames))
+    print(f"{args.revisions} revisions of a {args.lines}-line file, {args.edits} edits per revision")
+    print(f"deltas: {encoder.deltas}, snapshots: {encoder.snapshots} (all versions rebuilt exactly)\n")
+    print(f"{'':<12} {'bytes':>12} {'encode ms':>12} {'parse ms':>12}")
+    print(f"{'snapshots':<12} {snapshot_bytes:>12,} {snapshot_encode * 1000:>12.2f} {snapshot_parse * 1000:>12.2f}")
+    print(f"{'deltas':<12} {delta_bytes:>12,} {delta_encode * 1000:>12.2f} {delta_parse * 1000:>12.2f}")
+    print(
+        f"{'ratio':<12} {snapshot_bytes / delta_bytes:>11.1f}x "
+        f"{snapshot_encode / delta_encode:>11.2f}x {snapshot_parse / delta_parse:>11.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
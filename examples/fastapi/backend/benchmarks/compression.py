@@ -0,0 +1,65 @@
+"""
+Benchmark of the SSE stream compression for the sample parts in `app.chat`:
+bytes on the wire and CPU time per stream for identity, gzip and brotli (if installed),
+with one flush per frame as used when streaming.
+
+Usage: uv run python -m benchmarks.compression [--coalesce-bytes 1024]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List, Optional
+
+from app.chat import SAMPLE_PARTS
+from app.compression import StreamCompressor, brotli
+from app.flush import FlushPolicy
+from app.vercel import SSEStreamResponse
+
+
+async def collect_frames(coalesce_bytes: int) -> List[bytes]:
+    policy = FlushPolicy(token_delay=0, part_delay=0, max_bytes=coalesce_bytes)
+    response = SSEStreamResponse(
+        parts=SAMPLE_PARTS, query='User query: "Hello".\n', flush_policy=policy
+    )
+    return [frame async for frame in response.body_iterator]
+
+
+def measure(frames: List[bytes], encoding: Optional[str], level: int, repeat: int) -> None:
+    start = time.process_time()
+    for _ in range(repeat):
+        if encoding is None:
+            wire = sum(len(frame) for frame in frames)
+            continue
+        compressor = StreamCompressor(encoding, level)
+        wire = sum(len(compressor.compress(frame)) for frame in frames)
+        wire += len(compressor.finish())
+    cpu = (time.process_time() - start) / repeat
+    raw = sum(len(frame) for frame in frames)
+    label = "identity" if encoding is None else f"{encoding} (level {level})"
+    print(
+        f"{label:<20} {wire:>10,} B {raw / wire:>7.2f}x "
+        f"{cpu * 1e3:>9.3f} ms CPU/stream {cpu / len(frames) * 1e6:>8.2f} us/frame"
+    )
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--coalesce-bytes", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    frames = asyncio.run(collect_frames(args.coalesce_bytes))
+    print(f"{len(frames)} frames, every frame flushed\n")
+    measure(frames, None, 0, args.repeat)
+    for level in (1, 6, 9):
+        measure(frames, "gzip", level, args.repeat)
+    if brotli is None:
+        print("brotli isn't installed, skipped")
+    else:
+        for quality in (1, 4, 11):
+            measure(frames, "br", quality, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
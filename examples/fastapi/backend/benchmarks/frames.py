@@ -0,0 +1,109 @@
+"""
+Micro-benchmark of the SSE frame encoding: the pre-encoded frame writer in
+`app.encoder` against the previous dict + `json.dumps` + f-string approach,
+and the time to the first token of `app.tokens.iter_tokens` against `str.split`.
+
+Usage: uv run python -m benchmarks.frames [--tokens 200000]
+"""
+
+import argparse
+import json
+import time
+import uuid
+from typing import Callable, List
+
+from app.encoder import TextFrameEncoder, encode_data
+from app.tokens import iter_tokens
+
+DATA_PREFIX = "data: "
+
+SAMPLE_TOKENS = (
+    'Text part is used to display "text" in the chat. It is in markdown format.\n'
+    "You can use **markdown** syntax to format the text, e.g. `const c = a + b`"
+).split(" ")
+
+SAMPLE_DATA = {
+    "type": "sources",
+    "data": {"nodes": [{"id": str(i), "url": "/sample.pdf"} for i in range(20)]},
+}
+
+
+def legacy_delta(message_id: str, token: str) -> bytes:
+    delta_chunk = {"id": message_id, "type": "text-delta", "delta": token + " "}
+    return f"{DATA_PREFIX}{json.dumps(delta_chunk)}\n\n".encode()
+
+
+def legacy_data(data: dict) -> bytes:
+    chunk = {"type": f"data-{data['type']}", "data": data.get("data", {})}
+    if data.get("id"):
+        chunk["id"] = data["id"]
+    return f"{DATA_PREFIX}{json.dumps(chunk)}\n\n".encode()
+
+
+def check_identical(message_id: str) -> None:
+    encoder = TextFrameEncoder(message_id)
+    for token in SAMPLE_TOKENS + ["ünïcödé ✓", 'quote " and \\ backslash']:
+        assert encoder.delta(token + " ") == legacy_delta(message_id, token)
+    for data in (SAMPLE_DATA, {**SAMPLE_DATA, "id": "sources_id"}):
+        assert encode_data(data) == legacy_data(data)
+
+
+def measure(label: str, count: int, fn: Callable[[], int]) -> float:
+    start = time.perf_counter()
+    written = fn()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed
+    print(f"{label:<28} {rate:>14,.0f} frames/s  {written / elapsed / 1e6:>8.1f} MB/s")
+    return rate
+
+
+def measure_first_token(sizes: List[int]) -> None:
+    for size in sizes:
+        content = " ".join(SAMPLE_TOKENS) * (size // len(" ".join(SAMPLE_TOKENS)) + 1)
+        start = time.perf_counter()
+        next(token for token in content.split(" ") if token)
+        split_time = time.perf_counter() - start
+        start = time.perf_counter()
+        next(iter_tokens(content))
+        lazy_time = time.perf_counter() - start
+        print(
+            f"first token of {size / 1e6:>5.1f} MB text: "
+            f"str.split {split_time * 1e3:>8.3f} ms, iter_tokens {lazy_time * 1e3:>8.3f} ms"
+        )
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    message_id = str(uuid.uuid4())
+    check_identical(message_id)
+    tokens = (SAMPLE_TOKENS * (args.tokens // len(SAMPLE_TOKENS) + 1))[: args.tokens]
+    data_count = args.tokens // 10
+
+    def run_legacy_text() -> int:
+        return sum(len(legacy_delta(message_id, token)) for token in tokens)
+
+    def run_encoder_text() -> int:
+        encoder = TextFrameEncoder(message_id)
+        return sum(len(encoder.delta(token + " ")) for token in tokens)
+
+    def run_legacy_data() -> int:
+        return sum(len(legacy_data(SAMPLE_DATA)) for _ in range(data_count))
+
+    def run_encoder_data() -> int:
+        return sum(len(encode_data(SAMPLE_DATA)) for _ in range(data_count))
+
+    print("Single core, output checked to be byte-identical\n")
+    legacy = measure("text-delta (legacy)", len(tokens), run_legacy_text)
+    encoded = measure("text-delta (encoder)", len(tokens), run_encoder_text)
+    print(f"{'speedup':<28} {encoded / legacy:>14.2f}x\n")
+    legacy = measure("data-sources (legacy)", data_count, run_legacy_data)
+    encoded = measure("data-sources (encoder)", data_count, run_encoder_data)
+    print(f"{'speedup':<28} {encoded / legacy:>14.2f}x\n")
+    measure_first_token([100_000, 1_000_000, 10_000_000])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Load benchmark of the `/api/chat` SSE endpoint.
+Starts the app in-process (`--workers 0`) or with N uvicorn worker processes, opens many
+concurrent SSE streams and reports time-to-first-byte, inter-frame latency, frames/s
+and the server memory per open stream as JSON.
+
+Usage: uv run python -m benchmarks.load --streams 1000 --workers 4 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.stats import process_tree_rss, summarize
+
+PAYLOAD = {
+    "id": "benchmark",
+    "messages": [
+        {"id": "1", "role": "user", "parts": [{"type": "text", "text": "Hello"}]}
+    ],
+    "trigger": "submit-message",
+}
+
+
+@dataclass
+class StreamResult:
+    ttfb: Optional[float] = None
+    duration: float = 0.0
+    frames: int = 0
+    bytes: int = 0
+    gaps: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class Server:
+    """The app under test, in-process in a thread or as a uvicorn process with N workers"""
+
+    def __init__(self, workers: int, port: int, env: Dict[str, str]):
+        self.workers = workers
+        self.port = port
+        self.env = env
+        self._process: Optional[subprocess.Popen] = None
+        self._server: Any = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid if self._process else os.getpid()
+
+    def start(self) -> None:
+        if self.workers == 0:
+            import uvicorn
+
+            # The app reads its configuration on import
+            os.environ.update(self.env)
+            from app.main import app
+
+            config = uvicorn.Config(app, port=self.port, log_level="warning")
+            self._server = uvicorn.Server(config)
+            self._thread = threading.Thread(target=self._server.run, daemon=True)
+            self._thread.start()
+        else:
+            self._process = subprocess.Popen(
+                [
+                    sys.executable, "-m", "uvicorn", "app.main:app",
+                    "--port", str(self.port),
+                    "--workers", str(self.workers),
+                    "--log-level", "warning",
+                ],
+                env={**os.environ, **self.env},
+            )
+        self._wait_until_ready()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=10)
+
+    def _wait_until_ready(self, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    # Give all workers time to boot
+                    time.sleep(0.5 * self.workers)
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"Server didn't start on port {self.port} within {timeout}s")
+
+
+async def open_stream(
+    client: httpx.AsyncClient, url: str, abandon_after: Optional[float] = None
+) -> StreamResult:
+    result = StreamResult()
+    start = time.perf_counter()
+    last = start
+    try:
+        async with client.stream("POST", url, json=PAYLOAD) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                now = time.perf_counter()
+                if result.ttfb is None:
+                    result.ttfb = now - start
+                else:
+                    result.gaps.append(now - last)
+                last = now
+                result.bytes += len(chunk)
+                result.frames += chunk.count(b"\n\n")
+                if abandon_after is not None and now - start >= abandon_after:
+                    # Simulate a closed browser tab
+                    break
+    except (httpx.HTTPError, OSError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.duration = time.perf_counter() - start
+    return result
+
+
+async def sample_rss(pid: int, samples: List[int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        rss = process_tree_rss(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(
+    url: str,
+    streams: int,
+    ramp: float,
+    server_pid: int,
+    abandon_after: Optional[float] = None,
+) -> Dict[str, Any]:
+    baseline_rss = process_tree_rss(server_pid)
+    limits = httpx.Limits(max_connections=streams, max_keepalive_connections=0)
+    timeout = httpx.Timeout(None, connect=30.0)
+    rss_samples: List[int] = []
+    stop_sampling = asyncio.Event()
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        sampler = asyncio.create_task(sample_rss(server_pid, rss_samples, stop_sampling))
+        tasks = []
+        start = time.perf_counter()
+        for _ in range(streams):
+            tasks.append(asyncio.create_task(open_stream(client, url, abandon_after)))
+            if ramp:
+                await asyncio.sleep(ramp / streams)
+        results: List[StreamResult] = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        stop_sampling.set()
+        await sampler
+
+    ok = [r for r in results if r.error is None]
+    frames = sum(r.frames for r in ok)
+    peak_rss = max(rss_samples) if rss_samples else None
+    return {
+        "streams": streams,
+        "completed": len(ok),
+        "errors": len(results) - len(ok),
+        "error_samples": sorted({r.error for r in results if r.error})[:5],
+        "elapsed_s": elapsed,
+        "ttfb_ms": summarize([r.ttfb for r in ok if r.ttfb is not None], scale=1000),
+        "inter_frame_ms": summarize([gap for r in ok for gap in r.gaps], scale=1000),
+        "stream_duration_s": summarize([r.duration for r in ok]),
+        "frames_total": frames,
+        "frames_per_s": frames / elapsed if elapsed else None,
+        "bytes_total": sum(r.bytes for r in ok),
+        "rss_baseline_bytes": baseline_rss,
+        "rss_peak_bytes": peak_rss,
+        "rss_per_stream_bytes": (
+            (peak_rss - baseline_rss) / streams if peak_rss and baseline_rss else None
+        ),
+    }
+
+
+def raise_fd_limit(streams: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, streams * 2 + 256))
+    if wanted > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=1000, help="Number of concurrent SSE streams")
+    parser.add_argument("--workers", type=int, default=0, help="Uvicorn workers, 0 runs the app in-process")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds to open all streams")
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--part-delay", type=float, default=0.1)
+    parser.add_argument("--coalesce-bytes", type=int, default=0)
+    parser.add_argument(
+        "--abandon-after",
+        type=float,
+        help="Disconnect each client after this many seconds, to measure churn",
+    )
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    raise_fd_limit(args.streams)
+    env = {
+        "SSE_TOKEN_DELAY": str(args.token_delay),
+        "SSE_PART_DELAY": str(args.part_delay),
+        "SSE_COALESCE_BYTES": str(args.coalesce_bytes),
+    }
+    server = None
+    if args.url:
+        url, server_pid = args.url, -1
+    else:
+        server = Server(args.workers, free_port(), env)
+        server.start()
+        url, server_pid = f"http://127.0.0.1:{server.port}/api/chat/", server.pid
+
+    try:
+        results = asyncio.run(run_load(url, args.streams, args.ramp, server_pid, args.abandon_after))
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "config": {
+            **vars(args),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            # In-process, the measured memory includes the benchmark clients
+            "rss_includes_clients": server is not None and args.workers == 0,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
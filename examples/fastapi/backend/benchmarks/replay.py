@@ -0,0 +1,362 @@
+"""
+Replay recorded multi-turn chat sessions against the FastAPI `/api/chat` endpoint and/or a
+llama-deploy deployment. Virtual users replay the sessions turn by turn with random think times;
+the number of users is ramped up in stages until the p99 latency breaks the SLO.
+Reports the throughput and latency of each stage per endpoint as JSON.
+
+Sessions are read from a JSON file (a list of sessions) or a JSONL file (one session per line).
+A session is a list of messages in the `id`/`role`/`parts` format of the chat UI, or an object
+with a `messages` list. Every user message is a turn: the request contains the recorded
+messages up to that turn.
+
+Usage:
+    uv run python -m benchmarks.replay --sessions sessions.jsonl --concurrency 1,2,4,8,16,32 \\
+        --fastapi http://127.0.0.1:8000/api/chat/ \\
+        --llama-deploy http://127.0.0.1:4501 --deployment chat \\
+        --slo-ms 2000 --output replay.json
+
+Without an endpoint, the FastAPI app is started in-process. Without sessions, sample sessions are generated.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.vercel import get_text
+from benchmarks.load import Server, StreamResult, free_port, raise_fd_limit
+from benchmarks.stats import percentile, summarize
+
+Message = Dict[str, Any]
+Session = List[Message]
+
+STOP_EVENT = "llama_index.core.workflow.events.StopEvent"
+
+
+def load_sessions(path: str) -> List[Session]:
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = json.load(f)
+    sessions = [item["messages"] if isinstance(item, dict) else item for item in items]
+    return [session for session in sessions if any(m.get("role") == "user" for m in session)]
+
+
+def sample_sessions(count: int, seed: int = 0) -> List[Session]:
+    """Sessions of 1-6 turns with questions and answers of varying length"""
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(count):
+        messages = []
+        for turn in range(rng.randint(1, 6)):
+            question = " ".join(["What about the weather in San Francisco?"] * rng.randint(1, 8))
+            answer = " ".join(["It is sunny and 22 degrees."] * rng.randint(5, 200))
+            for role, text in (("user", question), ("assistant", answer)):
+                messages.append({"id": str(uuid.uuid4()), "role": role, "parts": [{"type": "text", "text": text}]})
+        sessions.append(messages)
+    return sessions
+
+
+class ThinkTime:
+    """Random time a user waits between two turns: `none`, `constant`, `exponential` or `lognormal`"""
+
+    def __init__(self, distribution: str, mean: float, sigma: float, rng: random.Random):
+        self.distribution = distribution
+        self.mean = mean
+        self.sigma = sigma
+        self.rng = rng
+
+    def sample(self) -> float:
+        if self.distribution == "none" or self.mean <= 0:
+            return 0.0
+        if self.distribution == "constant":
+            return self.mean
+        if self.distribution == "exponential":
+            return self.rng.expovariate(1 / self.mean)
+        # Log-normal with the given mean: user think times have a long tail
+        mu = math.log(self.mean) - self.sigma**2 / 2
+        return self.rng.lognormvariate(mu, self.sigma)
+
+
+class Endpoint:
+    """A chat backend that answers one turn of a session"""
+
+    name: str
+
+    async def turn(self, client: httpx.AsyncClient, session_id: str, messages: List[Message]) -> StreamResult:
+        raise NotImplementedError
+
+
+class FastAPIEndpoint(Endpoint):
+    """`POST /api/chat` with the messages of the session, streaming the SSE response"""
+
+    def __init__(self, url: str):
+        self.name = f"fastapi:{url}"
+        self.url = url
+
+    async def turn(self, client: httpx.AsyncClient, session_id: str, messages: List[Message]) -> StreamResult:
+        payload = {"id": session_id, "messages": messages, "trigger": "submit-message"}
+        result = StreamResult()
+        start = last = time.perf_counter()
+        async with client.stream("POST", self.url, json=payload) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                last = record_chunk(result, start, last)
+                result.bytes += len(chunk)
+                result.frames += chunk.count(b"\n\n")
+        result.duration = time.perf_counter() - start
+        return result
+
+
+class LlamaDeployEndpoint(Endpoint):
+    """
+    Create a task with `user_msg` and `chat_history` like the `useChatWorkflow` hook,
+    then stream its events until the stop event
+    """
+
+    def __init__(self, url: str, deployment: str, workflow: Optional[str] = None):
+        self.name = f"llama-deploy:{url}/deployments/{deployment}"
+        self.base = f"{url.rstrip('/')}/deployments/{deployment}"
+        self.workflow = workflow
+
+    async def turn(self, client: httpx.AsyncClient, session_id: str, messages: List[Message]) -> StreamResult:
+        event = {"user_msg": get_text(messages[-1]), "chat_history": messages[:-1]}
+        body: Dict[str, Any] = {"input": json.dumps(event)}
+        if self.workflow:
+            body["service_id"] = self.workflow
+        result = StreamResult()
+        start = last = time.perf_counter()
+        response = await client.post(f"{self.base}/tasks/create", json=body)
+        response.raise_for_status()
+        task = response.json()
+        url = f"{self.base}/tasks/{task['task_id']}/events"
+        params = {"session_id": task["session_id"], "raw_event": "true"}
+        async with client.stream("GET", url, params=params) as events:
+            events.raise_for_status()
+            async for line in events.aiter_lines():
+                if not line.strip():
+                    continue
+                last = record_chunk(result, start, last)
+                result.bytes += len(line) + 1
+                result.frames += 1
+                if STOP_EVENT in line:
+                    break
+        result.duration = time.perf_counter() - start
+        return result
+
+
+def record_chunk(result: StreamResult, start: float, last: float) -> float:
+    now = time.perf_counter()
+    if result.ttfb is None:
+        result.ttfb = now - start
+    else:
+        result.gaps.append(now - last)
+    return now
+
+
+@dataclass
+class Stage:
+    concurrency: int
+    duration: float
+    results: List[StreamResult]
+    sessions_completed: int
+
+
+async def virtual_user(
+    endpoint: Endpoint,
+    client: httpx.AsyncClient,
+    sessions: List[Session],
+    think: ThinkTime,
+    deadline: float,
+    results: List[StreamResult],
+    rng: random.Random,
+) -> int:
+    """Replay random sessions until the deadline, returns the number of completed sessions"""
+    completed = 0
+    while time.perf_counter() < deadline:
+        session = rng.choice(sessions)
+        session_id = str(uuid.uuid4())
+        for i, message in enumerate(session):
+            if message.get("role") != "user":
+                continue
+            if time.perf_counter() >= deadline:
+                return completed
+            try:
+                result = await endpoint.turn(client, session_id, session[: i + 1])
+            except (httpx.HTTPError, OSError, KeyError, ValueError) as e:
+                result = StreamResult(error=f"{type(e).__name__}: {e}")
+            results.append(result)
+            await asyncio.sleep(think.sample())
+            if result.error is not None:
+                # Start over with another session
+                break
+        else:
+            completed += 1
+    return completed
+
+
+async def run_stage(
+    endpoint: Endpoint,
+    sessions: List[Session],
+    concurrency: int,
+    duration: float,
+    ramp: float,
+    think: ThinkTime,
+    seed: int,
+) -> Stage:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(None, connect=30.0)
+    results: List[StreamResult] = []
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        users = []
+        for i in range(concurrency):
+            rng = random.Random(seed * 100_003 + i)
+            users.append(
+                asyncio.create_task(virtual_user(endpoint, client, sessions, think, deadline, results, rng))
+            )
+            if ramp:
+                await asyncio.sleep(ramp / concurrency)
+        completed = sum(await asyncio.gather(*users))
+        elapsed = time.perf_counter() - start
+    return Stage(concurrency, elapsed, results, completed)
+
+
+def stage_report(stage: Stage, slo_metric: str) -> Dict[str, Any]:
+    ok = [r for r in stage.results if r.error is None]
+    latencies = [r.ttfb if slo_metric == "ttfb" else r.duration for r in ok if r.ttfb is not None]
+    return {
+        "concurrency": stage.concurrency,
+        "elapsed_s": stage.duration,
+        "turns": len(stage.results),
+        "errors": len(stage.results) - len(ok),
+        "error_rate": (len(stage.results) - len(ok)) / len(stage.results) if stage.results else 0.0,
+        "error_samples": sorted({r.error for r in stage.results if r.error})[:5],
+        "sessions_completed": stage.sessions_completed,
+        "turns_per_s": len(ok) / stage.duration if stage.duration else None,
+        "frames_per_s": sum(r.frames for r in ok) / stage.duration if stage.duration else None,
+        "bytes_per_s": sum(r.bytes for r in ok) / stage.duration if stage.duration else None,
+        "ttfb_ms": summarize([r.ttfb for r in ok if r.ttfb is not None], scale=1000),
+        "turn_duration_ms": summarize([r.duration for r in ok], scale=1000),
+        "inter_frame_ms": summarize([gap for r in ok for gap in r.gaps], scale=1000),
+        "slo_p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+    }
+
+
+async def run_endpoint(endpoint: Endpoint, sessions: List[Session], args: argparse.Namespace) -> Dict[str, Any]:
+    think = ThinkTime(args.think_time, args.think_mean, args.think_sigma, random.Random(args.seed))
+    stages = []
+    saturation = None
+    for concurrency in args.concurrency:
+        stage = await run_stage(
+            endpoint, sessions, concurrency, args.stage_duration, args.ramp, think, args.seed
+        )
+        report = stage_report(stage, args.slo_metric)
+        report["slo_met"] = (
+            report["slo_p99_ms"] is not None
+            and report["slo_p99_ms"] <= args.slo_ms
+            and report["error_rate"] <= args.max_error_rate
+        )
+        stages.append(report)
+        print(
+            f"{endpoint.name} concurrency={concurrency:<4} turns/s={report['turns_per_s'] or 0:>8.2f} "
+            f"p99 {args.slo_metric}={report['slo_p99_ms'] or float('nan'):>9.1f} ms "
+            f"errors={report['errors']} slo_met={report['slo_met']}",
+            flush=True,
+        )
+        if not report["slo_met"] and saturation is None:
+            saturation = concurrency
+            if not args.full_ramp:
+                break
+    sustained = [stage for stage in stages if stage["slo_met"]]
+    return {
+        "endpoint": endpoint.name,
+        "stages": stages,
+        # The first concurrency at which the SLO was broken, None if it held for all stages
+        "saturation_concurrency": saturation,
+        "max_concurrency_within_slo": max((s["concurrency"] for s in sustained), default=None),
+        "max_turns_per_s_within_slo": max((s["turns_per_s"] or 0 for s in sustained), default=None),
+    }
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", help="JSON or JSONL file of recorded sessions")
+    parser.add_argument("--sample-sessions", type=int, default=50, help="Sessions generated if --sessions isn't set")
+    parser.add_argument("--fastapi", action="append", default=[], help="URL of a /api/chat endpoint")
+    parser.add_argument("--llama-deploy", action="append", default=[], help="URL of a llama-deploy API server")
+    parser.add_argument("--deployment", default="chat", help="Name of the llama-deploy deployment")
+    parser.add_argument("--workflow", help="Service of the llama-deploy deployment, the default service if not set")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(v) for v in value.split(",")],
+        default=[1, 2, 4, 8, 16, 32, 64],
+        help="Comma-separated concurrent users of each stage",
+    )
+    parser.add_argument("--stage-duration", type=float, default=30.0, help="Seconds per stage")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds to start the users of a stage")
+    parser.add_argument("--think-time", choices=["none", "constant", "exponential", "lognormal"], default="lognormal")
+    parser.add_argument("--think-mean", type=float, default=3.0, help="Mean think time in seconds")
+    parser.add_argument("--think-sigma", type=float, default=0.8, help="Sigma of the lognormal think time")
+    parser.add_argument("--slo-metric", choices=["ttfb", "duration"], default="ttfb")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p99 latency SLO in milliseconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--full-ramp", action="store_true", help="Run all stages, even after the SLO is broken")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="Pacing of the in-process app")
+    parser.add_argument("--part-delay", type=float, default=0.1, help="Pacing of the in-process app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    sessions = load_sessions(args.sessions) if args.sessions else sample_sessions(args.sample_sessions, args.seed)
+    if not sessions:
+        parser.error("No sessions with user messages")
+    raise_fd_limit(max(args.concurrency))
+
+    server = None
+    endpoints: List[Endpoint] = [FastAPIEndpoint(url) for url in args.fastapi]
+    endpoints += [LlamaDeployEndpoint(url, args.deployment, args.workflow) for url in args.llama_deploy]
+    if not endpoints:
+        env = {"SSE_TOKEN_DELAY": str(args.token_delay), "SSE_PART_DELAY": str(args.part_delay)}
+        server = Server(0, free_port(), env)
+        server.start()
+        endpoints.append(FastAPIEndpoint(f"http://127.0.0.1:{server.port}/api/chat/"))
+
+    try:
+        results = [asyncio.run(run_endpoint(endpoint, sessions, args)) for endpoint in endpoints]
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "config": {
+            **vars(args),
+            "sessions_loaded": len(sessions),
+            "turns_per_session": sum(
+                sum(m.get("role") == "user" for m in session) for session in sessions
+            ) / len(sessions),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "endpoints": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
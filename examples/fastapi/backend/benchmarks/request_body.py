@@ -0,0 +1,83 @@
+"""
+Benchmark of extracting the last message from chat request bodies: decoding the whole body with
+`json.loads` against scanning it (what `app.request.parse_last_message` does above
+CHAT_SCAN_THRESHOLD_BYTES). Reports the time and the peak memory for synthetic histories,
+to choose the threshold.
+
+Usage: uv run python -m benchmarks.request_body [--sizes 10 100 1000]
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.request import parse_last_message
+from app.vercel import get_text
+
+PARAGRAPH = (
+    "Here is a response that uses context information [citation:1] with **markdown**, "
+    'a "quote" and a code block:\n```js\nconst a = [1, 2, {b: 3}]\n```\n'
+)
+
+
+def make_body(message_count: int) -> bytes:
+    messages = []
+    for i in range(message_count):
+        parts: List[Dict[str, Any]] = [{"type": "text", "text": f"{i}: " + PARAGRAPH * 4}]
+        if i % 2:
+            parts.append(
+                {
+                    "type": "data-sources",
+                    "data": {"nodes": [{"id": str(n), "url": "/sample.pdf"} for n in range(5)]},
+                }
+            )
+        messages.append(
+            {"id": str(i), "role": "assistant" if i % 2 else "user", "parts": parts}
+        )
+    return json.dumps({"id": "chat", "messages": messages, "trigger": "submit-message"}).encode()
+
+
+def full_parse(body: bytes, max_messages: int) -> Dict[str, Any]:
+    # A threshold above the body size always decodes it with json.loads
+    return parse_last_message(body, max_messages, scan_threshold=len(body))
+
+
+def scan(body: bytes, max_messages: int) -> Dict[str, Any]:
+    return parse_last_message(body, max_messages, scan_threshold=0)
+
+
+def measure(fn: Callable[[bytes], Dict[str, Any]], body: bytes, repeat: int) -> Tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{'messages':>8} {'body':>10} {'json.loads':>22} {'scan':>22}")
+    for size in args.sizes:
+        body = make_body(size)
+        assert get_text(scan(body, size)) == get_text(full_parse(body, size))
+        full_time, full_peak = measure(lambda b: full_parse(b, size), body, args.repeat)
+        scan_time, scan_peak = measure(lambda b: scan(b, size), body, args.repeat)
+        print(
+            f"{size:>8} {len(body) / 1024:>8.0f}KB "
+            f"{full_time * 1e3:>8.2f} ms {full_peak / 1024:>8.0f}KB "
+            f"{scan_time * 1e3:>8.2f} ms {scan_peak / 1024:>8.0f}KB"
+        )
+
+
+if __name__ == "__main__":
+    main()
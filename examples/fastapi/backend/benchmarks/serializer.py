@@ -0,0 +1,65 @@
+"""
+Benchmark of the JSON serializers of the data parts in `app.serializer`: measures the
+data frames/s of each backend for the sample parts. Their output is checked in `tests/test_serializer.py`.
+
+Usage: uv run python -m benchmarks.serializer [--frames 100000]
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from app.chat import SAMPLE_PARTS
+from app.encoder import encode_data
+from app.serializer import Serializer, msgspec, orjson
+
+DATA_PREFIX = "data: "
+
+
+def legacy_data(data: dict) -> bytes:
+    chunk = {"type": f"data-{data['type']}", "data": data.get("data", {})}
+    if data.get("id"):
+        chunk["id"] = data["id"]
+    return f"{DATA_PREFIX}{json.dumps(chunk)}\n\n".encode()
+
+
+def measure(label: str, frames: int, parts: List[Dict[str, Any]], fn) -> float:
+    start = time.perf_counter()
+    written = 0
+    for i in range(frames):
+        written += len(fn(parts[i % len(parts)]))
+    elapsed = time.perf_counter() - start
+    rate = frames / elapsed
+    print(f"{label:<28} {rate:>14,.0f} frames/s  {written / elapsed / 1e6:>8.1f} MB/s")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=100_000)
+    args = parser.parse_args()
+
+    data_parts = [part for part in SAMPLE_PARTS if not isinstance(part, str)]
+    backends = ["stdlib"] + [
+        name for name, module in (("orjson", orjson), ("msgspec", msgspec)) if module is not None
+    ]
+    serializers = {"stdlib (typed)": Serializer("stdlib")}
+    serializers["stdlib (untyped)"] = Serializer("stdlib", typed=False)
+    serializers.update({name: Serializer(name) for name in backends[1:]})
+    print(f"{len(data_parts)} sample data parts")
+    base = measure("json.dumps (previous)", args.frames, data_parts, legacy_data)
+    for label, serializer in serializers.items():
+        rate = measure(label, args.frames, data_parts, lambda data: encode_data(data, serializer))
+        print(f"{'':<28} {rate / base:>13.2f}x")
+    for part_type in ("file", "event", "artifact", "suggested_questions", "sources"):
+        parts = [part for part in data_parts if part["type"] == part_type]
+        print(f"\n{part_type}")
+        base = measure("json.dumps (previous)", args.frames, parts, legacy_data)
+        for label, serializer in serializers.items():
+            rate = measure(label, args.frames, parts, lambda data: encode_data(data, serializer))
+            print(f"{'':<28} {rate / base:>13.2f}x")
+
+
+if __name__ == "__main__":
+    main()
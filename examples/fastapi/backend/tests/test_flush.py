@@ -0,0 +1,163 @@
+import asyncio
+import json
+import time
+
+from app.flush import DeltaCoalescer, FlushPolicy, PartCoalescer
+from app.tokens import iter_tokens
+from app.vercel import SSEStreamResponse
+
+TEXT = "The quick brown fox jumps over the lazy dog, then it runs into the woods."
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def collect(response: SSEStreamResponse) -> list:
+    return [json.loads(frame[len(b"data: ") :]) async for frame in response.body_iterator]
+
+
+def text_deltas(chunks: list) -> list:
+    return [chunk["delta"] for chunk in chunks if chunk["type"] == "text-delta"]
+
+
+def test_default_pacing_batches_tokens():
+    # The default token delay and coalescing window, only coalescing is enabled
+    policy = FlushPolicy(max_bytes=4096)
+    deltas = text_deltas(run(collect(SSEStreamResponse(parts=[TEXT], flush_policy=policy))))
+
+    tokens = list(iter_tokens(TEXT))
+    assert "".join(deltas) == TEXT
+    assert len(deltas) < len(tokens)
+    assert any(len(list(iter_tokens(delta))) > 1 for delta in deltas)
+
+
+def test_without_coalescing_each_token_is_a_frame():
+    policy = FlushPolicy(token_delay=0, part_delay=0)
+    deltas = text_deltas(run(collect(SSEStreamResponse(parts=[TEXT], flush_policy=policy))))
+    assert deltas == list(iter_tokens(TEXT))
+
+
+def test_budget_adapts_to_the_consumer():
+    policy = FlushPolicy(max_bytes=16, max_bytes_limit=64)
+    coalescer = DeltaCoalescer(policy)
+    coalescer.add(b"x" * 15)
+    assert not coalescer.due()
+    coalescer.add(b"x")
+    assert coalescer.due()
+    assert coalescer.flush() == b"x" * 16
+
+    # Slow consumers get larger frames, up to the limit
+    for _ in range(4):
+        coalescer.drained(policy.max_delay * 2)
+    assert coalescer.budget == 64
+    # Fast consumers go back to the configured budget
+    for _ in range(4):
+        coalescer.drained(0)
+    assert coalescer.budget == 16
+
+
+def event(part_id, status):
+    return {"type": "event", "id": part_id, "data": {"status": status}}
+
+
+def stream_parts(parts, part_window=0.05):
+    policy = FlushPolicy(token_delay=0, part_delay=0, part_window=part_window)
+    response = SSEStreamResponse(parts=parts, flush_policy=policy)
+    return response, run(collect(response))
+
+
+def sent_parts(chunks):
+    """The data parts as (id, status) and the text parts as their text"""
+    sent = []
+    for chunk in chunks:
+        if chunk["type"] == "data-event":
+            sent.append((chunk.get("id"), chunk["data"]["status"]))
+        elif chunk["type"] == "data-file":
+            sent.append("file")
+        elif chunk["type"] == "text-start":
+            sent.append("")
+        elif chunk["type"] == "text-delta":
+            sent[-1] += chunk["delta"]
+    return sent
+
+
+def test_updates_of_a_part_collapse_to_the_last_version():
+    parts = [event("tool", "pending"), event("tool", "running"), event("tool", "done"), "text"]
+    response, chunks = stream_parts(parts)
+    assert sent_parts(chunks) == [("tool", "done"), "text"]
+    assert response.stats.parts_superseded == 2
+    assert response.stats.parts_sent == 2
+
+
+def test_held_parts_keep_their_position_and_flush_before_other_parts():
+    parts = [
+        event("a", "pending"),
+        event("b", "pending"),
+        event("a", "done"),
+        {"type": "file", "data": {"name": "f"}},
+        event("b", "done"),
+        "text",
+    ]
+    _, chunks = stream_parts(parts)
+    # "a" is sent at the position of its first version, before "b", and both before the file part
+    assert sent_parts(chunks) == [("a", "done"), ("b", "pending"), "file", ("b", "done"), "text"]
+
+
+def test_held_part_is_flushed_at_the_end_of_the_stream():
+    _, chunks = stream_parts(["text", event("a", "pending"), event("a", "done")])
+    assert sent_parts(chunks) == ["text", ("a", "done")]
+
+
+def test_held_part_is_flushed_when_the_window_ends():
+    async def slow_parts():
+        yield event("a", "pending")
+        await asyncio.sleep(0.2)
+        yield event("a", "done")
+
+    response, chunks = stream_parts(slow_parts(), part_window=0.02)
+    # The window ended while the next part was awaited, so both versions are sent
+    assert sent_parts(chunks) == [("a", "pending"), ("a", "done")]
+    assert response.stats.parts_superseded == 0
+
+
+def test_closing_the_stream_cancels_the_pending_part():
+    cancelled = asyncio.Event()
+
+    async def hanging_parts():
+        yield event("a", "pending")
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        yield event("a", "done")
+
+    async def scenario():
+        policy = FlushPolicy(token_delay=0, part_delay=0, part_window=60)
+        response = SSEStreamResponse(parts=hanging_parts(), flush_policy=policy)
+        frames = response.body_iterator
+        consumer = asyncio.ensure_future(frames.__anext__())
+        await asyncio.sleep(0.05)
+        # The client left while "a" was held back and the next part was awaited
+        consumer.cancel()
+        start = time.perf_counter()
+        try:
+            await consumer
+        except asyncio.CancelledError:
+            pass
+        await frames.aclose()
+        return time.perf_counter() - start
+
+    assert run(scenario()) < 1
+    assert cancelled.is_set()
+
+
+def test_part_coalescer_flushes_when_too_many_parts_are_held():
+    coalescer = PartCoalescer(FlushPolicy(part_window=60))
+    for i in range(coalescer.max_pending - 1):
+        assert coalescer.add(event(str(i), "pending")) == []
+    assert coalescer.timeout() > 0
+    assert len(coalescer.add(event("last", "pending"))) == coalescer.max_pending
+    assert coalescer.pending == 0
+    assert coalescer.timeout() is None
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.request import parse_last_message
+
+# A threshold of 0 scans every body, a large one decodes every body with json.loads
+PATHS = {"json": 1 << 30, "scan": 0}
+
+VALID = [
+    {"messages": [{"role": "user", "content": "a"}, {"role": "user", "content": "b"}]},
+    {"id": "x", "messages": [{"content": "a"}], "data": {"messages": [1, 2]}},
+    {"messages": []},
+    {"messages": [{"content": "a"}, "not a message"]},
+    {"messages": "not an array"},
+    {},
+    {"messages": [{"content": "é 😀  ", "annotations": [None, True, 1.5e3]}]},
+]
+
+
+@pytest.mark.parametrize("path", PATHS)
+@pytest.mark.parametrize("data", VALID)
+def test_paths_agree_with_json_loads(path, data):
+    messages = data.get("messages")
+    expected = messages[-1] if isinstance(messages, list) and messages and isinstance(messages[-1], dict) else {}
+    for body in (json.dumps(data), json.dumps(data, indent=2, ensure_ascii=False)):
+        assert parse_last_message(body.encode(), 10, PATHS[path]) == expected
+
+
+def test_last_messages_member_wins():
+    body = b'{"messages": [{"content": "a"}], "messages": [{"content": "b"}]}'
+    for threshold in PATHS.values():
+        assert parse_last_message(body, 10, threshold) == {"content": "b"}
+
+
+MALFORMED = [
+    b'{"messages": [{"content": "a"} {"content": "b"}]}',
+    b'{"id": "x" "messages": []}',
+    b'{"messages": [{"content": "a"}]} trailing',
+    b'{"messages": [{"content": "a"}]}{}',
+    b'{"messages": [{"content": "a"},]}',
+    b'{"messages": [],}',
+    b'{1: "a"}',
+    b'{"messages" [] }',
+    b'{"messages": [{"content": "a"}',
+    b'[{"content": "a"}]',
+    b'\x0b{"messages": []}',
+    b'\xff',
+    b"",
+]
+
+
+@pytest.mark.parametrize("path", PATHS)
+@pytest.mark.parametrize("body", MALFORMED)
+def test_malformed_body_is_rejected(path, body):
+    with pytest.raises(HTTPException) as error:
+        parse_last_message(body, 10, PATHS[path])
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_too_many_messages(path):
+    body = json.dumps({"messages": [{"content": str(i)} for i in range(11)]}).encode()
+    with pytest.raises(HTTPException) as error:
+        parse_last_message(body, 10, PATHS[path])
+    assert error.value.status_code == 413
+    assert parse_last_message(body, 11, PATHS[path]) == {"content": "10"}
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.resume import InMemoryReplayStore, ReplayStoreFull, format_event_id, parse_event_id
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def fill(store, stream_id, count):
+    return [await store.append(stream_id, f"{stream_id}{i}".encode()) for i in range(count)]
+
+
+def test_frames_are_numbered_and_replayed():
+    async def scenario():
+        store = InMemoryReplayStore()
+        assert await fill(store, "a", 3) == [0, 1, 2]
+        chunk = await store.read("a", 0, timeout=0)
+        assert chunk.frames == [(1, b"a1"), (2, b"a2")]
+        assert not chunk.finished
+        await store.finish("a")
+        assert (await store.read("a", -1, timeout=0)).finished
+
+    run(scenario())
+
+
+def test_read_waits_for_new_frames():
+    async def scenario():
+        store = InMemoryReplayStore()
+        await store.create("a")
+        reader = asyncio.create_task(store.read("a", -1, timeout=5))
+        await asyncio.sleep(0)
+        await store.append("a", b"frame")
+        return await reader
+
+    assert run(scenario()).frames == [(0, b"frame")]
+
+
+def test_frames_dropped_from_the_ring_buffer_cant_be_resumed():
+    async def scenario():
+        store = InMemoryReplayStore(max_frames=2)
+        await fill(store, "a", 5)
+        assert await store.read("a", 1, timeout=0) is None
+        assert (await store.read("a", 2, timeout=0)).frames == [(3, b"a3"), (4, b"a4")]
+        assert await store.read("unknown", -1, timeout=0) is None
+
+    run(scenario())
+
+
+def test_live_streams_are_never_evicted():
+    async def scenario():
+        store = InMemoryReplayStore(max_streams=2)
+        await store.create("a")
+        await store.create("b")
+        await fill(store, "a", 3)
+        with pytest.raises(ReplayStoreFull):
+            await store.create("c")
+        # The live streams keep their frames and numbering
+        await store.append("a", b"a3")
+        assert [seq for seq, _ in (await store.read("a", -1, timeout=0)).frames] == [0, 1, 2, 3]
+
+        # A finished stream makes room
+        await store.finish("b")
+        await store.create("c")
+        assert await store.read("b", -1, timeout=0) is None
+        assert (await store.read("a", -1, timeout=0)).frames[0] == (0, b"a0")
+
+    run(scenario())
+
+
+def test_finished_streams_expire():
+    async def scenario():
+        store = InMemoryReplayStore(ttl=0)
+        await fill(store, "a", 1)
+        await store.finish("a")
+        await asyncio.sleep(0.01)
+        return await store.read("a", -1, timeout=0)
+
+    assert run(scenario()) is None
+
+
+def test_event_ids():
+    assert parse_event_id(format_event_id("stream:1", 7)) == ("stream:1", 7)
+    assert parse_event_id("stream:-1") == ("stream", -1)
+    assert parse_event_id("no-seq") is None
+    assert parse_event_id(None) is None
@@ -0,0 +1,102 @@
+import json
+import math
+from typing import Any, Dict, List
+
+import pytest
+
+from app.chat import SAMPLE_PARTS
+from app.encoder import DATA_PREFIX, FRAME_END, encode_data
+from app.serializer import Serializer, get_serializer, msgspec, orjson
+
+SERIALIZERS = {
+    "stdlib (typed)": lambda: Serializer("stdlib"),
+    "stdlib (untyped)": lambda: Serializer("stdlib", typed=False),
+    "orjson": lambda: Serializer("orjson"),
+    "msgspec": lambda: Serializer("msgspec"),
+}
+AVAILABLE = {"orjson": orjson is not None, "msgspec": msgspec is not None}
+
+UNICODE = 'ünïcödé ✓ 😀 "quoted" \\ \n\t \x00  '
+
+# Shapes the typed encoders must either encode exactly like `json.dumps` or fall back on
+PARTS: List[Dict[str, Any]] = [part for part in SAMPLE_PARTS if not isinstance(part, str)] + [
+    {"type": "file", "data": {"name": UNICODE, "size": 0}},
+    {"type": "file", "data": {"flag": True, "none": None, "neg": -1, "float": 1.5}},
+    {"type": "file", "data": {"nested": {"a": [1, 2.0, "x"]}}},
+    {"type": "file", "data": {}},
+    {"type": "file", "data": {1: "int key", None: "none key", 1.5: "float key"}},
+    # A bool key of its own, True == 1 would merge it with an int key
+    {"type": "file", "data": {True: "bool key", False: "other bool key"}},
+    {"type": "file", "data": {"big": 2**70, "nan": float("nan"), "inf": float("inf"), "-inf": float("-inf")}},
+    {"type": "file"},
+    {"type": "event", "data": {"title": UNICODE, "status": "done", "data": {"x": [1, None]}}},
+    {"type": "event", "data": {"data": "only data"}},
+    {"type": "event", "data": {"data": 1, "title": "data first"}},
+    {"type": "event", "data": {"title": "no data", "status": 1.0, "data": {2: [-(2**64)]}}},
+    {"type": "artifact", "data": {"type": "code", "data": {"code": "x = 1\n", "created_at": 1}}},
+    {"type": "artifact", "data": {"type": UNICODE, "data": {"file_name": UNICODE, "language": None}}},
+    {"type": "artifact", "data": {"type": "code", "data": {None: "x", "size": 2**63}}},
+    {"type": "artifact", "data": {"type": "document", "data": {"sources": [{"id": "1"}]}}},
+    {"type": "artifact", "data": {"data": {}, "type": "reversed"}},
+    {"type": "suggested_questions", "data": ["Why?", UNICODE]},
+    {"type": "suggested_questions", "data": ["mixed", 1, None, float("nan")]},
+    {"type": "suggested_questions", "data": []},
+    {"type": "sources", "data": {"nodes": []}, "id": "sources_id"},
+    {"type": "sources", "data": {"nodes": [{"id": UNICODE, "metadata": {0: 2**100, "score": float("inf")}}]}},
+    {"type": UNICODE, "data": [1, {"b": 2}], "id": 42},
+    {"type": "unknown", "data": {1: {2: [3]}}, "id": UNICODE},
+]
+
+
+def legacy_frame(data: Dict[str, Any]) -> bytes:
+    # The frames were written with json.dumps of the whole chunk
+    chunk = {"type": f"data-{data['type']}", "data": data.get("data", {})}
+    if data.get("id"):
+        chunk["id"] = data["id"]
+    return DATA_PREFIX + json.dumps(chunk).encode() + b"\n\n"
+
+
+def decode(frame: bytes) -> Any:
+    assert frame.startswith(DATA_PREFIX) and frame.endswith(FRAME_END)
+    return json.loads(frame[len(DATA_PREFIX) :])
+
+
+def without_nan(value: Any) -> Any:
+    """NaN and infinity as None, what the compact backends write"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: without_nan(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [without_nan(item) for item in value]
+    return value
+
+
+@pytest.fixture(params=SERIALIZERS)
+def serializer(request) -> Serializer:
+    if not AVAILABLE.get(request.param, True):
+        pytest.skip(f"{request.param} isn't installed")
+    return SERIALIZERS[request.param]()
+
+
+@pytest.mark.parametrize("data", PARTS, ids=lambda data: f"{data['type'][:20]}")
+def test_frames_match_json_dumps(serializer, data):
+    frame = encode_data(data, serializer)
+    expected = legacy_frame(data)
+    if serializer.compatible:
+        assert frame == expected
+    else:
+        assert frame.endswith(FRAME_END)
+        assert without_nan(decode(frame)) == without_nan(decode(expected))
+
+
+def test_every_part_type_is_covered():
+    part_types = {data["type"] for data in PARTS}
+    assert {"file", "event", "artifact", "sources", "suggested_questions"} <= part_types
+
+
+def test_compact_backends_are_picked_when_allowed():
+    assert get_serializer().compatible
+    assert get_serializer(compact=True).compatible == (orjson is None and msgspec is None)
+    with pytest.raises(ValueError):
+        Serializer("unknown")
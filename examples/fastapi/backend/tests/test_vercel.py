@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.flush import FlushPolicy
+from app.vercel import SSEStreamResponse
+
+SCOPE = {"type": "http", "method": "POST", "path": "/api/chat", "headers": []}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class Client:
+    """ASGI receive and send of a client that disconnects after receiving `frames` frames"""
+
+    def __init__(self, frames: int):
+        self.frames = frames
+        self.bodies = []
+        self._disconnected = asyncio.Event()
+
+    async def receive(self):
+        await self._disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        if message["type"] == "http.response.body" and message["body"]:
+            self.bodies.append(message["body"])
+            if len(self.bodies) == self.frames:
+                self._disconnected.set()
+
+
+def test_disconnect_closes_the_upstream_generator():
+    closed = asyncio.Event()
+    produced = []
+
+    async def llm_parts():
+        try:
+            for i in range(100):
+                produced.append(i)
+                yield f"part {i}"
+        finally:
+            closed.set()
+
+    async def scenario():
+        # Each text part is a start, a delta and an end frame
+        client = Client(frames=4)
+        response = SSEStreamResponse(parts=llm_parts(), flush_policy=FlushPolicy(token_delay=0.01, part_delay=0.01))
+        await asyncio.wait_for(response(SCOPE, client.receive, client.send), timeout=5)
+        return response, client
+
+    response, client = run(scenario())
+    assert closed.is_set()
+    assert len(produced) < 100
+    assert response.stats.disconnected
+    assert response.stats.frames_sent == len(client.bodies)
+    # The number of parts of an async iterable isn't known
+    assert response.stats.parts_unsent is None
+
+
+def test_disconnect_records_unsent_parts_and_bytes():
+    parts = [f"part {i}" for i in range(10)]
+
+    async def scenario():
+        client = Client(frames=2)
+        policy = FlushPolicy(token_delay=0.01, part_delay=0.01, max_bytes=1024, max_delay=1.0)
+        response = SSEStreamResponse(parts=parts, flush_policy=policy)
+        await asyncio.wait_for(response(SCOPE, client.receive, client.send), timeout=5)
+        return response
+
+    response = run(scenario())
+    assert response.stats.disconnected
+    assert response.stats.parts_unsent == len(parts) - response.stats.parts_sent > 0
+    # The coalesced deltas that were buffered when the client left
+    assert response.stats.bytes_unsent > 0
+
+
+def test_errors_of_the_parts_are_raised_unwrapped():
+    async def failing_parts():
+        yield "part"
+        raise ValueError("upstream failed")
+
+    async def scenario():
+        client = Client(frames=-1)
+        response = SSEStreamResponse(parts=failing_parts(), flush_policy=FlushPolicy(token_delay=0, part_delay=0))
+        await response(SCOPE, client.receive, client.send)
+
+    with pytest.raises(ValueError, match="upstream failed"):
+        run(scenario())
@@ -1,12 +1,26 @@
-from typing import Any, List, Optional
+import asyncio
+import os
+import re
+from dataclasses import dataclass, is_dataclass, replace
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union, cast
 
-from llama_index.core import QueryBundle
+from llama_index.core import QueryBundle, Settings
+from llama_index.core.async_utils import asyncio_run
 from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.core.prompts import PromptTemplate
 from llama_index.core.query_engine.retriever_query_engine import RetrieverQueryEngine
+from llama_index.core.base.response.schema import RESPONSE_TYPE, Response
+from llama_index.core.chat_ui.events import SourceNodesEvent
 from llama_index.core.response_synthesizers import Accumulate
-from llama_index.core.schema import NodeWithScore
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryType, TextNode
 from llama_index.core.tools.query_engine import QueryEngineTool
+from llama_index.core.types import RESPONSE_TEXT_TYPE
+from llama_index.core.workflow import Context, StartEvent, StopEvent, Workflow, step
+
+if TYPE_CHECKING:
+    from _typeshed import DataclassInstance
+    # The agent modules are imported by the first run, loading the workflow doesn't need them
+    from llama_index.core.agent.workflow import AgentWorkflow
 
 
 # Used as a prompt for synthesizer
@@ -63,18 +77,210 @@ class NodeCitationProcessor(BaseNodePostprocessor):
         return nodes
 
 
+CITATION_PATTERN = re.compile(r"\[citation:\s*([^\]\s]+)\s*\]")
+
+
+@dataclass
+class PackedContext:
+    # The nodes for the prompt, with their alias as citation_id
+    nodes: List[NodeWithScore]
+    # The retrieved nodes that are in the prompt
+    source_nodes: List[NodeWithScore]
+    # Alias -> node id
+    aliases: Dict[str, str]
+
+    def resolve(self, text: str) -> str:
+        """Replace the aliases in the citations of a response with the node ids"""
+        return CITATION_PATTERN.sub(
+            lambda match: f"[citation:{self.aliases.get(match.group(1), match.group(1))}]", text
+        )
+
+
+class CitationContextPacker:
+    """
+    Prepare the retrieved nodes for the citation prompt:
+
+    - each node gets a short citation id for this request ("1", "2", ...) instead of its UUID,
+      which is mapped back to the node id in the response, so the UI still gets the node ids
+    - the text that overlaps with a node of the same document that is already in the context
+      (the chunk overlap of the splitter) is removed, duplicated nodes are dropped
+    - nodes are added in the order of their score until the token budget is reached
+
+    Args:
+        max_tokens (optional): Token budget of the context, 0 for no limit (CITATION_CONTEXT_TOKENS, default: 0).
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        self.max_tokens = max_tokens if max_tokens is not None else int(os.getenv("CITATION_CONTEXT_TOKENS", 0))
+
+    def pack(self, nodes: Sequence[NodeWithScore]) -> PackedContext:
+        tokenizer = Settings.tokenizer
+        context = PackedContext(nodes=[], source_nodes=[], aliases={})
+        # Character ranges in the context per document
+        spans: Dict[str, List[Tuple[int, int]]] = {}
+        texts = set()
+        tokens = 0
+        for node_score in nodes:
+            node = node_score.node
+            text = self._without_overlap(node, spans)
+            if text is None or (text and text in texts):
+                continue
+            alias = str(len(context.aliases) + 1)
+            if isinstance(node, TextNode):
+                node = node.model_copy(update={"text": text, "metadata": {**node.metadata, "citation_id": alias}})
+            if self.max_tokens:
+                size = len(tokenizer(node.get_content(metadata_mode=MetadataMode.LLM)))
+                if tokens + size > self.max_tokens:
+                    continue
+                tokens += size
+            texts.add(text)
+            source = node_score.node
+            if isinstance(source, TextNode) and source.ref_doc_id and source.start_char_idx is not None:
+                spans.setdefault(source.ref_doc_id, []).append((source.start_char_idx, source.end_char_idx))
+            context.aliases[alias] = node_score.node.node_id
+            context.nodes.append(NodeWithScore(node=node, score=node_score.score))
+            context.source_nodes.append(node_score)
+        return context
+
+    @staticmethod
+    def _without_overlap(node: BaseNode, spans: Dict[str, List[Tuple[int, int]]]) -> Optional[str]:
+        """The text of the node without the parts in the context, None if it's completely in the context"""
+        if not isinstance(node, TextNode):
+            # Only text nodes have character ranges
+            return node.get_content(metadata_mode=MetadataMode.NONE)
+        text = node.text
+        start, end = node.start_char_idx, node.end_char_idx
+        if start is None or end is None or end - start != len(text):
+            return text
+        head, tail = 0, len(text)
+        for span_start, span_end in spans.get(node.ref_doc_id, []):
+            if span_start <= start and end <= span_end:
+                return None
+            if span_start <= start < span_end:
+                head = max(head, span_end - start)
+            elif start < span_start < end <= span_end:
+                tail = min(tail, span_start - start)
+        return text[head:tail] if head < tail else None
+
+
 class CitationSynthesizer(Accumulate):
     """
     Overload the Accumulate synthesizer to:
     1. Update prepare node metadata for citation id
     2. Update text_qa_template to include citations
+    3. Run the LLM calls of the chunks concurrently, at most `concurrency` at a time
+    4. Pack the nodes into the prompt with short citation ids, see `CitationContextPacker`
+
+    Args:
+        mode (optional): "accumulate" to make one LLM call per chunk, or "compact" to pack several
+            chunks into one prompt of up to `max_prompt_tokens` (CITATION_MODE, default: "accumulate").
+        concurrency (optional): Number of LLM calls running at the same time (CITATION_CONCURRENCY, default: 4).
+        max_prompt_tokens (optional): Token budget of a prompt in compact mode (CITATION_PROMPT_TOKENS, default: 4000).
+        packer (optional): Prepares the nodes for the prompt, defaults to a `CitationContextPacker`.
     """
 
-    def __init__(self, **kwargs: Any) -> None:
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        max_prompt_tokens: Optional[int] = None,
+        packer: Optional[CitationContextPacker] = None,
+        **kwargs: Any,
+    ) -> None:
         text_qa_template = kwargs.pop("text_qa_template", None)
         if text_qa_template is None:
             text_qa_template = PromptTemplate(template=CITATION_PROMPT)
         super().__init__(text_qa_template=text_qa_template, **kwargs)
+        self._mode = mode or os.getenv("CITATION_MODE", "accumulate")
+        if self._mode not in ("accumulate", "compact"):
+            raise ValueError(f"Invalid citation mode: {self._mode}")
+        self._concurrency = concurrency or int(os.getenv("CITATION_CONCURRENCY", 4))
+        self._max_prompt_tokens = max_prompt_tokens or int(os.getenv("CITATION_PROMPT_TOKENS", 4000))
+        self._packer = packer or CitationContextPacker()
+
+    def _resolve(
+        self,
+        response: RESPONSE_TYPE,
+        context: PackedContext,
+        additional_source_nodes: Optional[Sequence[NodeWithScore]],
+    ) -> RESPONSE_TYPE:
+        if isinstance(response, Response) and context.nodes:
+            if response.response:
+                response.response = context.resolve(response.response)
+            response.source_nodes = context.source_nodes + list(additional_source_nodes or [])
+        return response
+
+    def synthesize(
+        self,
+        query: QueryType,
+        nodes: List[NodeWithScore],
+        additional_source_nodes: Optional[Sequence[NodeWithScore]] = None,
+        **response_kwargs: Any,
+    ) -> RESPONSE_TYPE:
+        context = self._packer.pack(nodes)
+        response = super().synthesize(query, context.nodes, additional_source_nodes, **response_kwargs)
+        return self._resolve(response, context, additional_source_nodes)
+
+    async def asynthesize(
+        self,
+        query: QueryType,
+        nodes: List[NodeWithScore],
+        additional_source_nodes: Optional[Sequence[NodeWithScore]] = None,
+        **response_kwargs: Any,
+    ) -> RESPONSE_TYPE:
+        context = self._packer.pack(nodes)
+        response = await super().asynthesize(query, context.nodes, additional_source_nodes, **response_kwargs)
+        return self._resolve(response, context, additional_source_nodes)
+
+    def _prompt_chunks(self, query_str: str, text_chunks: Sequence[str]) -> List[str]:
+        """The context of each prompt: one chunk, or in compact mode as many chunks as fit in the budget"""
+        if self._mode != "compact":
+            return list(text_chunks)
+        tokenizer = Settings.tokenizer
+        template = self._text_qa_template.partial_format(query_str=query_str)
+        budget = self._max_prompt_tokens - len(tokenizer(template.format(context_str="")))
+        packed: List[str] = []
+        current: List[str] = []
+        size = 0
+        for chunk in text_chunks:
+            tokens = len(tokenizer(chunk))
+            if current and size + tokens > budget:
+                packed.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(chunk)
+            size += tokens
+        if current:
+            packed.append("\n\n".join(current))
+        return packed
+
+    async def aget_response(
+        self,
+        query_str: str,
+        text_chunks: Sequence[str],
+        separator: str = "\n---------------------\n",
+        **response_kwargs: Any,
+    ) -> RESPONSE_TEXT_TYPE:
+        if self._streaming:
+            raise ValueError("Unable to stream in Accumulate response mode")
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def respond(chunk: str) -> List[Any]:
+            # Responses of a prompt that doesn't fit the context window of the LLM are split
+            async with semaphore:
+                calls = self._give_responses(query_str, chunk, use_async=True, **response_kwargs)
+                return list(await asyncio.gather(*calls))
+
+        responses = await asyncio.gather(*map(respond, self._prompt_chunks(query_str, text_chunks)))
+        return self._format_response([output for outputs in responses for output in outputs], separator)
+
+    def get_response(
+        self,
+        query_str: str,
+        text_chunks: Sequence[str],
+        separator: str = "\n---------------------\n",
+        **response_kwargs: Any,
+    ) -> RESPONSE_TEXT_TYPE:
+        return asyncio_run(self.aget_response(query_str, text_chunks, separator, **response_kwargs))
 
 
 # Add this prompt to your agent system prompt
@@ -104,3 +310,102 @@ def enable_citation(query_engine_tool: QueryEngineTool) -> QueryEngineTool:
     # Update tool metadata
     query_engine_tool.metadata.description += "\nThe output will include citations with the format [citation:id] for each chunk of information in the knowledge base."
     return query_engine_tool
+
+
+CITATION_PREFIX = "[citation:"
+# Longest citation marker that is buffered while it's incomplete, e.g. [citation:<uuid>]
+MAX_CITATION_LENGTH = 128
+
+
+class StreamingCitationResolver:
+    """
+    Find the `[citation:id]` markers in a stream of text deltas and return the cited nodes as soon
+    as their marker is complete. A marker can be split across deltas, so the end of the text that
+    can still become a marker is kept until the next delta. Each node is returned once.
+    """
+
+    def __init__(self) -> None:
+        self.nodes: Dict[str, NodeWithScore] = {}
+        self.cited: set = set()
+        self._pending = ""
+
+    def add_nodes(self, nodes: Iterable[NodeWithScore]) -> None:
+        """Add nodes that can be cited, e.g. the source nodes of a query tool response"""
+        for node in nodes:
+            self.nodes[node.node.node_id] = node
+
+    def feed(self, delta: str) -> List[NodeWithScore]:
+        """The nodes whose citation markers were completed by the delta"""
+        text = self._pending + delta
+        cited = []
+        end = 0
+        for match in CITATION_PATTERN.finditer(text):
+            end = match.end()
+            node_id = match.group(1)
+            if node_id in self.nodes and node_id not in self.cited:
+                self.cited.add(node_id)
+                cited.append(self.nodes[node_id])
+        self._pending = ""
+        start = text.rfind("[", end)
+        if start != -1:
+            tail = text[start:]
+            if len(tail) <= MAX_CITATION_LENGTH and "]" not in tail and (
+                CITATION_PREFIX.startswith(tail) or tail.startswith(CITATION_PREFIX)
+            ):
+                self._pending = tail
+        return cited
+
+
+def without_source_nodes(event: Any) -> Any:
+    """A copy of a tool result event whose raw output has no source nodes, the agent keeps the original"""
+    raw_output = event.tool_output.raw_output
+    if is_dataclass(raw_output) and not isinstance(raw_output, type):
+        raw_output = replace(cast("DataclassInstance", raw_output), source_nodes=[])
+    else:
+        raw_output = raw_output.model_copy(update={"source_nodes": []})
+    tool_output = event.tool_output.model_copy(update={"raw_output": raw_output})
+    return event.model_copy(update={"tool_output": tool_output})
+
+
+class CitationWorkflow(Workflow):
+    """
+    Run an agent and send a sources part (`SourceNodesEvent`) for each node as soon as the answer
+    cites it, so the UI shows the sources while the answer is streamed and only gets the cited nodes.
+    The events of the agent are forwarded, without the source nodes of the tool results, which the
+    UI would otherwise show as sources too.
+
+    Args:
+        agent: The agent, or a function returning it, called by each run, e.g. to get a shared
+            agent that is created by the first run.
+    """
+
+    def __init__(self, agent: Union["AgentWorkflow", Callable[[], "AgentWorkflow"]], **kwargs: Any) -> None:
+        # The agent has its own timeout
+        kwargs.setdefault("timeout", None)
+        super().__init__(**kwargs)
+        self.agent = agent
+
+    @step
+    async def run_agent(self, ctx: Context, ev: StartEvent) -> StopEvent:
+        from llama_index.core.agent.workflow import AgentStream, ToolCallResult
+
+        agent = self.agent() if callable(self.agent) else self.agent
+        handler = agent.run(**dict(ev.items()))
+        resolver = StreamingCitationResolver()
+        try:
+            async for event in handler.stream_events():
+                if isinstance(event, ToolCallResult):
+                    source_nodes = getattr(event.tool_output.raw_output, "source_nodes", None)
+                    if source_nodes:
+                        resolver.add_nodes(source_nodes)
+                        event = without_source_nodes(event)
+                ctx.write_event_to_stream(event)
+                if isinstance(event, AgentStream) and event.delta:
+                    for node in resolver.feed(event.delta):
+                        ctx.write_event_to_stream(SourceNodesEvent(nodes=[node]))
+            result = await handler
+        finally:
+            # The run was cancelled or failed, don't leave the agent running
+            if not handler.done():
+                await handler.cancel_run()
+        return StopEvent(result=result)
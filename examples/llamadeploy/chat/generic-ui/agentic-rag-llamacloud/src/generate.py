@@ -6,18 +6,19 @@ load_dotenv()
 
 import logging
 
-from llama_index.core.readers import SimpleDirectoryReader
-from tqdm import tqdm
-
-from src.index import get_index
-from src.service import LLamaCloudFileService
-from src.settings import init_settings
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 
 def generate_index():
+    # Imported when the index is generated, not when the module is loaded
+    from llama_index.core.readers import SimpleDirectoryReader
+    from tqdm import tqdm
+
+    from src.index import get_index
+    from src.service import LLamaCloudFileService
+    from src.settings import init_settings
+
     init_settings()
     logger.info("Generate index for the provided data")
 
@@ -2,13 +2,8 @@ import logging
 import os
 from typing import Optional
 
-from llama_cloud import PipelineType
 from llama_index.core.callbacks import CallbackManager
-from llama_index.core.ingestion.api_utils import (
-    get_client as llama_cloud_get_client,
-)
 from llama_index.core.settings import Settings
-from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
 from pydantic import BaseModel, Field, field_validator
 
 logger = logging.getLogger("uvicorn")
@@ -88,6 +83,9 @@ def get_index(
     config: IndexConfig = None,
     create_if_missing: bool = False,
 ):
+    # The LlamaCloud client is imported when the index is first loaded
+    from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
+
     if config is None:
         config = IndexConfig()
     # Check whether the index exists
@@ -104,6 +102,10 @@ def get_index(
 
 
 def get_client():
+    from llama_index.core.ingestion.api_utils import (
+        get_client as llama_cloud_get_client,
+    )
+
     config = LlamaCloudConfig()
     return llama_cloud_get_client(**config.to_client_kwargs())
 
@@ -111,6 +113,8 @@ def get_client():
 def _create_index(
     config: IndexConfig,
 ):
+    from llama_cloud import PipelineType
+
     client = get_client()
     pipeline_name = config.llama_cloud_pipeline_config.pipeline
 
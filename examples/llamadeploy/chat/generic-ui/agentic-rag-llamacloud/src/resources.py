@@ -0,0 +1,98 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger("uvicorn")
+
+
+class ResourceRegistry:
+    """
+    Resources shared by all workflow runs of a process, e.g. the index and the LLM and embedding
+    clients with their HTTP connection pools. A resource is created on first use, or before the
+    first request by `warm_up`.
+
+    Resources that are fork-safe (read-only data without open connections) are inherited by
+    forked worker processes and their pages are shared. The other resources (e.g. clients with open
+    connections) are dropped in the child process and created again on first use.
+    """
+
+    def __init__(self) -> None:
+        self._factories: Dict[str, Tuple[Callable[[], Any], bool]] = {}
+        self._resources: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, name: str, factory: Callable[[], Any], fork_safe: bool = False) -> None:
+        with self._lock:
+            self._factories[name] = (factory, fork_safe)
+            self._resources.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        # Double-checked, so reading a created resource doesn't take the lock
+        if name in self._resources:
+            return self._resources[name]
+        with self._lock:
+            if name not in self._resources:
+                factory, _ = self._factories[name]
+                self._resources[name] = factory()
+            return self._resources[name]
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """Create the resources (default: all) and return how long each one took"""
+        durations = {}
+        for name in names if names is not None else list(self._factories):
+            start = time.perf_counter()
+            self.get(name)
+            durations[name] = time.perf_counter() - start
+            logger.info(f"Warmed up {name} in {durations[name]:.2f}s")
+        return durations
+
+    def warm_up_from_env(self) -> Dict[str, float]:
+        """Warm up the resources listed in WARM_UP (comma-separated, or "all"), e.g. set in llama_deploy.yml"""
+        value = os.getenv("WARM_UP", "").strip()
+        if not value:
+            return {}
+        return self.warm_up(None if value == "all" else [name.strip() for name in value.split(",")])
+
+    def _after_fork(self) -> None:
+        self._lock = threading.RLock()
+        self._resources = {
+            name: resource for name, resource in self._resources.items() if self._factories[name][1]
+        }
+
+
+def _init_settings() -> Any:
+    from dotenv import load_dotenv
+    from llama_index.core.settings import Settings
+
+    from src.settings import init_settings
+
+    load_dotenv()
+    init_settings()
+    return Settings
+
+
+def _get_index() -> Any:
+    from src.index import get_index
+
+    registry.get("settings")
+    index = get_index()
+    if index is None:
+        raise RuntimeError(
+            "Index not found! Please run `uv run generate` to index the data first."
+        )
+    return index
+
+
+def _open_connections() -> None:
+    # Opens the connection pool of the embedding client, which is used by every query
+    registry.get("settings").embed_model.get_query_embedding("warm up")
+
+
+registry = ResourceRegistry()
+registry.register("settings", _init_settings)
+# The LlamaCloud index holds an HTTP client, so it isn't fork-safe
+registry.register("index", _get_index)
+registry.register("connections", _open_connections)
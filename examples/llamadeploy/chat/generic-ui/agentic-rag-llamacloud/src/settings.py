@@ -1,11 +1,13 @@
 import os
 
 from llama_index.core import Settings
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
 
 
 def init_settings():
+    # Imported on first use, the OpenAI packages take about half a second to import
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    from llama_index.llms.openai import OpenAI
+
     if os.getenv("OPENAI_API_KEY") is None:
         raise RuntimeError("OPENAI_API_KEY is missing in environment variables")
     Settings.llm = OpenAI(model=os.getenv("MODEL") or "gpt-4.1")
@@ -0,0 +1,2 @@
+# Benchmarks for the agentic-rag index, run them from the `agentic-rag` directory, e.g:
+# uv run python -m benchmarks.retrieval
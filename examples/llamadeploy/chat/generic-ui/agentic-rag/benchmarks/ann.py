@@ -0,0 +1,72 @@
+"""
+Benchmark of the approximate IVF index of `src.search.IVFSearch` against exact search:
+recall@k and latency per query for a range of `nprobe`, on memory-mapped embeddings
+drawn around random topics (unlike uniformly random vectors, real embeddings are clustered).
+
+Usage: uv run python -m benchmarks.ann [--nodes 200000] [--dim 256] [--nprobe 1,2,4,8,16,32,64]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.search import ExactSearch, IVFSearch, normalize
+
+
+def clustered_embeddings(count: int, dim: int, topics: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    centers = normalize(rng.standard_normal((topics, dim), dtype=np.float32))
+    vectors = centers[rng.integers(topics, size=count)]
+    vectors += rng.standard_normal((count, dim), dtype=np.float32) * (noise / np.sqrt(dim))
+    return normalize(vectors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--noise", type=float, default=1.3, help="Norm of the noise around a topic")
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists (default: 4 * sqrt(nodes))")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    k = args.top_k
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "embeddings.npy")
+        np.save(path, clustered_embeddings(args.nodes, args.dim, args.topics, args.noise, rng))
+        embeddings = np.load(path, mmap_mode="r")
+        queries = clustered_embeddings(args.queries, args.dim, args.topics, args.noise, np.random.default_rng(0))
+        # Queries are new points around the same topics
+        queries = normalize(queries + rng.standard_normal(queries.shape, dtype=np.float32) * (0.5 / np.sqrt(args.dim)))
+
+        start = time.perf_counter()
+        ivf = IVFSearch.build(embeddings, args.lists or None)
+        ivf.save(tmp_dir)
+        build = time.perf_counter() - start
+        ivf = IVFSearch.load(tmp_dir, embeddings)
+
+        exact = ExactSearch(embeddings)
+        start = time.perf_counter()
+        expected = [exact.search(query[None, :], k)[0][0] for query in queries]
+        exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        print(f"{args.nodes:,} nodes, dim {args.dim}, {len(ivf.centroids)} lists (built in {build:.1f} s), recall@{k}\n")
+        print(f"{'nprobe':>8} {'ms/query':>10} {'recall':>8} {'speedup':>8}")
+        print(f"{'exact':>8} {exact_ms:>10.2f} {1.0:>8.3f} {1.0:>7.1f}x")
+        for nprobe in map(int, args.nprobe.split(",")):
+            ivf.nprobe = nprobe
+            start = time.perf_counter()
+            results = [ivf.search(query[None, :], k)[0][0] for query in queries]
+            ms = (time.perf_counter() - start) / len(queries) * 1000
+            recall = np.mean([len(np.intersect1d(rows, truth)) / k for rows, truth in zip(results, expected)])
+            print(f"{nprobe:>8} {ms:>10.2f} {recall:>8.3f} {exact_ms / ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark of the `CitationSynthesizer` modes against the sequential `Accumulate` synthesizer with a
+mock LLM whose latency grows with the prompt size: latency, LLM calls and prompt tokens for a range
+of top_k. The nodes are consecutive chunks of a document
+(with the overlap of the splitter), `CitationSynthesizer` packs them with `CitationContextPacker`.
+
+Usage: uv run python -m benchmarks.citation [--top-k 1,2,4,8,16,32] [--base-ms 300] [--ms-per-1k-tokens 100]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, List
+
+from llama_index.core import Document, Settings
+from llama_index.core.llms import CompletionResponse, CompletionResponseGen, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.response_synthesizers import Accumulate
+from llama_index.core.schema import NodeWithScore
+
+from src.citation import CITATION_PROMPT, CitationSynthesizer, NodeCitationProcessor
+
+
+class SlowLLM(CustomLLM):
+    """Answers after a delay of `base_ms` plus `ms_per_1k_tokens` per 1000 prompt tokens"""
+
+    base_ms: float = 300
+    ms_per_1k_tokens: float = 100
+    calls: int = 0
+    prompt_tokens: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=128000, num_output=512)
+
+    def _delay(self, prompt: str) -> float:
+        tokens = len(Settings.tokenizer(prompt))
+        self.calls += 1
+        self.prompt_tokens += tokens
+        return (self.base_ms + tokens * self.ms_per_1k_tokens / 1000) / 1000
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self._delay(prompt))
+        return CompletionResponse(text="An answer [citation:id].")
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await asyncio.sleep(self._delay(prompt))
+        return CompletionResponse(text="An answer [citation:id].")
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        raise NotImplementedError()
+
+
+def retrieved_nodes(count: int) -> List[NodeWithScore]:
+    """Consecutive chunks of a report, with their node id as citation id"""
+    text = " ".join(
+        f"In quarter {i % 4 + 1} of year {2000 + i // 4}, the revenue of product line {i % 13} "
+        f"in region {i % 7} was {i * 37 % 1000} million."
+        for i in range(count * 12)
+    )
+    splitter = SentenceSplitter(chunk_size=256, chunk_overlap=64)
+    nodes = splitter.get_nodes_from_documents([Document(text=text)])[:count]
+    return NodeCitationProcessor().postprocess_nodes([NodeWithScore(node=node, score=1.0) for node in nodes])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top-k", default="1,2,4,8,16,32")
+    parser.add_argument("--base-ms", type=float, default=300)
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-prompt-tokens", type=int, default=4000)
+    args = parser.parse_args()
+
+    llm = SlowLLM(base_ms=args.base_ms, ms_per_1k_tokens=args.ms_per_1k_tokens)
+    query = "What was the revenue?"
+    modes = {
+        "sequential": lambda: Accumulate(llm=llm, text_qa_template=PromptTemplate(CITATION_PROMPT)),
+        f"concurrent({args.concurrency})": lambda: CitationSynthesizer(llm=llm, concurrency=args.concurrency),
+        "compact": lambda: CitationSynthesizer(
+            llm=llm, mode="compact", concurrency=args.concurrency, max_prompt_tokens=args.max_prompt_tokens
+        ),
+    }
+
+    print(
+        f"mock LLM: {args.base_ms:.0f} ms + {args.ms_per_1k_tokens:.0f} ms per 1k prompt tokens; "
+        "seconds (LLM calls, prompt tokens)\n"
+    )
+    header = f"{'top_k':>6}" + "".join(f"{name:>26}" for name in modes)
+    print(header)
+    for top_k in map(int, args.top_k.split(",")):
+        nodes = retrieved_nodes(top_k)
+        row = f"{top_k:>6}"
+        for create in modes.values():
+            synthesizer = create()
+            llm.calls = llm.prompt_tokens = 0
+            start = time.perf_counter()
+            synthesizer.synthesize(query, nodes)
+            row += f"{time.perf_counter() - start:>11.2f} ({llm.calls:>2}, {llm.prompt_tokens:>6,})"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark of the cold start of the workflow service: each run starts a new Python process, imports
+`src.workflow` (what LlamaDeploy does when the deployment is created) and warms up the resources
+that the first request needs. Reports the median time of each phase for:
+
+- fresh: a new interpreter, nothing imported yet
+- apiserver: `llama_index.core` is imported before, like in the LlamaDeploy apiserver
+- eager: also imports the OpenAI and agent modules at load, as the workflow did before they were
+  imported lazily
+
+With --trace, logs the slowest packages and modules of one more run (see `src.startup.ImportProfiler`).
+Run `uv run generate` first to include the index in the warm-up.
+
+Usage: uv run python -m benchmarks.cold_start [--runs 5] [--warm-up settings,index,agent] [--trace]
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# The modules imported before the workflow (not measured) and with it
+SCENARIOS = {
+    "fresh": ([], []),
+    "apiserver": (["llama_index.core"], []),
+    "eager": (
+        ["llama_index.core"],
+        ["llama_index.llms.openai", "llama_index.embeddings.openai", "llama_index.core.agent.workflow"],
+    ),
+}
+
+
+def child(scenario: str, warm_up: List[str], trace: bool) -> None:
+    """Runs in the new process: prints the seconds of each phase as JSON"""
+    import importlib
+
+    preloaded, eager = SCENARIOS[scenario]
+    for module in preloaded:
+        importlib.import_module(module)
+    if trace:
+        # The workflow module logs the report, including the warm-up
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        os.environ.update(STARTUP_PROFILE="true", WARM_UP=",".join(warm_up))
+
+    start = time.perf_counter()
+    for module in eager:
+        importlib.import_module(module)
+    importlib.import_module("src.workflow")
+    phases = {"import": time.perf_counter() - start}
+
+    from src.resources import registry
+
+    phases.update(registry.warm_up(warm_up))
+    phases["total"] = time.perf_counter() - start
+    print(json.dumps(phases))
+
+
+def run(scenario: str, warm_up: List[str], trace: bool = False) -> Dict[str, float]:
+    # WARM_UP is cleared, so the import doesn't include the warm-up
+    env = {**os.environ, "WARM_UP": "", "STARTUP_PROFILE": ""}
+    command = [sys.executable, "-W", "ignore", "-m", "benchmarks.cold_start", "--child", scenario]
+    command += ["--warm-up", ",".join(warm_up)] + (["--trace"] if trace else [])
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"The {scenario} run failed:\n{result.stderr}")
+    if trace:
+        print(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="Processes started per scenario")
+    parser.add_argument("--warm-up", default="settings,index,agent", help="Comma-separated resources to warm up")
+    parser.add_argument("--trace", action="store_true", help="Log the import time of each module of one run")
+    parser.add_argument("--child", choices=list(SCENARIOS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    warm_up = [name for name in args.warm_up.split(",") if name]
+
+    if args.child:
+        child(args.child, warm_up, args.trace)
+        return
+
+    from src.index import STORAGE_DIR
+
+    if not os.path.exists(STORAGE_DIR) and ("index" in warm_up or "agent" in warm_up):
+        warm_up = [name for name in warm_up if name not in ("index", "agent")]
+        print("No index found, run `uv run generate` to include the index and the agent in the warm-up\n")
+
+    columns = ["import"] + warm_up + ["total"]
+    print(f"median of {args.runs} runs; ms per phase\n")
+    print(f"{'scenario':>10} " + " ".join(f"{column:>10}" for column in columns))
+    for scenario in SCENARIOS:
+        runs = [run(scenario, warm_up) for _ in range(args.runs)]
+        medians = [statistics.median(phases[column] for phases in runs) * 1000 for column in columns]
+        print(f"{scenario:>10} " + " ".join(f"{median:>10.0f}" for median in medians))
+
+    if args.trace:
+        print()
+        run("fresh", warm_up, trace=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark of the top-k retrieval of `src.search.ExactSearch` on random memory-mapped embeddings:
+the per-query latency of the Python scoring of the default `SimpleVectorStore`, of scoring with
+NumPy and sorting all scores, of `ExactSearch` (argpartition) and of `ExactSearch` with batches
+of queries. Checks that `ExactSearch` returns the same rows as a full sort.
+
+Usage: uv run python -m benchmarks.retrieval [--sizes 10000,100000,1000000] [--dim 256] [--top-k 10]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, List
+
+import numpy as np
+from llama_index.core.indices.query.embedding_utils import get_top_k_embeddings
+
+from src.search import ExactSearch, normalize
+
+
+def random_embeddings(count: int, dim: int, path: str, seed: int = 0) -> np.ndarray:
+    """Normalized random embeddings saved to `path` and memory-mapped, like the served index"""
+    rng = np.random.default_rng(seed)
+    matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(count, dim))
+    for start in range(0, count, 100_000):
+        end = min(start + 100_000, count)
+        matrix[start:end] = normalize(rng.standard_normal((end - start, dim), dtype=np.float32))
+    matrix.flush()
+    del matrix
+    return np.load(path, mmap_mode="r")
+
+
+def per_query_ms(run: Callable[[], None], queries: int, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best / queries * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated numbers of nodes")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=32)
+    parser.add_argument("--batch", type=int, default=8, help="Queries per batch")
+    parser.add_argument(
+        "--python-max", type=int, default=100_000, help="Largest index for the Python scoring, which is slow"
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    queries = normalize(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+    k = args.top_k
+
+    print(f"dim {args.dim}, top-k {k}, {args.queries} queries, batches of {args.batch}; ms per query\n")
+    print(f"{'nodes':>10} {'python':>10} {'full sort':>10} {'exact':>10} {'batched':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in map(int, args.sizes.split(",")):
+            path = os.path.join(tmp_dir, f"embeddings-{count}.npy")
+            embeddings = random_embeddings(count, args.dim, path)
+            search = ExactSearch(embeddings)
+
+            expected: List[np.ndarray] = []
+
+            def full_sort() -> None:
+                expected.clear()
+                for query in queries:
+                    expected.append(np.argsort(-(embeddings @ query))[:k])
+
+            def exact() -> None:
+                for query in queries:
+                    search.search(query[None, :], k)
+
+            def batched() -> None:
+                for start in range(0, len(queries), args.batch):
+                    search.search(queries[start : start + args.batch], k)
+
+            python = "-"
+            if count <= args.python_max:
+                vectors = embeddings.tolist()
+                ids = list(range(count))
+                python_queries = queries[:4].tolist()
+
+                def python_scoring() -> None:
+                    for query in python_queries:
+                        get_top_k_embeddings(query, vectors, similarity_top_k=k, embedding_ids=ids)
+
+                python = f"{per_query_ms(python_scoring, len(python_queries), repeat=1):.2f}"
+                del vectors
+
+            sort_ms = per_query_ms(full_sort, len(queries))
+            exact_ms = per_query_ms(exact, len(queries))
+            batched_ms = per_query_ms(batched, len(queries))
+            results = search.search(queries, k)
+            for (rows, _), rows_expected in zip(results, expected):
+                assert np.array_equal(rows, rows_expected), "ExactSearch differs from a full sort"
+
+            print(f"{count:>10,} {python:>10} {sort_ms:>10.2f} {exact_ms:>10.2f} {batched_ms:>10.2f}")
+            del search, embeddings
+
+
+if __name__ == "__main__":
+    main()
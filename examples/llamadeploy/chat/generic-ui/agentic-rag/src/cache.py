@@ -0,0 +1,219 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from llama_index.core import QueryBundle
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.indices.base import BaseIndex
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.settings import Settings
+
+logger = logging.getLogger("uvicorn")
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+# The id of the index, the normalized query text and the retrieval parameters
+ResultKey = Tuple[str, str, Hashable]
+# The embedding model and the query texts
+EmbeddingKey = Tuple[str, Tuple[str, ...]]
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[K, V]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: K) -> Optional[V]:
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def remove(self, predicate: Callable[[K], bool]) -> None:
+        """Remove the items whose key matches the predicate"""
+        for key in [key for key in self._items if predicate(key)]:
+            del self._items[key]
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+class QueryCache:
+    """
+    Caches of the query tools, shared by all workflows of a process:
+
+    - the embeddings of the query texts, per embedding model
+    - the retrieved nodes, keyed by the id of the index, the normalized query text, top_k and filters.
+      The nodes of an index are dropped when its version changes, see `index_version`.
+
+    The hit rates are returned by `stats` and logged every `log_every` retrievals.
+    """
+
+    def __init__(self, max_embeddings: int = 1024, max_results: int = 1024, log_every: int = 100):
+        self.embeddings: LRUCache[EmbeddingKey, List[float]] = LRUCache(max_embeddings)
+        self.results: LRUCache[ResultKey, List[NodeWithScore]] = LRUCache(max_results)
+        self.log_every = log_every
+        self._index_versions: Dict[str, str] = {}
+
+    def check_index_version(self, index_id: str, version: str) -> None:
+        """Drop the cached results of the index if it changed since they were cached"""
+        known = self._index_versions.get(index_id)
+        if version != known:
+            if known is not None:
+                self.results.remove(lambda key: key[0] == index_id)
+            self._index_versions[index_id] = version
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embedding_hits": self.embeddings.hits,
+            "embedding_misses": self.embeddings.misses,
+            "embedding_hit_rate": self.embeddings.hit_rate,
+            "retrieval_hits": self.results.hits,
+            "retrieval_misses": self.results.misses,
+            "retrieval_hit_rate": self.results.hit_rate,
+        }
+
+    def log_stats(self) -> None:
+        lookups = self.results.hits + self.results.misses
+        if self.log_every and lookups % self.log_every == 0:
+            stats = self.stats()
+            logger.info(
+                f"Query cache: {lookups} retrievals, retrieval hit rate {stats['retrieval_hit_rate']:.1%}, "
+                f"embedding hit rate {stats['embedding_hit_rate']:.1%}"
+            )
+
+
+_query_cache: Optional[QueryCache] = None
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """The query cache of the process, None if disabled with QUERY_CACHE_SIZE=0"""
+    global _query_cache
+    size = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+    if size <= 0:
+        return None
+    if _query_cache is None:
+        _query_cache = QueryCache(max_embeddings=size, max_results=size)
+    return _query_cache
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def index_version(index: BaseIndex) -> str:
+    """
+    A version of the index that changes on every write. The memory-mapped store has a version
+    per written index. Otherwise it's the number of nodes and the id of the last one: inserted
+    nodes get new ids and are added last, also when a file is re-indexed, so updates that keep
+    the number of nodes change it too. Unlike hashing all ids, it doesn't grow with the index.
+    """
+    version = getattr(getattr(index, "vector_store", None), "version", None)
+    if version is not None:
+        return version
+    nodes_dict = index.index_struct.nodes_dict
+    last = next(reversed(nodes_dict), "")
+    return f"{len(nodes_dict)}:{last}"
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Wrap the retriever of an index to look up the query in a `QueryCache` first.
+    On a miss, the query embedding is looked up separately, since queries with other
+    retrieval parameters share it.
+
+    Args:
+        retriever: The retriever of the index.
+        index: The index, to key the cached results and to invalidate them when it changes.
+        cache: The cache.
+        params: The retrieval parameters that are part of the cache key, e.g. top_k and filters.
+        embed_model (optional): The embedding model of the index, defaults to `Settings.embed_model`.
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        index: BaseIndex,
+        cache: QueryCache,
+        params: Hashable = None,
+        embed_model: Optional[BaseEmbedding] = None,
+    ):
+        super().__init__(callback_manager=retriever.callback_manager)
+        self._retriever = retriever
+        self._index = index
+        self._index_id = index.index_struct.index_id
+        self._cache = cache
+        self._params = params
+        self._embed_model = embed_model or Settings.embed_model
+
+    def _lookup(self, query_bundle: QueryBundle) -> Optional[List[NodeWithScore]]:
+        self._cache.check_index_version(self._index_id, index_version(self._index))
+        key = self._result_key(query_bundle)
+        nodes = self._cache.results.get(key)
+        self._cache.log_stats()
+        if nodes is None:
+            return None
+        # The postprocessors can modify the nodes, don't share them with the cache
+        return [NodeWithScore(node=node.node.model_copy(deep=True), score=node.score) for node in nodes]
+
+    def _result_key(self, query_bundle: QueryBundle) -> ResultKey:
+        return (self._index_id, normalize_query(query_bundle.query_str), self._params)
+
+    def _store(self, query_bundle: QueryBundle, nodes: List[NodeWithScore]) -> None:
+        self._cache.results.put(
+            self._result_key(query_bundle), [NodeWithScore(node=node.node.model_copy(deep=True), score=node.score) for node in nodes]
+        )
+
+    def _embedding_key(self, query_bundle: QueryBundle) -> EmbeddingKey:
+        return (self._embed_model.model_name, tuple(query_bundle.embedding_strs))
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        nodes = self._lookup(query_bundle)
+        if nodes is not None:
+            return nodes
+        if query_bundle.embedding is None and query_bundle.embedding_strs:
+            key = self._embedding_key(query_bundle)
+            query_bundle.embedding = self._cache.embeddings.get(key)
+            if query_bundle.embedding is None:
+                query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+                self._cache.embeddings.put(key, query_bundle.embedding)
+        nodes = self._retriever.retrieve(query_bundle)
+        self._store(query_bundle, nodes)
+        return nodes
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        nodes = self._lookup(query_bundle)
+        if nodes is not None:
+            return nodes
+        if query_bundle.embedding is None and query_bundle.embedding_strs:
+            key = self._embedding_key(query_bundle)
+            query_bundle.embedding = self._cache.embeddings.get(key)
+            if query_bundle.embedding is None:
+                query_bundle.embedding = await self._embed_model.aget_agg_embedding_from_queries(
+                    query_bundle.embedding_strs
+                )
+                self._cache.embeddings.put(key, query_bundle.embedding)
+        nodes = await self._retriever.aretrieve(query_bundle)
+        self._store(query_bundle, nodes)
+        return nodes
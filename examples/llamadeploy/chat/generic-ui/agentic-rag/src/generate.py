@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 
@@ -10,28 +11,68 @@ logger = logging.getLogger()
 def generate_index():
     """
     Index the documents in the data directory.
+    The files are parsed in parallel and embedded in batches. Progress is checkpointed,
+    so an interrupted run continues where it stopped when it's started again.
+    If an index exists, only the files that changed since the last run are re-indexed,
+    set INGEST_FULL=true to rebuild the whole index.
     """
-    from src.index import STORAGE_DIR
+    from src.index import MMAP_DIR, STORAGE_DIR, load_storage_index, persist_index
+    from src.ingestion import IngestionConfig, Manifest, ingest, list_files
+    from src.vector_store import MmapVectorStore
     from src.settings import init_settings
+    from llama_index.core import Settings
     from llama_index.core.indices import (
         VectorStoreIndex,
     )
-    from llama_index.core.readers import SimpleDirectoryReader
 
     load_dotenv()
     init_settings()
 
-    logger.info("Creating new index")
-    # load the documents and create the index
-    reader = SimpleDirectoryReader(
-        os.environ.get("DATA_DIR", "ui/data"),
-        recursive=True,
-    )
-    documents = reader.load_data()
-    index = VectorStoreIndex.from_documents(
-        documents,
-        show_progress=True,
+    files = list_files(os.environ.get("DATA_DIR", "ui/data"))
+    full = os.getenv("INGEST_FULL", "false").lower() == "true"
+    manifest = Manifest() if full else Manifest.load(STORAGE_DIR)
+    index = load_storage_index() if manifest.files else None
+    if index is None:
+        manifest = Manifest()
+    diff = manifest.diff(files)
+    if index is not None and not diff.changed and not diff.removed:
+        if not MmapVectorStore.exists(MMAP_DIR):
+            persist_index(index)
+        Manifest(diff.files).save(STORAGE_DIR)
+        logger.info("Index is up to date")
+        return
+
+    config = IngestionConfig.from_env(
+        chunk_size=Settings.chunk_size, chunk_overlap=Settings.chunk_overlap
     )
+    # Checkpointed files that were deleted or modified since are dropped before they're resumed
+    changed = {path: diff.files[path].hash for path in diff.changed}
+    checkpoint, error_files = asyncio.run(ingest(changed, Settings.embed_model, config))
+    if error_files:
+        logger.error(f"Failed to parse the following files: {error_files}")
+
+    if index is None:
+        logger.info("Creating new index")
+        index = VectorStoreIndex(nodes=[])
+    else:
+        logger.info(
+            f"Updating index: {len(diff.changed)} changed and {len(diff.removed)} removed files"
+        )
+        for path in diff.changed + diff.removed:
+            for doc_id in manifest.files[path].doc_ids if path in manifest.files else []:
+                index.delete_ref_doc(doc_id, delete_from_docstore=True)
+    # All nodes are embedded already, so adding them to the index doesn't call the embedding model.
+    # They're added one checkpoint batch at a time, not all loaded at once
+    for nodes in checkpoint.load_batches():
+        index.insert_nodes(nodes)
     # store it for later
-    index.storage_context.persist(STORAGE_DIR)
-    logger.info(f"Finished creating new index. Stored in {STORAGE_DIR}")
+    persist_index(index)
+
+    for path, doc_ids in checkpoint.doc_ids().items():
+        diff.files[path].doc_ids = doc_ids
+    # Files that failed are left out of the manifest, so they're retried in the next run
+    for path in error_files:
+        diff.files.pop(path, None)
+    Manifest(diff.files).save(STORAGE_DIR)
+    checkpoint.clear()
+    logger.info(f"Finished indexing. Stored in {STORAGE_DIR}")
@@ -1,16 +1,61 @@
 import logging
 import os
+from typing import Optional
 
-from llama_index.core.indices import load_index_from_storage
+from llama_index.core.indices import VectorStoreIndex, load_index_from_storage
 from llama_index.core.storage import StorageContext
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from src.search import IVFSearch
+from src.vector_store import MmapVectorStore, write_mmap_store
 
 logger = logging.getLogger("uvicorn")
 
 STORAGE_DIR = "src/storage"
+# Memory-mapped copy of the index that is served, the JSON storage is kept to update the index
+MMAP_DIR = os.path.join(STORAGE_DIR, "mmap")
+
+
+def load_vector_store(vector_index: Optional[str] = None, nprobe: Optional[int] = None) -> Optional[MmapVectorStore]:
+    """
+    Load the memory-mapped vector store, None if it doesn't exist.
+
+    Args:
+        vector_index (optional): "exact" or "ivf" for the approximate IVF index (VECTOR_INDEX, default: "exact").
+        nprobe (optional): Clusters searched per query by the IVF index, more is slower with a higher recall (IVF_NPROBE, default: 8).
+    """
+    if not MmapVectorStore.exists(MMAP_DIR):
+        return None
+    vector_index = vector_index or os.getenv("VECTOR_INDEX", "exact")
+    if vector_index == "ivf" and not IVFSearch.exists(MMAP_DIR):
+        logger.warning("No IVF index found, run `uv run generate` with VECTOR_INDEX=ivf. Using exact search")
+        vector_index = "exact"
+    if vector_index == "ivf":
+        nprobe = nprobe or int(os.getenv("IVF_NPROBE", 8))
+    else:
+        nprobe = None
+    logger.info(f"Loading index from {MMAP_DIR} ({vector_index} search)...")
+    return MmapVectorStore(MMAP_DIR, nprobe=nprobe)
 
 
-def get_index():
+def get_index(
+    vector_index: Optional[str] = None,
+    nprobe: Optional[int] = None,
+    vector_store: Optional[MmapVectorStore] = None,
+):
+    """
+    Load the index, from the memory-mapped vector store if it exists (see `load_vector_store`
+    for the arguments), otherwise from the JSON storage.
+    """
     # check if storage already exists
+    vector_store = vector_store or load_vector_store(vector_index, nprobe)
+    if vector_store is not None:
+        return VectorStoreIndex.from_vector_store(vector_store)
+    return load_storage_index()
+
+
+def load_storage_index():
+    """Load the index from the JSON storage, which is needed to modify it"""
     if not os.path.exists(STORAGE_DIR):
         return None
     # load the existing index
@@ -19,3 +64,19 @@ def get_index():
     index = load_index_from_storage(storage_context)
     logger.info(f"Finished loading index from {STORAGE_DIR}")
     return index
+
+
+def persist_index(index: VectorStoreIndex) -> None:
+    """Persist the index to the JSON storage and write its memory-mapped copy"""
+    if not isinstance(index.vector_store, SimpleVectorStore):
+        raise ValueError(f"Can't write the memory-mapped copy of a {type(index.vector_store).__name__}")
+    index.storage_context.persist(STORAGE_DIR)
+    embeddings = index.vector_store.data.embedding_dict
+    nodes = index.docstore.get_nodes(list(index.index_struct.nodes_dict.values()))
+    count = write_mmap_store(
+        ((node, embeddings[node.node_id]) for node in nodes),
+        MMAP_DIR,
+        ivf=os.getenv("VECTOR_INDEX", "exact") == "ivf",
+        ivf_lists=int(os.getenv("IVF_LISTS", 0)) or None,
+    )
+    logger.info(f"Wrote {count} nodes to {MMAP_DIR}")
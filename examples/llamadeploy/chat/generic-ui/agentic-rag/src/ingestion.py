@@ -0,0 +1,335 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.readers import SimpleDirectoryReader
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+logger = logging.getLogger()
+
+CHECKPOINT_DIR = "src/storage_checkpoint"
+
+
+@dataclass
+class IngestionConfig:
+    """
+    Configuration of the ingestion pipeline, set with environment variables.
+
+    Args:
+        workers: Processes that parse the files (INGEST_WORKERS, default: number of CPUs).
+        files_per_checkpoint: Files that are parsed and embedded together and then checkpointed (INGEST_BATCH_FILES).
+        embed_batch_size: Nodes per embedding call (EMBED_BATCH_SIZE).
+        embed_concurrency: Embedding calls running at the same time (EMBED_CONCURRENCY).
+        checkpoint_dir: Directory of the progress of an interrupted run (INGEST_CHECKPOINT_DIR).
+        chunk_size: Chunk size of the sentence splitter.
+        chunk_overlap: Chunk overlap of the sentence splitter.
+    """
+
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    files_per_checkpoint: int = 64
+    embed_batch_size: int = 100
+    embed_concurrency: int = 4
+    checkpoint_dir: str = CHECKPOINT_DIR
+    chunk_size: int = 1024
+    chunk_overlap: int = 200
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "IngestionConfig":
+        default = cls()
+        return cls(
+            workers=int(os.getenv("INGEST_WORKERS", default.workers)),
+            files_per_checkpoint=int(os.getenv("INGEST_BATCH_FILES", default.files_per_checkpoint)),
+            embed_batch_size=int(os.getenv("EMBED_BATCH_SIZE", default.embed_batch_size)),
+            embed_concurrency=int(os.getenv("EMBED_CONCURRENCY", default.embed_concurrency)),
+            checkpoint_dir=os.getenv("INGEST_CHECKPOINT_DIR", default.checkpoint_dir),
+            **kwargs,
+        )
+
+
+def list_files(data_dir: str) -> List[str]:
+    """The files the `SimpleDirectoryReader` would load, without loading them"""
+    reader = SimpleDirectoryReader(data_dir, recursive=True)
+    return [str(path) for path in reader.input_files]
+
+
+def parse_file(path: str, chunk_size: int, chunk_overlap: int) -> List[BaseNode]:
+    """Load a file and split it into nodes. Runs in a worker process"""
+    documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.get_nodes_from_documents(documents)
+
+
+async def embed_nodes(
+    nodes: Sequence[BaseNode],
+    embed_model: BaseEmbedding,
+    batch_size: int,
+    semaphore: asyncio.Semaphore,
+) -> None:
+    """Set the embeddings of the nodes, with at most `semaphore` embedding calls at the same time"""
+
+    async def embed(batch: Sequence[BaseNode]) -> None:
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        async with semaphore:
+            embeddings = await embed_model.aget_text_embedding_batch(texts)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+
+    await asyncio.gather(*(embed(batch) for batch in batched(nodes, batch_size)))
+
+
+class Checkpoint:
+    """
+    Progress of an ingestion run: each batch of files is stored with its embedded nodes in one file,
+    which is written atomically, so a batch is either completely done or redone after an interruption.
+    Each file is stored with the hash of the content it was parsed from, see `prune`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _batch_files(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith("batch-") and name.endswith(".jsonl")
+        )
+
+    def _read(self, path: str) -> Iterator[dict]:
+        with open(path) as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _files(self, path: str) -> Dict[str, dict]:
+        # The first line of a batch lists its files: {path: {"hash": ..., "doc_ids": [...]}}
+        with open(path) as f:
+            return json.loads(f.readline())["files"]
+
+    def files(self) -> Dict[str, dict]:
+        """The content hash and the ids of the documents of each file that is done"""
+        files: Dict[str, dict] = {}
+        for path in self._batch_files():
+            files.update(self._files(path))
+        return files
+
+    def doc_ids(self) -> Dict[str, List[str]]:
+        """The ids of the documents of each file that is done"""
+        return {path: entry["doc_ids"] for path, entry in self.files().items()}
+
+    def done_files(self) -> Set[str]:
+        return set(self.files())
+
+    def save(self, files: Dict[str, dict], nodes: Sequence[BaseNode]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(os.path.join(self.directory, f"batch-{len(self._batch_files()):06d}.jsonl"), files, nodes)
+
+    def _write(self, path: str, files: Dict[str, dict], nodes: Sequence[BaseNode]) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps({"files": files}) + "\n")
+            for node in nodes:
+                f.write(json.dumps(doc_to_json(node)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def prune(self, files: Mapping[str, str]) -> List[str]:
+        """
+        Drop the checkpointed files that aren't in `files` (path -> content hash) or whose content
+        changed since they were checkpointed, with their nodes, so they aren't resumed.
+        Returns the dropped files.
+        """
+        dropped: List[str] = []
+        for path in self._batch_files():
+            entries = self._files(path)
+            # Checkpoints of older versions only have the doc ids of each file, they're redone
+            stale = [
+                name
+                for name, entry in entries.items()
+                if not isinstance(entry, dict) or files.get(name) != entry.get("hash")
+            ]
+            if not stale:
+                continue
+            stale_doc_ids = {
+                doc_id
+                for name in stale
+                for doc_id in (entries[name]["doc_ids"] if isinstance(entries[name], dict) else entries[name])
+            }
+            lines = self._read(path)
+            next(lines)
+            nodes = [node for node in map(json_to_doc, lines) if node.ref_doc_id not in stale_doc_ids]
+            # Emptied batches are kept, the name of the next batch is their number
+            self._write(path, {name: entry for name, entry in entries.items() if name not in stale}, nodes)
+            dropped.extend(stale)
+        return dropped
+
+    def load_nodes(self) -> Iterator[BaseNode]:
+        for batch in self.load_batches():
+            yield from batch
+
+    def load_batches(self) -> Iterator[List[BaseNode]]:
+        """The nodes of each batch, only one batch is in memory at a time"""
+        for path in self._batch_files():
+            lines = self._read(path)
+            next(lines)
+            yield [json_to_doc(line) for line in lines]
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+async def ingest(
+    files: Mapping[str, str],
+    embed_model: BaseEmbedding,
+    config: IngestionConfig,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Tuple[Checkpoint, List[str]]:
+    """
+    Parse the files (path -> content hash) in a process pool and embed their nodes in batches,
+    checkpointing after each batch of files. Files that are done according to the checkpoint are
+    skipped if their content hash is the same, so an interrupted run resumes where it stopped.
+    The checkpoint is left with only the given files. While a batch is embedded, the next batch is parsed.
+    Returns the checkpoint and the files that failed to parse.
+    """
+    checkpoint = checkpoint or Checkpoint(config.checkpoint_dir)
+    dropped = checkpoint.prune(files)
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} files from the checkpoint that were deleted or modified since")
+    done = checkpoint.done_files()
+    pending = [path for path in files if path not in done]
+    if done:
+        logger.info(f"Resuming ingestion: {len(done)} files done, {len(pending)} to go")
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(config.embed_concurrency)
+    failed: List[str] = []
+
+    with ProcessPoolExecutor(max_workers=config.workers) as pool:
+
+        def parse(batch: Sequence[str]) -> "asyncio.Future[list]":
+            futures = [
+                loop.run_in_executor(pool, parse_file, path, config.chunk_size, config.chunk_overlap)
+                for path in batch
+            ]
+            return asyncio.gather(*futures, return_exceptions=True)
+
+        batches = batched(pending, config.files_per_checkpoint)
+        batch = next(batches, None)
+        parsing = parse(batch) if batch else None
+        processed = 0
+        while batch:
+            results = await parsing
+            next_batch = next(batches, None)
+            # Parse the next batch while this one is embedded
+            parsing = parse(next_batch) if next_batch else None
+
+            nodes: List[BaseNode] = []
+            parsed: Dict[str, Dict[str, Any]] = {}
+            for path, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"Error parsing file {path}: {result}")
+                    failed.append(path)
+                else:
+                    doc_ids = sorted({node.ref_doc_id for node in result if node.ref_doc_id})
+                    parsed[path] = {"hash": files[path], "doc_ids": doc_ids}
+                    nodes.extend(result)
+            await embed_nodes(nodes, embed_model, config.embed_batch_size, semaphore)
+            checkpoint.save(parsed, nodes)
+
+            processed += len(batch)
+            logger.info(f"Ingested {processed}/{len(pending)} files ({len(nodes)} nodes in the last batch)")
+            batch = next_batch
+
+    return checkpoint, failed
+
+
+@dataclass
+class FileState:
+    mtime: float
+    size: int
+    hash: str
+    # Ids of the documents of the file in the index
+    doc_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ManifestDiff:
+    # New and modified files, to be parsed and embedded
+    changed: List[str]
+    # Files that don't exist anymore
+    removed: List[str]
+    # The current state of all files, without the doc ids of changed files
+    files: Dict[str, FileState]
+
+
+class Manifest:
+    """
+    The state of each indexed file (mtime, size, content hash and the ids of its documents),
+    to only re-index the files that changed. Files whose mtime and size didn't change aren't read,
+    so computing the changes scales with the size of the change, not with the corpus.
+    """
+
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, files: Optional[Dict[str, FileState]] = None):
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, directory: str) -> "Manifest":
+        path = os.path.join(directory, cls.FILE_NAME)
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            data = json.load(f)
+        return cls({name: FileState(**state) for name, state in data["files"].items()})
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.FILE_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"files": {name: asdict(state) for name, state in self.files.items()}}, f)
+        os.replace(path + ".tmp", path)
+
+    def diff(self, paths: Iterable[str]) -> ManifestDiff:
+        changed: List[str] = []
+        files: Dict[str, FileState] = {}
+        for path in paths:
+            stat = os.stat(path)
+            known = self.files.get(path)
+            if known is not None and known.mtime == stat.st_mtime and known.size == stat.st_size:
+                files[path] = known
+                continue
+            state = FileState(mtime=stat.st_mtime, size=stat.st_size, hash=file_hash(path))
+            if known is not None and known.hash == state.hash:
+                # Touched, but the content is the same
+                state.doc_ids = known.doc_ids
+            else:
+                changed.append(path)
+            files[path] = state
+        removed = [path for path in self.files if path not in files]
+        return ManifestDiff(changed=changed, removed=removed, files=files)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -3,21 +3,37 @@ from typing import Any, Optional
 
 from llama_index.core.base.base_query_engine import BaseQueryEngine
 from llama_index.core.indices.base import BaseIndex
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.tools.query_engine import QueryEngineTool
 
-def create_query_engine(index: BaseIndex, **kwargs: Any) -> BaseQueryEngine:
+from src.cache import CachedRetriever, QueryCache, get_query_cache
+
+def create_query_engine(
+    index: BaseIndex, cache: Optional[QueryCache] = None, **kwargs: Any
+) -> BaseQueryEngine:
     """
     Create a query engine for the given index.
 
     Args:
         index: The index to create a query engine for.
+        cache (optional): Cache of the query embeddings and retrieved nodes, defaults to the
+            cache of the process (disabled with QUERY_CACHE_SIZE=0).
         params (optional): Additional parameters for the query engine, e.g: similarity_top_k
     """
     top_k = int(os.getenv("TOP_K", 0))
     if top_k != 0 and kwargs.get("filters") is None:
         kwargs["similarity_top_k"] = top_k
 
-    return index.as_query_engine(**kwargs)
+    cache = cache or get_query_cache()
+    if cache is None:
+        return index.as_query_engine(**kwargs)
+    filters = kwargs.get("filters")
+    params = (
+        kwargs.get("similarity_top_k"),
+        filters.model_dump_json() if filters is not None else None,
+    )
+    retriever = CachedRetriever(index.as_retriever(**kwargs), index, cache, params=params)
+    return RetrieverQueryEngine.from_args(retriever, **kwargs)
 
 
 def get_query_engine_tool(
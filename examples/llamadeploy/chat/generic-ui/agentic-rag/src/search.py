@@ -0,0 +1,188 @@
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+# Rows scored at once, bounds the memory of the score matrix for large indexes
+BLOCK_SIZE = 65536
+
+
+def normalize(vectors: ArrayLike) -> np.ndarray:
+    """L2-normalize the rows of a float32 matrix, so a dot product is the cosine similarity"""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    return matrix
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """The columns of the k highest scores of each row, highest first"""
+    n = scores.shape[1]
+    if k < n:
+        # Only the k highest scores are sorted: O(n + k log k) instead of O(n log n)
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, columns, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(columns, order, axis=1)
+
+
+class ExactSearch:
+    """
+    Brute-force cosine similarity search over a matrix of normalized embeddings,
+    which can be memory-mapped. Scoring is a matrix product over blocks of rows,
+    so a batch of queries reads the embeddings once.
+    """
+
+    def __init__(self, embeddings: np.ndarray, block_size: int = BLOCK_SIZE):
+        self.embeddings = embeddings
+        self.block_size = block_size
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def search(
+        self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        The rows and scores of the k most similar embeddings of each normalized query.
+        Rows where `mask` is False are skipped, so a query can return less than k rows.
+        """
+        if not len(self) or k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))] * len(queries)
+        rows, scores = [], []
+        for start in range(0, len(self), self.block_size):
+            block_scores = queries @ self.embeddings[start : start + self.block_size].T
+            if mask is not None:
+                block_scores[:, ~mask[start : start + self.block_size]] = -np.inf
+            columns = top_k(block_scores, k)
+            rows.append(columns + start)
+            scores.append(np.take_along_axis(block_scores, columns, axis=1))
+        return select(np.hstack(rows), np.hstack(scores), k)
+
+
+def select(rows: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Merge the candidates of each query to its k best rows, without the masked ones"""
+    columns = top_k(scores, k)
+    rows = np.take_along_axis(rows, columns, axis=1)
+    scores = np.take_along_axis(scores, columns, axis=1)
+    results = []
+    for query_rows, query_scores in zip(rows, scores):
+        found = np.isfinite(query_scores)
+        results.append((query_rows[found], query_scores[found]))
+    return results
+
+
+class IVFSearch:
+    """
+    Approximate search with an inverted file index: the embeddings are clustered with k-means
+    and a query only scores the rows of the `nprobe` clusters with the most similar centroids.
+    A higher `nprobe` has a higher recall and a higher latency, with `nprobe` equal to the
+    number of clusters the results are exact. Masked queries use exact search, since a mask
+    can exclude most rows of the probed clusters.
+    """
+
+    CENTROIDS_FILE = "ivf_centroids.npy"
+    ROWS_FILE = "ivf_rows.npy"
+    BOUNDS_FILE = "ivf_bounds.npy"
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        centroids: np.ndarray,
+        rows: np.ndarray,
+        bounds: np.ndarray,
+        nprobe: int = 8,
+    ):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        # The rows of cluster c are rows[bounds[c]:bounds[c + 1]], sorted
+        self.rows = rows
+        self.bounds = bounds
+        self.nprobe = nprobe
+        self.exact = ExactSearch(embeddings)
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    @classmethod
+    def build(
+        cls, embeddings: np.ndarray, lists: Optional[int] = None, iterations: int = 10, seed: int = 0
+    ) -> "IVFSearch":
+        """Cluster the embeddings, by default into 4 * sqrt(n) lists"""
+        count = len(embeddings)
+        lists = max(1, min(lists or int(4 * np.sqrt(count)), count))
+        centroids = train_centroids(embeddings, lists, iterations, seed)
+        clusters = assign(embeddings, centroids)
+        rows = np.argsort(clusters, kind="stable")
+        bounds = np.searchsorted(clusters[rows], np.arange(lists + 1))
+        return cls(embeddings, centroids, rows, bounds)
+
+    def save(self, directory: str) -> None:
+        # The centroids are written last, they mark a complete index
+        for name, array in (
+            (self.ROWS_FILE, self.rows),
+            (self.BOUNDS_FILE, self.bounds),
+            (self.CENTROIDS_FILE, self.centroids),
+        ):
+            np.save(os.path.join(directory, name), array)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, cls.CENTROIDS_FILE))
+
+    @classmethod
+    def load(cls, directory: str, embeddings: np.ndarray, nprobe: int = 8) -> "IVFSearch":
+        return cls(
+            embeddings,
+            np.load(os.path.join(directory, cls.CENTROIDS_FILE)),
+            np.load(os.path.join(directory, cls.ROWS_FILE), mmap_mode="r"),
+            np.load(os.path.join(directory, cls.BOUNDS_FILE)),
+            nprobe=nprobe,
+        )
+
+    def search(
+        self, queries: np.ndarray, k: int, mask: Optional[np.ndarray] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if mask is not None or self.nprobe >= len(self.centroids):
+            return self.exact.search(queries, k, mask)
+        probes = top_k(queries @ self.centroids.T, self.nprobe)
+        results = []
+        for query, clusters in zip(queries, probes):
+            rows = np.sort(np.concatenate([self.rows[self.bounds[c] : self.bounds[c + 1]] for c in clusters]))
+            if not len(rows) or k <= 0:
+                results.append((rows, np.empty(0, dtype=np.float32)))
+                continue
+            scores = self.embeddings[rows] @ query
+            columns = top_k(scores[None, :], min(k, len(rows)))[0]
+            results.append((rows[columns], scores[columns]))
+        return results
+
+
+def train_centroids(embeddings: np.ndarray, lists: int, iterations: int, seed: int) -> np.ndarray:
+    """Spherical k-means on a sample of the normalized embeddings"""
+    rng = np.random.default_rng(seed)
+    # 64 points per cluster are enough to place the centroids
+    size = min(len(embeddings), lists * 64)
+    sample = np.asarray(embeddings[np.sort(rng.choice(len(embeddings), size, replace=False))])
+    centroids = sample[rng.choice(size, lists, replace=False)].copy()
+    for _ in range(iterations):
+        clusters = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, clusters, sample)
+        counts = np.bincount(clusters, minlength=lists)
+        # Restart empty clusters at random points
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(size, int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign(embeddings: np.ndarray, centroids: np.ndarray, block_size: int = BLOCK_SIZE) -> np.ndarray:
+    """The cluster of the most similar centroid of each embedding"""
+    clusters = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), block_size):
+        block = embeddings[start : start + block_size]
+        clusters[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return clusters
@@ -1,14 +1,24 @@
 import os
 
 from llama_index.core import Settings
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
 
 
 def init_settings():
-    if os.getenv("OPENAI_API_KEY") is None:
+    # Imported on first use, the OpenAI packages take about half a second to import
+    from llama_index.llms.openai import OpenAI
+
+    # Set EMBEDDING_MODEL=mock to test the ingestion locally without calling OpenAI
+    use_mock_embedding = os.getenv("EMBEDDING_MODEL") == "mock"
+    if os.getenv("OPENAI_API_KEY") is None and not use_mock_embedding:
         raise RuntimeError("OPENAI_API_KEY is missing in environment variables")
     Settings.llm = OpenAI(model=os.getenv("MODEL") or "gpt-4.1")
-    Settings.embed_model = OpenAIEmbedding(
-        model=os.getenv("EMBEDDING_MODEL") or "text-embedding-3-large"
-    )
+    if use_mock_embedding:
+        from llama_index.core.embeddings import MockEmbedding
+
+        Settings.embed_model = MockEmbedding(embed_dim=int(os.getenv("EMBEDDING_DIM", 1536)))
+    else:
+        from llama_index.embeddings.openai import OpenAIEmbedding
+
+        Settings.embed_model = OpenAIEmbedding(
+            model=os.getenv("EMBEDDING_MODEL") or "text-embedding-3-large"
+        )
@@ -0,0 +1,134 @@
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("uvicorn")
+
+
+@dataclass
+class ImportTime:
+    module: str
+    # Seconds to execute the module, without (self) and with (cumulative) the modules it imports
+    self_time: float
+    cumulative: float
+    depth: int
+
+
+class _TimedLoader:
+    """Delegates to the loader of a module and times its execution"""
+
+    def __init__(self, loader: Any, profiler: "ImportProfiler") -> None:
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+    def create_module(self, spec: Any) -> Any:
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: Any) -> None:
+        stack = self._profiler._stack()
+        # The time of the imported modules is added to the last item
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            self._profiler.imports.append(
+                ImportTime(module.__name__, cumulative - children, cumulative, len(stack))
+            )
+            # Don't leave the wrapper in the module
+            module.__loader__ = self._loader
+            if getattr(module, "__spec__", None) is not None and module.__spec__.loader is self:
+                module.__spec__.loader = self._loader
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """
+    Measure the import time of each module imported while the profiler runs, like
+    `python -X importtime`, but it can be started in a running process, e.g. the LlamaDeploy
+    apiserver importing the workflow module.
+
+    Usage:
+        profiler = ImportProfiler().start()
+        import ...
+        profiler.stop()
+        profiler.log_report()
+    """
+
+    def __init__(self) -> None:
+        self.imports: List[ImportTime] = []
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> Optional["ImportProfiler"]:
+        """A started profiler if STARTUP_PROFILE is true, otherwise None"""
+        if os.getenv("STARTUP_PROFILE", "false").lower() != "true":
+            return None
+        return cls().start()
+
+    def start(self) -> "ImportProfiler":
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+        return self
+
+    def stop(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def _stack(self) -> List[float]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def find_spec(self, fullname: str, path: Any, target: Any = None) -> Any:
+        # Find the module with the other finders, then wrap its loader to time it
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    @property
+    def total(self) -> float:
+        """Seconds spent importing, counting each top-level import once"""
+        return sum(item.cumulative for item in self.imports if item.depth == 0)
+
+    def slowest(self, top: int = 25) -> List[ImportTime]:
+        return sorted(self.imports, key=lambda item: item.self_time, reverse=True)[:top]
+
+    def by_package(self) -> Dict[str, float]:
+        """The self time of the modules summed by top-level package, slowest first"""
+        times: Dict[str, float] = {}
+        for item in self.imports:
+            package = item.module.partition(".")[0]
+            times[package] = times.get(package, 0.0) + item.self_time
+        return dict(sorted(times.items(), key=lambda entry: entry[1], reverse=True))
+
+    def report(self, top: int = 25) -> str:
+        lines = [f"Imported {len(self.imports)} modules in {self.total:.2f}s", "Slowest packages:"]
+        for package, seconds in list(self.by_package().items())[:top]:
+            lines.append(f"{seconds * 1000:>8.0f}ms  {package}")
+        lines.append(f"Slowest modules:\n{'self':>10} {'cumulative':>11}  module")
+        for item in self.slowest(top):
+            lines.append(f"{item.self_time * 1000:>8.0f}ms {item.cumulative * 1000:>9.0f}ms  {item.module}")
+        return "\n".join(lines)
+
+    def log_report(self, top: int = 25) -> None:
+        logger.info(self.report(top))
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import mmap
+import os
+import shutil
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.vector_stores.simple import _build_metadata_filter_fn
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+from src.search import ExactSearch, IVFSearch, normalize
+
+EMBEDDINGS_FILE = "embeddings.npy"
+NODES_FILE = "nodes.jsonl"
+OFFSETS_FILE = "offsets.npy"
+# Written last, so a directory with this file is complete
+INFO_FILE = "info.json"
+
+
+def write_mmap_store(
+    nodes: Iterable[Tuple[BaseNode, List[float]]],
+    persist_dir: str,
+    ivf: bool = False,
+    ivf_lists: Optional[int] = None,
+) -> int:
+    """
+    Write nodes and their embeddings in the format of `MmapVectorStore`:
+
+    - embeddings.npy: the normalized embeddings as a float32 matrix, one row per node
+    - nodes.jsonl: the nodes without embeddings, one JSON line per node
+    - offsets.npy: the byte offset of each line in nodes.jsonl, plus the size of the file
+    - ivf_*.npy: if `ivf` is set, the clusters of an `IVFSearch` index with `ivf_lists` lists
+
+    The files are written to a temporary directory that replaces `persist_dir` when complete,
+    processes that have the previous files mapped keep using them. Returns the number of nodes.
+    """
+    tmp_dir = persist_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    embeddings: List[List[float]] = []
+    offsets = [0]
+    with open(os.path.join(tmp_dir, NODES_FILE), "wb") as f:
+        for node, embedding in nodes:
+            node = node.model_copy()
+            node.embedding = None
+            line = json.dumps(doc_to_json(node)).encode() + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+            embeddings.append(embedding)
+
+    matrix = normalize(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+    np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), matrix)
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    if ivf and len(matrix):
+        IVFSearch.build(matrix, ivf_lists).save(tmp_dir)
+    with open(os.path.join(tmp_dir, INFO_FILE), "w") as f:
+        json.dump({"count": len(embeddings), "dim": matrix.shape[1], "version": uuid.uuid4().hex}, f)
+
+    shutil.rmtree(persist_dir, ignore_errors=True)
+    os.replace(tmp_dir, persist_dir)
+    return len(embeddings)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    A read-only vector store of memory-mapped files written by `write_mmap_store`.
+
+    Loading only maps the files: the embeddings are read by the first queries and the nodes
+    are parsed when they're retrieved. The pages are shared through the OS page cache,
+    so worker processes serving the same index don't each keep a copy in memory.
+    Similarity is the cosine similarity, like for the default `SimpleVectorStore`.
+
+    Queries are scored with a matrix product (see `ExactSearch`) and concurrent async queries,
+    e.g. of an agent calling several tools at once, are run as one batch.
+    Metadata filters and node ids are supported, the metadata of all nodes is parsed by the
+    first filtered query.
+
+    Args:
+        persist_dir: The directory written by `write_mmap_store`.
+        nprobe: Search the IVF index of the directory, scoring the rows of this many clusters
+            per query instead of all rows (see `IVFSearch`).
+    """
+
+    stores_text: bool = True
+    persist_dir: str
+    nprobe: Optional[int] = None
+
+    _embeddings: np.ndarray = PrivateAttr()
+    _offsets: np.ndarray = PrivateAttr()
+    _nodes: mmap.mmap = PrivateAttr()
+    _version: str = PrivateAttr()
+    _search: Union[ExactSearch, IVFSearch] = PrivateAttr()
+    _ids: Optional[Dict[str, int]] = PrivateAttr(default=None)
+    _metadata: Optional[List[dict]] = PrivateAttr(default=None)
+    _pending: Dict[asyncio.AbstractEventLoop, list] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, persist_dir: str, nprobe: Optional[int] = None, **kwargs: Any) -> None:
+        super().__init__(persist_dir=persist_dir, nprobe=nprobe, **kwargs)
+        with open(os.path.join(persist_dir, INFO_FILE)) as f:
+            self._version = json.load(f)["version"]
+        self._embeddings = np.load(os.path.join(persist_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self._offsets = np.load(os.path.join(persist_dir, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(persist_dir, NODES_FILE), "rb") as f:
+            # mmap can't map empty files
+            self._nodes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+        if nprobe is None:
+            self._search = ExactSearch(self._embeddings)
+        elif not IVFSearch.exists(persist_dir):
+            raise ValueError(f"No IVF index in {persist_dir}, run `uv run generate` with VECTOR_INDEX=ivf")
+        else:
+            self._search = IVFSearch.load(persist_dir, self._embeddings, nprobe)
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, INFO_FILE))
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def version(self) -> str:
+        """Changes each time the index is written"""
+        return self._version
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def get_node(self, row: int) -> BaseNode:
+        line = self._nodes[self._offsets[row] : self._offsets[row + 1]]
+        return json_to_doc(json.loads(line))
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        raise NotImplementedError("MmapVectorStore is read-only, run `uv run generate` to update the index")
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        raise NotImplementedError("MmapVectorStore is read-only, run `uv run generate` to update the index")
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return self.query_many([query])[0]
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        # Queries made before the event loop runs the batch are scored together
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if loop not in self._pending:
+            self._pending[loop] = []
+            loop.call_soon(self._run_batch, loop)
+        self._pending[loop].append((query, future))
+        return await future
+
+    def _run_batch(self, loop: asyncio.AbstractEventLoop) -> None:
+        batch = self._pending.pop(loop)
+        try:
+            results = self.query_many([query for query, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def query_many(self, queries: Sequence[VectorStoreQuery]) -> List[VectorStoreQueryResult]:
+        """Run a batch of queries, queries with the same filters are scored together"""
+        results: List[Optional[VectorStoreQueryResult]] = [None] * len(queries)
+        groups: Dict[Any, List[int]] = {}
+        for i, query in enumerate(queries):
+            if query.mode != VectorStoreQueryMode.DEFAULT:
+                raise ValueError(f"MmapVectorStore doesn't support the query mode {query.mode}")
+            if query.query_embedding is None:
+                results[i] = VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+                continue
+            key = (
+                query.filters.model_dump_json() if query.filters else None,
+                tuple(query.node_ids) if query.node_ids else None,
+            )
+            groups.setdefault(key, []).append(i)
+
+        for indices in groups.values():
+            first = queries[indices[0]]
+            mask = self._mask(first.filters, first.node_ids)
+            vectors = normalize([queries[i].query_embedding for i in indices])
+            k = max(queries[i].similarity_top_k for i in indices)
+            for i, (rows, scores) in zip(indices, self._search.search(vectors, k, mask)):
+                top_k = queries[i].similarity_top_k
+                nodes = [self.get_node(int(row)) for row in rows[:top_k]]
+                results[i] = VectorStoreQueryResult(
+                    nodes=nodes,
+                    similarities=[float(score) for score in scores[:top_k]],
+                    ids=[node.node_id for node in nodes],
+                )
+        return results
+
+    def _mask(self, filters: Optional[MetadataFilters], node_ids: Optional[List[str]]) -> Optional[np.ndarray]:
+        """The rows matching the filters and node ids, None if all rows match"""
+        if not node_ids and not (filters and filters.filters):
+            return None
+        ids, metadata = self._load_metadata()
+        mask = np.ones(len(self), dtype=np.bool_)
+        if node_ids:
+            mask[:] = False
+            mask[[ids[node_id] for node_id in node_ids if node_id in ids]] = True
+        if filters and filters.filters:
+            matches = _build_metadata_filter_fn(lambda node_id: metadata[ids[node_id]], filters)
+            # The node ids are in the order of the rows
+            mask &= np.fromiter((matches(node_id) for node_id in ids), dtype=np.bool_, count=len(self))
+        return mask
+
+    def _load_metadata(self) -> Tuple[Dict[str, int], List[dict]]:
+        """The row of each node id and the metadata of each row, read on first use"""
+        if self._ids is None or self._metadata is None:
+            ids: Dict[str, int] = {}
+            metadata: List[dict] = []
+            for row in range(len(self)):
+                data = json.loads(self._nodes[self._offsets[row] : self._offsets[row + 1]])["__data__"]
+                ids[data["id_"]] = row
+                metadata.append(data["metadata"])
+            self._ids, self._metadata = ids, metadata
+        return self._ids, self._metadata
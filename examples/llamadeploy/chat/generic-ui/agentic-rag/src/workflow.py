@@ -1,22 +1,26 @@
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
 
-from llama_index.core.agent.workflow import AgentWorkflow
-from llama_index.core.settings import Settings
+from src.startup import ImportProfiler
 
-from src.index import get_index
-from src.query import get_query_engine_tool
-from src.citation import CITATION_SYSTEM_PROMPT, enable_citation
-from src.settings import init_settings
+if TYPE_CHECKING:
+    from llama_index.core.agent.workflow import AgentWorkflow
 
+# Set STARTUP_PROFILE=true to log the import time of each module loaded by the workflow,
+# the imports below are profiled
+import_profiler = ImportProfiler.from_env()
 
-def create_workflow() -> AgentWorkflow:
-    load_dotenv()
-    init_settings()
-    index = get_index()
-    if index is None:
-        raise RuntimeError(
-            "Index not found! Please run `uv run generate` to index the data first."
-        )
+from llama_index.core.workflow import Workflow  # noqa: E402
+
+from src.query import get_query_engine_tool  # noqa: E402
+from src.citation import CITATION_SYSTEM_PROMPT, CitationWorkflow, enable_citation  # noqa: E402
+from src.resources import registry  # noqa: E402
+
+
+def create_agent() -> "AgentWorkflow":
+    from llama_index.core.agent.workflow import AgentWorkflow
+
+    settings = registry.get("settings")
+    index = registry.get("index")
     # Create a query tool with citations enabled
     query_tool = enable_citation(get_query_engine_tool(index=index))
 
@@ -27,9 +31,24 @@ def create_workflow() -> AgentWorkflow:
 
     return AgentWorkflow.from_tools_or_functions(
         tools_or_functions=[query_tool],
-        llm=Settings.llm,
+        llm=settings.llm,
         system_prompt=system_prompt,
     )
 
 
+registry.register("agent", create_agent)
+
+
+def create_workflow() -> Workflow:
+    # The agent is created by the first run, or before it by WARM_UP (see src/resources.py)
+    # Send the cited sources while the answer is streamed
+    return CitationWorkflow(agent=lambda: registry.get("agent"))
+
+
 workflow = create_workflow()
+# Create the resources listed in WARM_UP before the deployment gets requests
+registry.warm_up_from_env()
+
+if import_profiler is not None:
+    import_profiler.stop()
+    import_profiler.log_report()
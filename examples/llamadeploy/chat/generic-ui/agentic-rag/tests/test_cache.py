@@ -0,0 +1,57 @@
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from src.cache import CachedRetriever, QueryCache, index_version
+
+embed_model = MockEmbedding(embed_dim=8)
+
+
+def create_index(texts):
+    return VectorStoreIndex([TextNode(text=text) for text in texts], embed_model=embed_model)
+
+
+def cached_retriever(index, cache):
+    return CachedRetriever(index.as_retriever(similarity_top_k=10), index, cache, embed_model=embed_model)
+
+
+def retrieve_texts(retriever, query="query"):
+    return sorted(node.node.get_content() for node in retriever.retrieve(query))
+
+
+def test_results_are_cached_per_index():
+    cache = QueryCache()
+    first = cached_retriever(create_index(["a", "b"]), cache)
+    second = cached_retriever(create_index(["c"]), cache)
+
+    assert retrieve_texts(first) == ["a", "b"]
+    assert retrieve_texts(second) == ["c"]
+    assert retrieve_texts(first, "  QUERY ") == ["a", "b"]
+    assert retrieve_texts(second) == ["c"]
+    assert cache.results.hits == 2
+    # The indexes share the query embedding
+    assert cache.embeddings.hits == 1
+
+
+def test_results_are_dropped_when_the_index_is_written():
+    cache = QueryCache()
+    index = create_index(["a", "b"])
+    other = cached_retriever(create_index(["c"]), cache)
+    retriever = cached_retriever(index, cache)
+    assert retrieve_texts(retriever) == ["a", "b"]
+    assert retrieve_texts(other) == ["c"]
+
+    # Replace a node, the number of nodes stays the same
+    version = index_version(index)
+    index.delete_nodes([next(iter(index.index_struct.nodes_dict.values()))], delete_from_docstore=True)
+    deleted = index_version(index)
+    assert deleted != version
+    index.insert_nodes([TextNode(text="d")])
+    assert index_version(index) not in (version, deleted)
+
+    # A retriever created after the write has the same index id
+    assert retrieve_texts(cached_retriever(index, cache)) == ["b", "d"]
+    assert cache.results.hits == 0
+    # The results of the other index are kept
+    assert retrieve_texts(other) == ["c"]
+    assert cache.results.hits == 1
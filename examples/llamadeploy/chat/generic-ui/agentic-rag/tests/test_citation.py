@@ -0,0 +1,197 @@
+import asyncio
+import random
+
+from typing import Any
+
+from llama_index.core import Document, Settings
+from llama_index.core.agent.workflow import AgentStream, ToolCallResult
+from llama_index.core.base.response.schema import Response
+from llama_index.core.chat_ui.events import SourceNodesEvent
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MediaResource, Node, NodeWithScore, TextNode
+from llama_index.core.tools import ToolOutput
+from llama_index.core.workflow import Context, StartEvent, StopEvent, Workflow, step
+
+from src.citation import CitationContextPacker, CitationSynthesizer, CitationWorkflow, StreamingCitationResolver
+
+NODES = [NodeWithScore(node=TextNode(text=f"chunk {i}"), score=1.0) for i in range(5)]
+IDS = [node.node.node_id for node in NODES]
+ANSWER = (
+    f"A [citation:{IDS[2]}] b [citation:{IDS[0]}][citation:{IDS[2]}] c [not a citation] "
+    f"[citation: {IDS[4]} ] [citation:unknown] end ["
+)
+
+
+def test_resolver_returns_each_cited_node_once():
+    resolver = StreamingCitationResolver()
+    resolver.add_nodes(NODES)
+    cited = resolver.feed(ANSWER)
+    assert [node.node.node_id for node in cited] == [IDS[2], IDS[0], IDS[4]]
+
+
+def test_resolver_handles_markers_split_across_deltas():
+    rng = random.Random(0)
+    for _ in range(100):
+        resolver = StreamingCitationResolver()
+        resolver.add_nodes(NODES)
+        cuts = sorted(rng.sample(range(1, len(ANSWER)), rng.randint(0, 40)))
+        deltas = [ANSWER[start:end] for start, end in zip([0] + cuts, cuts + [len(ANSWER)])]
+        cited = [node.node.node_id for delta in deltas for node in resolver.feed(delta)]
+        assert cited == [IDS[2], IDS[0], IDS[4]]
+
+
+class FakeAgent(Workflow):
+    """Calls the query tool once, then streams the answer in small deltas"""
+
+    @step
+    async def run_agent(self, ctx: Context, ev: StartEvent) -> StopEvent:
+        output = ToolOutput(
+            content="response",
+            tool_name="query_index",
+            raw_input={},
+            raw_output=Response("response", source_nodes=NODES),
+        )
+        ctx.write_event_to_stream(
+            ToolCallResult(
+                tool_name="query_index", tool_kwargs={}, tool_id="1", tool_output=output, return_direct=False
+            )
+        )
+        for start in range(0, len(ANSWER), 3):
+            delta = ANSWER[start : start + 3]
+            ctx.write_event_to_stream(
+                AgentStream(delta=delta, response="", current_agent_name="agent", tool_calls=[], raw=delta)
+            )
+        return StopEvent(result="done")
+
+
+async def collect_events(workflow: Workflow) -> list:
+    handler = workflow.run(user_msg="hi", chat_history=[])
+    events = [event async for event in handler.stream_events()]
+    assert await handler == "done"
+    return events
+
+
+def test_workflow_streams_only_cited_nodes():
+    agent = FakeAgent()
+    events = asyncio.run(collect_events(CitationWorkflow(agent=lambda: agent)))
+
+    streamed_ids = []
+    for event in events:
+        if isinstance(event, SourceNodesEvent):
+            streamed_ids += [node.node.node_id for node in event.nodes]
+        elif isinstance(event, ToolCallResult):
+            # The retrieved nodes aren't forwarded, the UI would show them as sources
+            streamed_ids += [node.node.node_id for node in event.tool_output.raw_output.source_nodes]
+    assert streamed_ids == [IDS[2], IDS[0], IDS[4]]
+    assert any(isinstance(event, ToolCallResult) for event in events)
+
+
+class HangingAgent(Workflow):
+    """Streams a delta, then waits until it's cancelled"""
+
+    cancelled = False
+
+    @step
+    async def run_agent(self, ctx: Context, ev: StartEvent) -> StopEvent:
+        ctx.write_event_to_stream(AgentStream(delta="A", response="", current_agent_name="agent", tool_calls=[], raw="A"))
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            HangingAgent.cancelled = True
+            raise
+        return StopEvent(result="done")
+
+
+def test_cancelling_the_workflow_cancels_the_agent():
+    agent = HangingAgent()
+
+    async def scenario():
+        handler = CitationWorkflow(agent=lambda: agent).run(user_msg="hi", chat_history=[])
+        async for event in handler.stream_events():
+            if isinstance(event, AgentStream):
+                break
+        await handler.cancel_run()
+        for _ in range(100):
+            if HangingAgent.cancelled:
+                break
+            await asyncio.sleep(0.01)
+        # Checked before asyncio.run cancels the tasks that are left
+        return HangingAgent.cancelled
+
+    assert asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+
+
+DOCUMENT = " ".join(f"Sentence number {i} is here." for i in range(60))
+
+
+def document_nodes():
+    splitter = SentenceSplitter(chunk_size=64, chunk_overlap=24)
+    nodes = splitter.get_nodes_from_documents([Document(text=DOCUMENT)])
+    return [NodeWithScore(node=node, score=1.0) for node in nodes]
+
+
+def test_packer_removes_the_chunk_overlap():
+    nodes = document_nodes()
+    context = CitationContextPacker(max_tokens=0).pack(nodes + nodes[:2])
+
+    # Without the overlap the chunks are the document, the repeated chunks are dropped
+    assert "".join(node.node.get_content() for node in context.nodes) == DOCUMENT
+    aliases = [node.node.metadata["citation_id"] for node in context.nodes]
+    assert aliases == [str(i) for i in range(1, len(nodes) + 1)]
+    assert context.source_nodes == nodes
+    assert context.aliases == {str(i): node.node.node_id for i, node in enumerate(nodes, 1)}
+
+    # In any order of the scores, no text is in the context twice
+    context = CitationContextPacker(max_tokens=0).pack(nodes[::-1])
+    assert sum(len(node.node.get_content()) for node in context.nodes) == len(DOCUMENT)
+
+
+def test_packer_keeps_nodes_without_character_ranges():
+    other = NodeWithScore(node=Node(text_resource=MediaResource(text="Not a text node.")), score=1.0)
+    nodes = document_nodes()
+    context = CitationContextPacker(max_tokens=0).pack([other, *nodes])
+    assert context.source_nodes == [other, *nodes]
+    assert context.nodes[0].node.get_content() == "Not a text node."
+
+
+def test_packer_keeps_the_token_budget(monkeypatch):
+    monkeypatch.setattr(Settings, "_tokenizer", str.split)
+    nodes = document_nodes()
+    context = CitationContextPacker(max_tokens=100).pack(nodes)
+    sizes = [len(node.node.get_content(metadata_mode="llm").split()) for node in context.nodes]
+    assert 0 < len(context.nodes) < len(nodes)
+    assert sum(sizes) <= 100
+
+
+def test_packed_context_resolves_aliases():
+    context = CitationContextPacker(max_tokens=0).pack(NODES[:2])
+    text = "a [citation:1] b [citation: 2 ] c [citation:3] [citation:1]"
+    resolved = f"a [citation:{IDS[0]}] b [citation:{IDS[1]}] c [citation:3] [citation:{IDS[0]}]"
+    assert context.resolve(text) == resolved
+
+
+class CitingLLM(CustomLLM):
+    """Cites the first citation id of the prompt"""
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata()
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        citation_id = prompt.split("citation_id: ", 1)[1].split()[0]
+        return CompletionResponse(text=f"Fact [citation:{citation_id}]")
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        raise NotImplementedError()
+
+
+def test_synthesizer_answers_with_node_ids():
+    packer = CitationContextPacker(max_tokens=0)
+    synthesizer = CitationSynthesizer(llm=CitingLLM(), mode="accumulate", concurrency=2, packer=packer)
+    response = synthesizer.synthesize("query", NODES)
+    assert [node.node.node_id for node in response.source_nodes] == IDS
+    for node_id in IDS:
+        assert f"[citation:{node_id}]" in response.response
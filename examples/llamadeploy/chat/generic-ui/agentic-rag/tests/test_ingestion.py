@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+from llama_index.core.embeddings import MockEmbedding
+
+from src.ingestion import IngestionConfig, Manifest, file_hash, ingest
+
+
+def write(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def run_ingest(files, checkpoint_dir):
+    config = IngestionConfig(workers=1, files_per_checkpoint=1, checkpoint_dir=str(checkpoint_dir))
+    hashes = {path: file_hash(path) for path in files}
+    return asyncio.run(ingest(hashes, MockEmbedding(embed_dim=8), config))
+
+
+def node_ids_by_file(checkpoint):
+    doc_files = {doc_id: path for path, doc_ids in checkpoint.doc_ids().items() for doc_id in doc_ids}
+    ids = {}
+    for node in checkpoint.load_nodes():
+        ids.setdefault(doc_files[node.ref_doc_id], []).append(node.node_id)
+    return ids
+
+
+def test_ingest_checkpoints_each_file(tmp_path):
+    files = [str(tmp_path / f"doc{i}.txt") for i in range(3)]
+    for i, path in enumerate(files):
+        write(path, f"Document {i}.")
+    checkpoint, failed = run_ingest(files, tmp_path / "checkpoint")
+
+    assert failed == []
+    assert checkpoint.done_files() == set(files)
+    assert set(node_ids_by_file(checkpoint)) == set(files)
+    assert all(node.embedding is not None for node in checkpoint.load_nodes())
+    # One batch per file, with the same nodes
+    batches = list(checkpoint.load_batches())
+    assert len(batches) == len(files)
+    assert [node.node_id for batch in batches for node in batch] == [node.node_id for node in checkpoint.load_nodes()]
+
+
+def test_resume_only_reuses_unchanged_files(tmp_path):
+    kept, modified, deleted = (str(tmp_path / name) for name in ("kept.txt", "modified.txt", "deleted.txt"))
+    for path in (kept, modified, deleted):
+        write(path, f"The content of {os.path.basename(path)}.")
+    # An interrupted run: the checkpoint is left behind
+    checkpoint, _ = run_ingest([kept, modified, deleted], tmp_path / "checkpoint")
+    before = node_ids_by_file(checkpoint)
+
+    write(modified, "New content.")
+    os.remove(deleted)
+    checkpoint, _ = run_ingest([kept, modified], tmp_path / "checkpoint")
+    after = node_ids_by_file(checkpoint)
+
+    assert set(checkpoint.done_files()) == {kept, modified}
+    assert set(after) == {kept, modified}
+    # The unchanged file is resumed, the modified file is parsed again
+    assert after[kept] == before[kept]
+    assert set(after[modified]).isdisjoint(before[modified])
+    texts = [node.get_content() for node in checkpoint.load_nodes()]
+    assert "New content." in texts
+    assert "The content of deleted.txt." not in texts
+
+
+def test_prune_keeps_batch_numbering(tmp_path):
+    first, second = str(tmp_path / "first.txt"), str(tmp_path / "second.txt")
+    write(first, "First.")
+    write(second, "Second.")
+    checkpoint, _ = run_ingest([first, second], tmp_path / "checkpoint")
+
+    assert checkpoint.prune({second: file_hash(second)}) == [first]
+    checkpoint.save({first: {"hash": file_hash(first), "doc_ids": []}}, [])
+    assert checkpoint.done_files() == {first, second}
+
+
+def test_manifest_diff(tmp_path):
+    unchanged, touched, modified, removed = (str(tmp_path / f"{name}.txt") for name in ("a", "b", "c", "d"))
+    for path in (unchanged, touched, modified, removed):
+        write(path, path)
+    manifest = Manifest(Manifest().diff([unchanged, touched, modified, removed]).files)
+
+    os.utime(touched, (0, 0))
+    write(modified, "changed")
+    os.remove(removed)
+    diff = manifest.diff([unchanged, touched, modified])
+
+    assert diff.changed == [modified]
+    assert diff.removed == [removed]
+    assert set(diff.files) == {unchanged, touched, modified}
@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+
+import pytest
+
+from src.resources import ResourceRegistry
+
+
+def counting_factory(calls, name):
+    def factory():
+        calls.append(name)
+        # The number of the call identifies the resource, also across processes
+        return [len(calls)]
+
+    return factory
+
+
+def test_resources_are_created_once():
+    calls = []
+    registry = ResourceRegistry()
+    registry.register("client", counting_factory(calls, "client"))
+    barrier = threading.Barrier(8)
+    resources = []
+
+    def get():
+        barrier.wait()
+        resources.append(registry.get("client"))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["client"]
+    assert all(resource is resources[0] for resource in resources)
+
+    # Registering again replaces the resource
+    registry.register("client", counting_factory(calls, "client"))
+    assert registry.get("client") is not resources[0]
+    assert calls == ["client", "client"]
+
+
+def test_warm_up_from_env(monkeypatch):
+    calls = []
+    registry = ResourceRegistry()
+    for name in ("settings", "index", "agent"):
+        registry.register(name, counting_factory(calls, name))
+
+    monkeypatch.setenv("WARM_UP", "")
+    assert registry.warm_up_from_env() == {}
+    monkeypatch.setenv("WARM_UP", " index, settings ")
+    assert list(registry.warm_up_from_env()) == ["index", "settings"]
+    monkeypatch.setenv("WARM_UP", "all")
+    assert list(registry.warm_up_from_env()) == ["settings", "index", "agent"]
+    assert calls == ["index", "settings", "agent"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs os.fork")
+def test_forked_process_keeps_only_fork_safe_resources():
+    calls = []
+    registry = ResourceRegistry()
+    registry.register("vector_store", counting_factory(calls, "vector_store"), fork_safe=True)
+    registry.register("client", counting_factory(calls, "client"))
+    registry.warm_up()
+    parent = {name: registry.get(name)[0] for name in ("vector_store", "client")}
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        child = {name: registry.get(name)[0] for name in ("vector_store", "client")}
+        os.write(write, json.dumps({"resources": child, "calls": calls}).encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as f:
+        result = json.load(f)
+    os.waitpid(pid, 0)
+
+    assert result["resources"]["vector_store"] == parent["vector_store"]
+    assert result["resources"]["client"] != parent["client"]
+    assert result["calls"] == ["vector_store", "client", "client"]
@@ -0,0 +1,142 @@
+import asyncio
+
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import (
+    ExactMatchFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from src.search import ExactSearch, IVFSearch, normalize
+from src.vector_store import MmapVectorStore, write_mmap_store
+
+
+def random_embeddings(count, dim=16, seed=0):
+    return normalize(np.random.default_rng(seed).standard_normal((count, dim)))
+
+
+def brute_force(embeddings, query, k, mask=None):
+    scores = embeddings @ query
+    rows = [row for row in np.argsort(-scores, kind="stable") if mask is None or mask[row]]
+    return rows[:k]
+
+
+@pytest.mark.parametrize("block_size", [7, 1000])
+@pytest.mark.parametrize("k", [1, 5, 50, 200])
+def test_exact_search_matches_brute_force(block_size, k):
+    embeddings = random_embeddings(100)
+    queries = random_embeddings(3, seed=1)
+    mask = np.arange(100) % 3 != 0
+    search = ExactSearch(embeddings, block_size=block_size)
+
+    for query, (rows, scores) in zip(queries, search.search(queries, k)):
+        assert list(rows) == brute_force(embeddings, query, k)
+        np.testing.assert_allclose(scores, embeddings[rows] @ query, rtol=1e-5, atol=1e-6)
+    for query, (rows, _) in zip(queries, search.search(queries, k, mask)):
+        assert list(rows) == brute_force(embeddings, query, k, mask)
+
+
+def test_exact_search_edge_cases():
+    queries = random_embeddings(2, seed=1)
+    assert all(len(rows) == 0 for rows, _ in ExactSearch(np.empty((0, 16), dtype=np.float32)).search(queries, 3))
+    assert all(len(rows) == 0 for rows, _ in ExactSearch(random_embeddings(10)).search(queries, 0))
+    nothing = np.zeros(10, dtype=bool)
+    assert all(len(rows) == 0 for rows, _ in ExactSearch(random_embeddings(10)).search(queries, 3, nothing))
+
+
+def test_ivf_search(tmp_path):
+    embeddings = random_embeddings(2000)
+    queries = random_embeddings(20, seed=1)
+    index = IVFSearch.build(embeddings, lists=16)
+    assert sorted(index.rows) == list(range(2000))
+    exact = ExactSearch(embeddings).search(queries, 10)
+
+    # Probing all clusters is exact
+    index.nprobe = 16
+    assert all(list(a) == list(b) for (a, _), (b, _) in zip(index.search(queries, 10), exact))
+
+    index.save(str(tmp_path))
+    assert IVFSearch.exists(str(tmp_path))
+    loaded = IVFSearch.load(str(tmp_path), embeddings, nprobe=4)
+    found = sum(len(set(a) & set(b)) for (a, _), (b, _) in zip(loaded.search(queries, 10), exact))
+    assert found / (10 * len(queries)) > 0.5
+
+    # Masked queries fall back to exact search
+    mask = np.arange(2000) % 2 == 0
+    for query, (rows, _) in zip(queries, loaded.search(queries, 10, mask)):
+        assert list(rows) == brute_force(embeddings, query, 10, mask)
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    embeddings = random_embeddings(50)
+    nodes = [TextNode(id_=f"node-{i}", text=f"text {i}", metadata={"group": i % 2}) for i in range(50)]
+    write_mmap_store(zip(nodes, embeddings.tolist()), str(tmp_path), ivf=True, ivf_lists=4)
+    return str(tmp_path), embeddings
+
+
+def test_mmap_vector_store_query(store_dir):
+    persist_dir, embeddings = store_dir
+    store = MmapVectorStore(persist_dir)
+    query = random_embeddings(1, seed=1)[0]
+
+    result = store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=5))
+    assert result.ids == [f"node-{row}" for row in brute_force(embeddings, query, 5)]
+    assert result.nodes[0].get_content() == f"text {brute_force(embeddings, query, 1)[0]}"
+
+    filters = MetadataFilters(filters=[ExactMatchFilter(key="group", value=1)])
+    result = store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=5, filters=filters))
+    assert result.ids == [f"node-{row}" for row in brute_force(embeddings, query, 5, np.arange(50) % 2 == 1)]
+
+    # Probing all clusters of the IVF index is exact
+    ivf = MmapVectorStore(persist_dir, nprobe=4)
+    assert ivf.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=5)).ids == [
+        f"node-{row}" for row in brute_force(embeddings, query, 5)
+    ]
+
+
+def test_mmap_vector_store_batches_async_queries(store_dir, monkeypatch):
+    persist_dir, embeddings = store_dir
+    store = MmapVectorStore(persist_dir)
+    queries = random_embeddings(4, seed=1)
+    batches = []
+    query_many = MmapVectorStore.query_many
+
+    def counted_query_many(self, batch):
+        batches.append(len(batch))
+        return query_many(self, batch)
+
+    monkeypatch.setattr(MmapVectorStore, "query_many", counted_query_many)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(
+                store.aquery(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=k))
+                for k, query in enumerate(queries, 1)
+            )
+        )
+
+    results = asyncio.run(scenario())
+    assert batches == [4]
+    for k, (query, result) in enumerate(zip(queries, results), 1):
+        assert result.ids == [f"node-{row}" for row in brute_force(embeddings, query, k)]
+
+
+def test_mmap_vector_store_batch_errors_are_raised_by_each_query(store_dir, monkeypatch):
+    persist_dir, _ = store_dir
+    store = MmapVectorStore(persist_dir)
+    query = VectorStoreQuery(query_embedding=random_embeddings(1, seed=1)[0].tolist(), similarity_top_k=1)
+
+    def failing_query_many(self, batch):
+        raise RuntimeError("search failed")
+
+    monkeypatch.setattr(MmapVectorStore, "query_many", failing_query_many)
+
+    async def scenario():
+        return await asyncio.gather(store.aquery(query), store.aquery(query), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["search failed", "search failed"]
+    assert all(isinstance(result, RuntimeError) for result in results)